@@ -3,34 +3,54 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_restful import Api
 from flask_cors import CORS
-from extensions import db, jwt
-from resources import UserRegistration, UserLogin, ProductResource, ProductDetailResource, OrderResource, WishlistResource, PaymentResource
-from vendor_resources import VendorRegistration, VendorLogin, VendorProductResource, VendorProductDetailResource
+from extensions import db, jwt, catalog_cache, compressor
+from resources import UserRegistration, UserLogin, ProductResource, ProductDetailResource, ProductSearchResource, OrderResource, WishlistResource, PaymentResource
+from vendor_resources import VendorRegistration, VendorLogin, VendorProductResource, VendorProductDetailResource, VendorProductImportResource, VendorAnalyticsResource
 from mpesa_routes import mpesa_bp
 from contact_routes import contact_bp
-from dotenv import load_dotenv
-import os
+from metrics import metrics_bp
+from search import init_search
+from query_plans import check_query_plans_command
+from dataset import generate_dataset_command
+from sales_rollups import backfill_sales_rollups_command
+from serve import serve, serve_command
+from mpesa_dispatch import stk_dispatcher
+from mpesa_reconciler import payment_reconciler, reconcile_payments_command
+from mpesa_callbacks import callback_processor
+from email_outbox import outbox_sender
+from product_import import product_importer
+from image_store import UploadRequest, add_cache_headers
+from image_variants import variant_cache
+from config import get_config
+from database import init_database
+from instrumentation import request_instrumentation
+from passwords import password_verifier
+from rate_limit import login_throttle
 
-# Load environment variables
-load_dotenv()
-
-def create_app():
+def create_app(config_name=None):
     app = Flask(__name__)
+    # Stream uploaded files to disk while hashing them
+    app.request_class = UploadRequest
     # Enable CORS for all routes with proper credentials support
     CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///ecommerce.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', '073cfa0a88a0d16ca567abbec011ef95523c1b24531b1dc7d108acb9a509bc0c')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
+    app.config.from_object(get_config(config_name))
 
     db.init_app(app)
+    init_database(app)
     Migrate(app, db)
     jwt.init_app(app)
+    # Registered before compression so the timings include it
+    request_instrumentation.init_app(app)
+    compressor.init_app(app)
 
     # Register the M-Pesa blueprint
     app.register_blueprint(mpesa_bp)
     app.register_blueprint(contact_bp)
+    if app.config['METRICS_ENABLED']:
+        app.register_blueprint(metrics_bp)
+    app.after_request(add_cache_headers)
+    variant_cache.init_app(app)
 
     api = Api(app)
 
@@ -39,6 +59,7 @@ def create_app():
     api.add_resource(UserLogin, '/login')
     api.add_resource(ProductResource, '/products')
     api.add_resource(ProductDetailResource, '/products/<int:product_id>')
+    api.add_resource(ProductSearchResource, '/products/search')
     api.add_resource(OrderResource, '/orders')
     api.add_resource(WishlistResource, '/wishlist', '/wishlist/<int:wishlist_id>')
     api.add_resource(PaymentResource, '/payments', '/payments/<int:order_id>')
@@ -48,13 +69,42 @@ def create_app():
     api.add_resource(VendorLogin, '/vendor/login')
     api.add_resource(VendorProductResource, '/vendor/products')
     api.add_resource(VendorProductDetailResource, '/vendor/products/<int:product_id>')
+    api.add_resource(VendorProductImportResource, '/vendor/products/import', '/vendor/products/import/<int:import_id>')
+    api.add_resource(VendorAnalyticsResource, '/vendor/analytics')
 
     with app.app_context():
         db.create_all()
 
+    init_search(app)
+    catalog_cache.init_app(app)
+    stk_dispatcher.init_app(app)
+    payment_reconciler.init_app(app)
+    callback_processor.init_app(app)
+    outbox_sender.init_app(app)
+    password_verifier.init_app(app)
+    login_throttle.init_app(app)
+    product_importer.init_app(app)
+
+    # Background threads start in the process that serves requests: on its
+    # first request, or right after the fork in serve.py workers. The
+    # preforking master never runs them, so no lock is held when it forks.
+    app.extensions['background_services'] = [payment_reconciler, callback_processor, outbox_sender, product_importer]
+
+    @app.before_request
+    def start_background_services():
+        # Each service's start() returns at once once it runs in this process
+        for service in app.extensions['background_services']:
+            service.start()
+
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(generate_dataset_command)
+    app.cli.add_command(backfill_sales_rollups_command)
+    app.cli.add_command(reconcile_payments_command)
+    app.cli.add_command(serve_command)
+
     return app
 
 if __name__ == '__main__':
-    app = create_app()
-    app.run(debug=True)
+    # Same as `flask serve`; use `flask run` for the development server
+    serve(create_app())
 
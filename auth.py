@@ -0,0 +1,75 @@
+import math
+import logging
+from flask import request
+from extensions import db
+from passwords import password_verifier, needs_rehash, VerifierBusy
+from rate_limit import login_throttle
+
+logger = logging.getLogger(__name__)
+
+
+class LoginRejected(Exception):
+    """Raised when a login is turned away before its password is checked"""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    def response(self):
+        return {'message': str(self)}, self.status, {'Retry-After': str(math.ceil(self.retry_after))}
+
+
+def authenticate(model, username, password):
+    """
+    Look up an account and check its password.
+
+    The client IP and the account are rate limited before anything else
+    happens. The password is checked on the bounded verifier pool, with the
+    database connection handed back while the hash runs. A hash made with an
+    outdated method or cost is replaced with the configured one after a
+    successful check.
+
+    Args:
+        model: User or Vendor
+        username (str): Submitted username
+        password (str): Submitted password
+
+    Returns:
+        The account if the credentials are valid, else None
+
+    Raises:
+        LoginRejected: 429 when throttled, 503 when the verifier pool is saturated
+    """
+    retry_after = login_throttle.check(request.remote_addr or 'unknown', f'{model.__tablename__}:{username}')
+    if retry_after:
+        raise LoginRejected('Too many login attempts. Try again later.', 429, retry_after)
+
+    account = model.query.filter_by(username=username).first()
+    if account is None or not account.password_hash:
+        return None
+    password_hash = account.password_hash
+    # Detach the account, keeping its loaded columns, and return the
+    # connection to the pool while the hash runs
+    db.session.expunge(account)
+    db.session.rollback()
+
+    try:
+        valid = password_verifier.verify(password_hash, password)
+    except VerifierBusy as e:
+        raise LoginRejected(f'Login is busy, try again shortly ({str(e).lower()})', 503, 1)
+    if not valid:
+        return None
+
+    if needs_rehash(password_hash):
+        account_id = account.id
+        db.session.add(account)
+        account.set_password(password)
+        try:
+            db.session.commit()
+            logger.info(f"Upgraded password hash of {model.__tablename__} {account_id}")
+        except Exception as e:
+            # The login still succeeds; the upgrade is retried next time
+            db.session.rollback()
+            logger.warning(f"Could not upgrade password hash of {model.__tablename__} {account_id}: {str(e)}")
+    return account
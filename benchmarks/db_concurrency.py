@@ -0,0 +1,131 @@
+"""
+Reader/writer throughput of a SQLite file database, before and after tuning.
+
+Runs reader threads paging through products alongside writer threads doing
+checkout-style transactions (decrement stock, insert an order) against a
+fresh database file, once with SQLAlchemy's defaults, as the app used to
+connect, and once with the pool options and pragmas from config.Config.
+
+Usage, from the repository root:
+
+    python -m benchmarks.db_concurrency [--seconds 5] [--readers 8] [--writers 4]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import create_engine, select, update, insert
+from sqlalchemy.exc import OperationalError
+from config import Config, engine_options
+from database import configure_sqlite_engine
+from extensions import db
+from models import Product, Order
+
+
+def create_database(path, tuned, rows):
+    url = f'sqlite:///{path}'
+    if tuned:
+        config = Config()
+        engine = create_engine(url, **engine_options(url, config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW,
+                                                     config.DB_POOL_RECYCLE, config.DB_POOL_TIMEOUT))
+        configure_sqlite_engine(engine, config.SQLITE_PRAGMAS)
+    else:
+        engine = create_engine(url)
+    db.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        connection.execute(insert(Product), [
+            {'name': f'Product {i}', 'description': 'Benchmark product', 'price': 100, 'stock': 10 ** 6,
+             'vendor_id': 1, 'created_at': now, 'updated_at': now}
+            for i in range(rows)
+        ])
+    return engine
+
+
+def reader(engine, rows, deadline, stats):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            with engine.connect() as connection:
+                connection.execute(
+                    select(Product.id, Product.name, Product.price, Product.stock)
+                    .where(Product.id > random.randrange(rows)).order_by(Product.id).limit(50)
+                ).all()
+            stats.record('reads', time.monotonic() - started)
+        except OperationalError:
+            stats.record('read_errors')
+
+
+def writer(engine, rows, deadline, stats):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            with engine.begin() as connection:
+                product_id = random.randrange(1, rows + 1)
+                connection.execute(
+                    update(Product).where(Product.id == product_id, Product.stock > 0)
+                    .values(stock=Product.stock - 1)
+                )
+                connection.execute(insert(Order).values(user_id=1, total=100, status='pending'))
+            stats.record('writes', time.monotonic() - started)
+        except OperationalError:
+            # 'database is locked' once the busy timeout runs out
+            stats.record('write_errors')
+
+
+class Stats:
+    def __init__(self):
+        self.counts = {'reads': 0, 'writes': 0, 'read_errors': 0, 'write_errors': 0}
+        self.latencies = {'reads': [], 'writes': []}
+        self._lock = threading.Lock()
+
+    def record(self, kind, latency=None):
+        with self._lock:
+            self.counts[kind] += 1
+            if latency is not None:
+                self.latencies[kind].append(latency)
+
+    def p99(self, kind):
+        latencies = sorted(self.latencies[kind])
+        return latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+
+
+def run(tuned, args):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_database(os.path.join(directory, 'bench.db'), tuned, args.rows)
+        stats = Stats()
+        deadline = time.monotonic() + args.seconds
+        threads = [threading.Thread(target=reader, args=(engine, args.rows, deadline, stats))
+                   for _ in range(args.readers)]
+        threads += [threading.Thread(target=writer, args=(engine, args.rows, deadline, stats))
+                    for _ in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"{'profile':>8}  {'reads/s':>8}  {'read p99 ms':>11}  {'writes/s':>8}  "
+          f"{'write p99 ms':>12}  {'lock errors':>11}")
+    for name, tuned in (('default', False), ('tuned', True)):
+        stats = run(tuned, args)
+        errors = stats.counts['read_errors'] + stats.counts['write_errors']
+        print(f"{name:>8}  {stats.counts['reads'] / args.seconds:>8.0f}  {stats.p99('reads'):>11.1f}  "
+              f"{stats.counts['writes'] / args.seconds:>8.0f}  {stats.p99('writes'):>12.1f}  {errors:>11}")
+
+
+if __name__ == '__main__':
+    main()
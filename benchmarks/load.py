@@ -0,0 +1,414 @@
+"""
+End-to-end load benchmark for the REST API.
+
+Starts create_app() on a seeded scratch database behind a threaded HTTP
+server (or targets --url), then drives it with concurrent virtual users
+until --duration runs out:
+
+- shoppers register and log in, then browse and search the catalog, view
+  products, keep a wishlist, check out through /orders, pay through
+  /payments with M-Pesa in simulated mode, look up their orders and
+  payments and send the contact form; a share of STK callbacks is posted
+  to /mpesa/callback as Safaricom would
+- vendors register and log in, then list, create (with an image upload),
+  update and delete their products
+
+Throughput and p50/p95/p99 latency are reported per endpoint. --save writes
+the results as a JSON baseline, and --compare reports the change against
+one, exiting with status 1 if an endpoint regressed by more than
+--tolerance.
+
+Usage, from the repository root:
+
+    python -m benchmarks.load --duration 30 --save baseline.json
+    python -m benchmarks.load --duration 30 --compare baseline.json
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+import requests
+
+SHOPPER_ACTIONS = [
+    ('browse', 35),
+    ('product_detail', 15),
+    ('search', 10),
+    ('wishlist', 8),
+    ('checkout', 12),
+    ('orders', 6),
+    ('payment_status', 4),
+    ('mpesa_callback', 3),
+    ('contact', 2),
+]
+
+VENDOR_ACTIONS = [
+    ('vendor_list', 40),
+    ('vendor_create', 20),
+    ('vendor_update', 25),
+    ('vendor_delete', 15),
+]
+
+SEARCH_TERMS = ['shoe', 'jacket', 'phone', 'kit', 'denim', 'product', 'black', 'wireless']
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, latency, status):
+        with self._lock:
+            self.latencies[endpoint].append(latency)
+            self.statuses[endpoint][status] += 1
+
+    def summary(self, duration):
+        results = {}
+        for endpoint in sorted(self.latencies):
+            latencies = sorted(self.latencies[endpoint])
+            statuses = self.statuses[endpoint]
+            results[endpoint] = {
+                'requests': len(latencies),
+                'throughput': round(len(latencies) / duration, 2),
+                'errors': sum(count for status, count in statuses.items() if status == 0 or status >= 500),
+                'statuses': {str(status): count for status, count in sorted(statuses.items())},
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            }
+        return results
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class VirtualUser:
+    """One client session issuing weighted actions against the API"""
+
+    def __init__(self, base_url, recorder, rng, product_count, image):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = rng
+        self.product_count = product_count
+        self.image = image
+        self.session = requests.Session()
+        self.headers = {'Accept-Encoding': 'gzip, br'}
+        self.name = f'load_{uuid.uuid4().hex[:12]}'
+
+    def request(self, endpoint, method, path, **kwargs):
+        headers = dict(self.headers, **kwargs.pop('headers', {}))
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, headers=headers, timeout=60, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, 0
+        self.recorder.record(endpoint, time.perf_counter() - started, status)
+        return response
+
+    def json(self, response):
+        try:
+            return response.json() if response is not None else {}
+        except ValueError:
+            return {}
+
+    def run(self, actions, deadline):
+        names = [name for name, _ in actions]
+        weights = [weight for _, weight in actions]
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(names, weights)[0])()
+
+    def random_product_id(self):
+        # Skewed towards a small set of hot products, like real traffic
+        return min(self.product_count, int(self.rng.paretovariate(1.2))) if self.rng.random() < 0.8 \
+            else self.rng.randint(1, self.product_count)
+
+
+class Shopper(VirtualUser):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.cursor = None
+        self.order_ids = []
+
+    def login(self):
+        self.request('POST /register', 'POST', '/register',
+                     json={'username': self.name, 'email': f'{self.name}@example.com', 'password': 'load-test'})
+        body = self.json(self.request('POST /login', 'POST', '/login',
+                                      json={'username': self.name, 'password': 'load-test'}))
+        self.headers['Authorization'] = f"Bearer {body.get('access_token')}"
+
+    def browse(self):
+        params = {'limit': 24}
+        if self.cursor and self.rng.random() < 0.5:
+            params['cursor'] = self.cursor
+        self.cursor = self.json(self.request('GET /products', 'GET', '/products', params=params)).get('next_cursor')
+
+    def product_detail(self):
+        self.request('GET /products/<id>', 'GET', f'/products/{self.random_product_id()}')
+
+    def search(self):
+        self.request('GET /products/search', 'GET', '/products/search', params={'q': self.rng.choice(SEARCH_TERMS)})
+
+    def wishlist(self):
+        if self.rng.random() < 0.5:
+            self.request('POST /wishlist', 'POST', '/wishlist', json={'product_id': self.random_product_id()})
+        else:
+            self.request('GET /wishlist', 'GET', '/wishlist')
+
+    def checkout(self):
+        items = [{'product_id': self.random_product_id(), 'quantity': self.rng.randint(1, 3), 'price': 100}
+                 for _ in range(self.rng.randint(1, 4))]
+        body = self.json(self.request('POST /orders', 'POST', '/orders', json={'total': 100, 'items': items}))
+        order_id = body.get('order_id')
+        if order_id is None:
+            return
+        self.order_ids.append(order_id)
+        self.request('POST /payments', 'POST', '/payments', json={
+            'order_id': order_id, 'amount': 100, 'payment_method': 'mpesa', 'phone_number': '254700000000'
+        })
+
+    def orders(self):
+        self.request('GET /orders', 'GET', '/orders')
+
+    def payment_status(self):
+        if self.order_ids:
+            self.request('GET /payments/<order_id>', 'GET', f'/payments/{self.rng.choice(self.order_ids)}')
+
+    def mpesa_callback(self):
+        checkout_request_id = f'ws_CO_{uuid.uuid4().hex[:20]}'
+        self.request('POST /mpesa/callback', 'POST', '/mpesa/callback', json={'Body': {'stkCallback': {
+            'MerchantRequestID': uuid.uuid4().hex, 'CheckoutRequestID': checkout_request_id,
+            'ResultCode': 0, 'ResultDesc': 'The service request is processed successfully.',
+            'CallbackMetadata': {'Item': [{'Name': 'MpesaReceiptNumber', 'Value': uuid.uuid4().hex[:10].upper()}]}
+        }}})
+
+    def contact(self):
+        self.request('POST /contact', 'POST', '/contact', json={
+            'name': self.name, 'email': f'{self.name}@example.com',
+            'subject': 'Load test', 'message': 'Where is my order?'
+        })
+
+
+class Vendor(VirtualUser):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.product_ids = []
+
+    def login(self):
+        self.request('POST /vendor/register', 'POST', '/vendor/register', json={
+            'username': self.name, 'email': f'{self.name}@example.com', 'password': 'load-test',
+            'business_name': f'{self.name} Ltd'
+        })
+        body = self.json(self.request('POST /vendor/login', 'POST', '/vendor/login',
+                                      json={'username': self.name, 'password': 'load-test'}))
+        self.headers['Authorization'] = f"Bearer {body.get('access_token')}"
+
+    def vendor_list(self):
+        self.request('GET /vendor/products', 'GET', '/vendor/products')
+
+    def vendor_create(self):
+        body = self.json(self.request('POST /vendor/products', 'POST', '/vendor/products', data={
+            'name': f'Load product {uuid.uuid4().hex[:8]}', 'description': 'Created by the load benchmark',
+            'price': str(self.rng.randint(100, 5000)), 'stock': str(self.rng.randint(1, 100))
+        }, files={'image': ('product.png', self.image, 'image/png')}))
+        if body.get('product_id'):
+            self.product_ids.append(body['product_id'])
+
+    def vendor_update(self):
+        if self.product_ids:
+            self.request('PUT /vendor/products/<id>', 'PUT', f'/vendor/products/{self.rng.choice(self.product_ids)}',
+                         data={'price': str(self.rng.randint(100, 5000)), 'stock': str(self.rng.randint(1, 100))})
+
+    def vendor_delete(self):
+        if self.product_ids:
+            product_id = self.product_ids.pop(self.rng.randrange(len(self.product_ids)))
+            self.request('DELETE /vendor/products/<id>', 'DELETE', f'/vendor/products/{product_id}')
+
+
+def sample_image():
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (200, 80, 40)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def seed(app, vendors, products):
+    from sqlalchemy import insert
+    from extensions import db
+    from models import Vendor as VendorModel, Product
+    from werkzeug.security import generate_password_hash
+
+    password_hash = generate_password_hash('load-test')
+    now = datetime.utcnow()
+    with app.app_context():
+        db.session.execute(insert(VendorModel), [
+            {'username': f'seed_vendor_{i}', 'email': f'seed_vendor_{i}@example.com', 'password_hash': password_hash,
+             'business_name': f'Seed vendor {i}', 'registration_date': now}
+            for i in range(vendors)
+        ])
+        first_vendor = db.session.execute(db.select(db.func.min(VendorModel.id))).scalar()
+        rng = random.Random(0)
+        for start in range(0, products, 10000):
+            db.session.execute(insert(Product), [
+                {'name': f'{rng.choice(SEARCH_TERMS).title()} product {i}',
+                 'description': f'Seeded {rng.choice(SEARCH_TERMS)} product number {i}',
+                 'price': rng.randint(100, 50000), 'stock': 10 ** 6,
+                 'vendor_id': first_vendor + i % vendors, 'created_at': now, 'updated_at': now}
+                for i in range(start, min(start + 10000, products))
+            ])
+        db.session.commit()
+        return db.session.execute(db.select(db.func.max(Product.id))).scalar()
+
+
+def start_server(args, directory):
+    # The profile and database are read from the environment when config is imported
+    os.environ['APP_ENV'] = args.profile
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(directory, 'load.db')}"
+    # Simulated M-Pesa, and no real email is sent for /contact
+    os.environ['MPESA_CONSUMER_KEY'] = ''
+    os.environ['MPESA_CONSUMER_SECRET'] = ''
+    os.environ['EMAIL_USER'] = ''
+    os.environ['EMAIL_PASSWORD'] = ''
+
+    import logging
+    logging.disable(logging.WARNING)
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    app = create_app()
+    product_count = seed(app, args.seed_vendors, args.seed_products)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', product_count
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def print_results(results):
+    print(f"{'endpoint':<30} {'reqs':>7} {'req/s':>8} {'err':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, result in results.items():
+        print(f"{endpoint:<30} {result['requests']:>7} {result['throughput']:>8.1f} {result['errors']:>5} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+
+
+def compare(results, baseline, tolerance):
+    """Print the change per endpoint and return the endpoints that regressed"""
+    regressions = []
+    print(f"\n{'endpoint':<30} {'req/s':>16} {'p95 ms':>20} {'p99 ms':>20}")
+    for endpoint, result in results.items():
+        before = baseline['endpoints'].get(endpoint)
+        if before is None:
+            print(f'{endpoint:<30} (not in baseline)')
+            continue
+        changes = []
+        for key in ('throughput', 'p95_ms', 'p99_ms'):
+            change = (result[key] - before[key]) / before[key] if before[key] else 0.0
+            changes.append(f'{before[key]:>7.1f} {change:>+7.0%}')
+        print(f'{endpoint:<30} {changes[0]:>16} {changes[1]:>20} {changes[2]:>20}')
+        slower = before['p95_ms'] and (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] > tolerance
+        fewer = before['throughput'] and (before['throughput'] - result['throughput']) / before['throughput'] > tolerance
+        if slower or fewer:
+            regressions.append(endpoint)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='Benchmark a running server instead of starting one')
+    parser.add_argument('--product-count', type=int, default=24, help='Highest product id on --url')
+    parser.add_argument('--profile', default='production', help='Config profile for the started app')
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--concurrency', type=int, default=16, help='Number of virtual users')
+    parser.add_argument('--vendor-share', type=float, default=0.15, help='Fraction of users who are vendors')
+    parser.add_argument('--seed-vendors', type=int, default=50)
+    parser.add_argument('--seed-products', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='Write the results to this JSON baseline file')
+    parser.add_argument('--compare', help='Compare the results against this JSON baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed p95/throughput regression')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.url:
+            base_url, product_count = args.url.rstrip('/'), args.product_count
+        else:
+            base_url, product_count = start_server(args, directory)
+
+        recorder = Recorder()
+        image = sample_image()
+        # Uploads land in the app's static/uploads; remove ours afterwards unless it was already there
+        uploaded_image = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'static', 'uploads', f'{hashlib.sha256(image).hexdigest()}.png')
+        keep_image = args.url or os.path.exists(uploaded_image)
+        vendors = max(1, round(args.concurrency * args.vendor_share))
+        users = [
+            (Vendor if i < vendors else Shopper)(base_url, recorder, random.Random(args.seed + i), product_count, image)
+            for i in range(args.concurrency)
+        ]
+        for user in users:
+            user.login()
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        threads = [
+            threading.Thread(target=user.run, args=(VENDOR_ACTIONS if isinstance(user, Vendor) else SHOPPER_ACTIONS,
+                                                    deadline))
+            for user in users
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - started
+        if not keep_image and os.path.exists(uploaded_image):
+            os.remove(uploaded_image)
+
+    results = recorder.summary(duration)
+    print_results(results)
+    total = sum(result['requests'] for result in results.values())
+    print(f'\n{total} requests in {duration:.1f}s: {total / duration:.1f} req/s')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'meta': {
+                    'revision': git_revision(),
+                    'created_at': datetime.utcnow().isoformat(),
+                    'duration': args.duration,
+                    'concurrency': args.concurrency,
+                    'vendor_share': args.vendor_share,
+                    'seed_products': args.seed_products,
+                    'profile': args.profile,
+                },
+                'endpoints': results,
+            }, f, indent=2)
+        print(f'Saved baseline to {args.save}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"\nRegressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
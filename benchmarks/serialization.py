@@ -0,0 +1,104 @@
+"""
+Micro-benchmark of ORM hydration versus column projection for list endpoints.
+
+Fills an in-memory SQLite database with products and times how long it
+takes to turn N rows into the JSON document of the vendor product listing,
+once by loading Product instances and copying their attributes into dicts
+(the old path) and once through serialization.Projection.
+
+Usage, from the repository root:
+
+    python -m benchmarks.serialization [--rows 10000 100000] [--repeat 5]
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import insert
+from extensions import db
+from models import Product
+from serialization import dumps
+from vendor_resources import VENDOR_PRODUCT_PROJECTION
+from image_variants import variant_cache
+
+
+def create_bench_app(rows):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        now = datetime.utcnow()
+        batch = 10000
+        for start in range(0, rows, batch):
+            db.session.execute(insert(Product), [
+                {
+                    'name': f'Product {i}',
+                    'description': f'Description of product {i} with a few more words in it',
+                    'price': 100 + i % 5000,
+                    'stock': i % 50,
+                    'image_url': f'/static/uploads/{i:064x}.png',
+                    'vendor_id': 1,
+                    'created_at': now,
+                    'updated_at': now,
+                } for i in range(start, min(start + batch, rows))
+            ])
+        db.session.commit()
+    return app
+
+
+def orm_path(limit):
+    products = Product.query.filter_by(vendor_id=1).order_by(Product.id).limit(limit).all()
+    return json.dumps({
+        'products': [
+            {
+                'id': p.id,
+                'name': p.name,
+                'description': p.description,
+                'price': p.price,
+                'stock': p.stock,
+                'image_url': p.image_url,
+                'image_variants': variant_cache.variant_urls(p.image_url),
+                'created_at': p.created_at.isoformat() if p.created_at else None
+            } for p in products
+        ]
+    })
+
+
+def projection_path(limit):
+    products = VENDOR_PRODUCT_PROJECTION.all(
+        VENDOR_PRODUCT_PROJECTION.select().where(Product.vendor_id == 1).order_by(Product.id).limit(limit)
+    )
+    return dumps({'products': products})
+
+
+def best_of(function, limit, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(limit)
+        timings.append(time.perf_counter() - started)
+        # Start every run from an empty identity map, like a new request
+        db.session.remove()
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_bench_app(max(args.rows))
+    with app.app_context():
+        assert json.loads(orm_path(10)) == json.loads(projection_path(10))
+        print(f"{'rows':>8}  {'orm ms':>9}  {'projection ms':>13}  {'speedup':>7}")
+        for rows in args.rows:
+            orm = best_of(orm_path, rows, args.repeat)
+            projection = best_of(projection_path, rows, args.repeat)
+            print(f'{rows:>8}  {orm * 1000:>9.1f}  {projection * 1000:>13.1f}  {orm / projection:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, insert, func
+from metrics import counter, gauge
+
+logger = logging.getLogger(__name__)
+
+cache_hits = counter('catalog_cache_hits_total', 'Catalog cache hits', ['kind'])
+cache_misses = counter('catalog_cache_misses_total', 'Catalog cache misses', ['kind'])
+
+# How long stock changes stay in catalog_stock_change for other processes to read
+STOCK_CHANGE_RETENTION = timedelta(hours=1)
+
+
+class CatalogCache:
+    """
+    Read-through cache of serialized catalog documents.
+
+    List pages are keyed by the catalog version, which vendor writes bump,
+    so a write makes every cached page unreachable at once. Per-product
+    documents are evicted individually for the products a write touched.
+
+    Checkouts only change stock, and happen far more often than vendor
+    writes, so they leave the version alone and evict just the product
+    documents and the list pages that contain the products they touched.
+
+    current_version() returns a token that the document is stored under. A
+    document is not stored if the version changed, or one of its products
+    was evicted, while it was being computed.
+
+    With CATALOG_CACHE_SHARED enabled the version also lives in the
+    catalog_version table and stock changes are appended to
+    catalog_stock_change, so writes in one process reach the caches of the
+    other processes. Each process checks both at most once every
+    sync_interval seconds.
+    """
+
+    def __init__(self, max_entries=2048, sync_interval=1.0):
+        self.max_entries = max_entries
+        self.sync_interval = sync_interval
+        self.shared = False
+        self.version = 0
+        self._shared_version = None
+        self._next_sync = 0.0
+        self._last_sync = None
+        self._last_stock_change = None
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()  # (version, key) -> (body, product ids)
+        self._products = OrderedDict()
+        # Stock evictions are numbered; product id -> number of its latest eviction
+        self._eviction = 0
+        self._evicted = OrderedDict()
+        self._evicted_floor = 0
+        gauge('catalog_cache_entries', 'Documents held in the catalog cache',
+              function=lambda: len(self._pages) + len(self._products))
+        gauge('catalog_cache_version', 'Current catalog version',
+              function=lambda: self.version)
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('CATALOG_CACHE_MAX_ENTRIES', self.max_entries)
+        self.sync_interval = app.config.get('CATALOG_CACHE_SYNC_INTERVAL', self.sync_interval)
+        self.shared = app.config.get('CATALOG_CACHE_SHARED', False)
+        if self.shared:
+            with app.app_context():
+                self._ensure_version_row()
+
+    def current_version(self):
+        """Return the token to read under, syncing with other processes if shared"""
+        if self.shared and time.monotonic() >= self._next_sync:
+            self._sync_shared()
+        return self.version, self._eviction
+
+    def get_page(self, key):
+        with self._lock:
+            entry = self._pages.get((self.version, key))
+            if entry is not None:
+                self._pages.move_to_end((self.version, key))
+        body = entry[0] if entry is not None else None
+        self._count('page', body)
+        return body
+
+    def set_page(self, key, body, version, product_ids):
+        """
+        Args:
+            product_ids (iterable): Products listed on the page, so a stock
+                change to any of them evicts it
+        """
+        product_ids = frozenset(product_ids)
+        with self._lock:
+            if not self._is_current(version, product_ids):
+                return
+            self._pages[(self.version, key)] = (body, product_ids)
+            self._evict(self._pages)
+
+    def get_product(self, product_id):
+        with self._lock:
+            body = self._products.get(product_id)
+            if body is not None:
+                self._products.move_to_end(product_id)
+        self._count('product', body)
+        return body
+
+    def set_product(self, product_id, body, version):
+        with self._lock:
+            if not self._is_current(version, (product_id,)):
+                return
+            self._products[product_id] = body
+            self._evict(self._products)
+
+    def invalidate(self, product_ids=None):
+        """
+        Bump the catalog version after a committed catalog write.
+
+        Args:
+            product_ids (iterable, optional): Products whose documents changed.
+                If omitted, every cached product document is dropped.
+        """
+        with self._lock:
+            self.version += 1
+            self._pages.clear()
+            if product_ids is None:
+                self._products.clear()
+            else:
+                for product_id in product_ids:
+                    self._products.pop(product_id, None)
+
+        if self.shared:
+            self._bump_shared_version()
+
+    def invalidate_stock(self, product_ids):
+        """
+        Evict the documents and list pages of products whose stock changed.
+
+        Other list pages and the version are left alone, so checkouts do not
+        empty the page cache.
+        """
+        product_ids = set(product_ids)
+        self._evict_products(product_ids)
+        if self.shared and product_ids:
+            self._record_stock_change(product_ids)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._pages.clear()
+            self._products.clear()
+
+    def _is_current(self, version, product_ids):
+        # Called with the lock held
+        cache_version, eviction = version
+        if cache_version != self.version:
+            return False
+        if eviction == self._eviction:
+            return True
+        if eviction < self._evicted_floor:
+            # Evictions after the token may have been forgotten
+            return False
+        return all(self._evicted.get(product_id, 0) <= eviction for product_id in product_ids)
+
+    def _evict_products(self, product_ids):
+        if not product_ids:
+            return
+        with self._lock:
+            self._eviction += 1
+            for product_id in product_ids:
+                self._products.pop(product_id, None)
+                self._evicted.pop(product_id, None)
+                self._evicted[product_id] = self._eviction
+            while len(self._evicted) > 4 * self.max_entries:
+                _, self._evicted_floor = self._evicted.popitem(last=False)
+            stale = [key for key, (_, listed) in self._pages.items() if not listed.isdisjoint(product_ids)]
+            for key in stale:
+                del self._pages[key]
+
+    def _count(self, kind, body):
+        if body is None:
+            cache_misses.inc(kind=kind)
+        else:
+            cache_hits.inc(kind=kind)
+
+    def _evict(self, entries):
+        # Least recently used entries sit at the front
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def _ensure_version_row(self):
+        from extensions import db
+        from models import CatalogVersion
+        if db.session.get(CatalogVersion, 1) is None:
+            db.session.add(CatalogVersion(id=1, version=0))
+            db.session.commit()
+
+    def _sync_shared(self):
+        from extensions import db
+        from models import CatalogVersion, CatalogStockChange
+        self._next_sync = time.monotonic() + self.sync_interval
+        shared_version = db.session.execute(
+            select(CatalogVersion.version).where(CatalogVersion.id == 1)
+        ).scalar()
+        if shared_version != self._shared_version:
+            if self._shared_version is not None:
+                logger.info(f"Catalog version changed in another process: {self._shared_version} -> {shared_version}")
+                self.clear()
+            self._shared_version = shared_version
+
+        now = time.monotonic()
+        if self._last_stock_change is None or now - self._last_sync > STOCK_CHANGE_RETENTION.total_seconds():
+            # First sync, or changes we have not seen may already be pruned
+            if self._last_stock_change is not None:
+                self.clear()
+            self._last_stock_change = db.session.execute(
+                select(func.coalesce(func.max(CatalogStockChange.id), 0))
+            ).scalar()
+        else:
+            changes = db.session.execute(
+                select(CatalogStockChange.id, CatalogStockChange.product_id)
+                .where(CatalogStockChange.id > self._last_stock_change)
+                .order_by(CatalogStockChange.id)
+            ).all()
+            if changes:
+                self._evict_products({product_id for _, product_id in changes})
+                self._last_stock_change = changes[-1].id
+        self._last_sync = now
+
+    def _record_stock_change(self, product_ids):
+        from extensions import db
+        from models import CatalogStockChange
+        now = datetime.utcnow()
+        try:
+            db.session.execute(insert(CatalogStockChange),
+                               [{'product_id': product_id, 'created_at': now} for product_id in product_ids])
+            db.session.execute(delete(CatalogStockChange)
+                               .where(CatalogStockChange.created_at < now - STOCK_CHANGE_RETENTION))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error recording catalog stock change: {str(e)}")
+
+    def _bump_shared_version(self):
+        from extensions import db
+        from models import CatalogVersion
+        try:
+            db.session.execute(
+                update(CatalogVersion)
+                .where(CatalogVersion.id == 1)
+                .values(version=CatalogVersion.version + 1)
+            )
+            db.session.commit()
+            shared_version = db.session.execute(
+                select(CatalogVersion.version).where(CatalogVersion.id == 1)
+            ).scalar()
+            # Skip the redundant clear on our own bump, but not if another
+            # process bumped the version in between
+            if self._shared_version is not None and shared_version == self._shared_version + 1:
+                self._shared_version = shared_version
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error bumping shared catalog version: {str(e)}")
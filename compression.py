@@ -0,0 +1,159 @@
+import gzip
+import time
+from flask import request, has_request_context
+from metrics import counter
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always offered
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/csv',
+    'image/svg+xml',
+}
+
+compressed_responses = counter('http_compressed_responses_total', 'Responses sent compressed',
+                               ['route', 'encoding', 'precompressed'])
+compression_input_bytes = counter('http_compression_input_bytes_total', 'Response bytes before compression',
+                                  ['route', 'encoding'])
+compression_output_bytes = counter('http_compression_output_bytes_total', 'Response bytes after compression',
+                                   ['route', 'encoding'])
+compression_cpu_seconds = counter('http_compression_cpu_seconds_total', 'CPU time spent compressing responses',
+                                  ['route', 'encoding'])
+
+
+def _route():
+    if not has_request_context():
+        return 'none'
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+class CompressedPayload:
+    """A serialized document kept alongside its compressed encodings"""
+
+    def __init__(self, body, encodings):
+        self.body = body
+        self.encodings = encodings
+
+
+class Compressor:
+    """
+    Negotiated gzip/brotli compression of responses.
+
+    Responses above min_size with a compressible mimetype are compressed in
+    an after_request hook using the best encoding the client accepts. Cached
+    documents can be compressed once, when they are stored, with
+    precompress(); payload_response() then serves the stored bytes without
+    compressing on every hit.
+
+    The ratio per route is http_compression_output_bytes_total divided by
+    http_compression_input_bytes_total.
+    """
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=4,
+                 stored_gzip_level=9, stored_brotli_quality=9):
+        self.enabled = True
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        # Stored documents are compressed once, so they can afford more effort
+        self.stored_gzip_level = stored_gzip_level
+        self.stored_brotli_quality = stored_brotli_quality
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESS_ENABLED', self.enabled)
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.gzip_level = app.config.get('COMPRESS_GZIP_LEVEL', self.gzip_level)
+        self.brotli_quality = app.config.get('COMPRESS_BROTLI_QUALITY', self.brotli_quality)
+        app.after_request(self.compress_response)
+
+    @property
+    def encodings(self):
+        # Listed in order of preference when the client accepts several equally
+        return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def negotiate(self):
+        """Return the encoding to use for the current request, or None"""
+        if not self.enabled:
+            return None
+        accepted = request.accept_encodings
+        best = max(self.encodings, key=lambda encoding: accepted[encoding])
+        return best if accepted[best] > 0 else None
+
+    def compress(self, data, encoding, stored=False):
+        started = time.thread_time()
+        if encoding == 'br':
+            quality = self.stored_brotli_quality if stored else self.brotli_quality
+            compressed = brotli.compress(data, quality=quality)
+        else:
+            level = self.stored_gzip_level if stored else self.gzip_level
+            compressed = gzip.compress(data, compresslevel=level, mtime=0)
+        route = _route()
+        compression_cpu_seconds.inc(time.thread_time() - started, route=route, encoding=encoding)
+        return compressed
+
+    def precompress(self, body):
+        """
+        Compress a document for storage in a cache.
+
+        Args:
+            body (str or bytes): Serialized document
+
+        Returns:
+            CompressedPayload: The document with every supported encoding,
+                or none if it is below the size threshold
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        encodings = {}
+        if self.enabled and len(body) >= self.min_size:
+            encodings = {encoding: self.compress(body, encoding, stored=True) for encoding in self.encodings}
+        return CompressedPayload(body, encodings)
+
+    def payload_response(self, response_class, payload, mimetype, status=200):
+        """Build a response from a CompressedPayload, using a stored encoding when accepted"""
+        response = response_class(payload.body, status=status, mimetype=mimetype)
+        if payload.encodings or len(payload.body) >= self.min_size:
+            response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding in payload.encodings:
+            compressed = payload.encodings[encoding]
+            response.set_data(compressed)
+            response.headers['Content-Encoding'] = encoding
+            self._record(len(payload.body), len(compressed), encoding, precompressed=True)
+        return response
+
+    def compress_response(self, response):
+        if (response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not 200 <= response.status_code < 300 or response.status_code == 204
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        compressed = self.compress(data, encoding)
+        if len(compressed) >= len(data):
+            return response
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        self._record(len(data), len(compressed), encoding, precompressed=False)
+        return response
+
+    def _record(self, input_size, output_size, encoding, precompressed):
+        route = _route()
+        compressed_responses.inc(route=route, encoding=encoding, precompressed='true' if precompressed else 'false')
+        compression_input_bytes.inc(input_size, route=route, encoding=encoding)
+        compression_output_bytes.inc(output_size, route=route, encoding=encoding)
@@ -0,0 +1,146 @@
+import os
+from dotenv import load_dotenv
+
+# Profiles read the environment when this module is imported
+load_dotenv()
+
+
+def env_bool(name, default):
+    return os.getenv(name, str(default)).lower() == 'true'
+
+
+def database_url():
+    url = os.getenv('DATABASE_URL', 'sqlite:///ecommerce.db')
+    # Hosting providers still hand out the scheme SQLAlchemy dropped in 1.4
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url, pool_size, max_overflow, pool_recycle, pool_timeout):
+    """
+    SQLAlchemy engine options for a database URL.
+
+    In-memory SQLite gets a single shared connection from Flask-SQLAlchemy,
+    so it takes no pool options.
+    """
+    if url.startswith('sqlite') and (url in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in url):
+        return {}
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_recycle': pool_recycle,
+        'pool_timeout': pool_timeout,
+    }
+    if not url.startswith('sqlite'):
+        # Server connections can be dropped while idle in the pool
+        options['pool_pre_ping'] = True
+    return options
+
+
+class Config:
+    """Settings shared by every profile; each value can be overridden from the environment"""
+
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # Seconds before a pooled connection is replaced
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+
+    # Applied to every new SQLite connection; see database.py
+    SQLITE_PRAGMAS = {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),  # Readers no longer wait for writers
+        'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000)),  # Milliseconds to wait for a write lock
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),  # Durable in WAL mode except on power loss
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+        'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', -64000)),  # Negative values are KiB: 64MB
+    }
+
+    JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', '073cfa0a88a0d16ca567abbec011ef95523c1b24531b1dc7d108acb9a509bc0c')
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
+    CATALOG_CACHE_MAX_ENTRIES = int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', 2048))
+    CATALOG_CACHE_SHARED = env_bool('CATALOG_CACHE_SHARED', False)
+    CATALOG_CACHE_SYNC_INTERVAL = float(os.getenv('CATALOG_CACHE_SYNC_INTERVAL', 1.0))  # Seconds between checks for other processes' writes
+    MPESA_DISPATCH_WORKERS = int(os.getenv('MPESA_DISPATCH_WORKERS', 4))
+    MPESA_DISPATCH_QUEUE_SIZE = int(os.getenv('MPESA_DISPATCH_QUEUE_SIZE', 200))
+    MPESA_RECONCILE_INTERVAL = int(os.getenv('MPESA_RECONCILE_INTERVAL', 0))  # 0 disables the background reconciler; run `flask reconcile-payments` from cron instead
+    MPESA_RECONCILE_MIN_AGE = int(os.getenv('MPESA_RECONCILE_MIN_AGE', 120))
+    MPESA_RECONCILE_CONCURRENCY = int(os.getenv('MPESA_RECONCILE_CONCURRENCY', 4))
+    MPESA_RECONCILE_RATE = float(os.getenv('MPESA_RECONCILE_RATE', 5))  # Daraja queries per second
+    EMAIL_SMTP_CONNECTIONS = int(os.getenv('EMAIL_SMTP_CONNECTIONS', 1))
+    IMAGE_VARIANT_WIDTHS = [int(w) for w in os.getenv('IMAGE_VARIANT_WIDTHS', '200,400,800').split(',')]
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_MB', 256)) * 1024 * 1024
+    IMAGE_RESIZE_WORKERS = int(os.getenv('IMAGE_RESIZE_WORKERS', 2))
+    COMPRESS_ENABLED = env_bool('COMPRESS_ENABLED', True)
+    COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))  # Smaller responses are sent as is
+    PRODUCT_IMPORT_BATCH_SIZE = int(os.getenv('PRODUCT_IMPORT_BATCH_SIZE', 500))  # Rows per transaction
+    PRODUCT_IMPORT_MAX_ERRORS = int(os.getenv('PRODUCT_IMPORT_MAX_ERRORS', 1000))  # Rejected rows stored per import
+    VENDOR_BULK_UPDATE_MAX_ITEMS = int(os.getenv('VENDOR_BULK_UPDATE_MAX_ITEMS', 1000))
+    WISHLIST_MAX_BATCH = int(os.getenv('WISHLIST_MAX_BATCH', 200))  # Items per batch add or remove
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')  # Older hashes are upgraded at login
+    PASSWORD_VERIFY_WORKERS = int(os.getenv('PASSWORD_VERIFY_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    PASSWORD_VERIFY_MAX_PENDING = int(os.getenv('PASSWORD_VERIFY_MAX_PENDING', 32))  # Checks beyond this get a 503
+    PASSWORD_VERIFY_TIMEOUT = float(os.getenv('PASSWORD_VERIFY_TIMEOUT', 5))
+    LOGIN_THROTTLE_ENABLED = env_bool('LOGIN_THROTTLE_ENABLED', True)
+    LOGIN_IP_RATE = float(os.getenv('LOGIN_IP_RATE', 1))  # Attempts per second per client IP
+    LOGIN_IP_BURST = int(os.getenv('LOGIN_IP_BURST', 20))
+    LOGIN_ACCOUNT_RATE = float(os.getenv('LOGIN_ACCOUNT_RATE', 0.1))  # Attempts per second per account
+    LOGIN_ACCOUNT_BURST = int(os.getenv('LOGIN_ACCOUNT_BURST', 5))
+    SERVE_HOST = os.getenv('SERVE_HOST', '127.0.0.1')
+    SERVE_PORT = int(os.getenv('SERVE_PORT', 5000))
+    SERVE_WORKERS = int(os.getenv('SERVE_WORKERS', os.cpu_count() or 1))
+    SERVE_THREADS = int(os.getenv('SERVE_THREADS', 4))  # Request threads per worker process
+    SERVE_MAX_REQUESTS = int(os.getenv('SERVE_MAX_REQUESTS', 0))  # Recycle workers after this many; 0 never does
+    SERVE_MAX_REQUESTS_JITTER = int(os.getenv('SERVE_MAX_REQUESTS_JITTER', 0))
+    SERVE_GRACEFUL_TIMEOUT = int(os.getenv('SERVE_GRACEFUL_TIMEOUT', 30))
+    METRICS_ENABLED = env_bool('METRICS_ENABLED', True)
+    SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 200))  # Statements at least this slow are logged
+
+    @property
+    def SQLALCHEMY_ENGINE_OPTIONS(self):
+        return engine_options(self.SQLALCHEMY_DATABASE_URI, self.DB_POOL_SIZE, self.DB_MAX_OVERFLOW,
+                              self.DB_POOL_RECYCLE, self.DB_POOL_TIMEOUT)
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class ProductionConfig(Config):
+    DEBUG = False
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    CATALOG_CACHE_SHARED = env_bool('CATALOG_CACHE_SHARED', True)  # Production runs several worker processes
+    SERVE_HOST = os.getenv('SERVE_HOST', '0.0.0.0')
+    SERVE_MAX_REQUESTS = int(os.getenv('SERVE_MAX_REQUESTS', 10000))
+    SERVE_MAX_REQUESTS_JITTER = int(os.getenv('SERVE_MAX_REQUESTS_JITTER', 1000))
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', 'sqlite://')
+
+
+profiles = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'testing': TestingConfig,
+}
+
+
+def get_config(name=None):
+    """
+    Return the settings for a profile.
+
+    Args:
+        name (str, optional): Profile name; defaults to the APP_ENV
+            environment variable, then 'development'
+
+    Returns:
+        Config: Settings object for app.config.from_object
+    """
+    name = name or os.getenv('APP_ENV', 'development')
+    if name not in profiles:
+        raise ValueError(f"Unknown APP_ENV profile '{name}'; expected one of {', '.join(profiles)}")
+    return profiles[name]()
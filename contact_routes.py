@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
 from email_service import EmailService
+from email_outbox import enqueue_email
 
 contact_bp = Blueprint('contact', __name__)
 
@@ -25,26 +26,26 @@ def submit_contact_form():
         message = data['message']
         phone = data.get('phone', '')  # Optional field
         
-        # Send email
+        # Queue the email; the outbox sender delivers it in the background.
+        # Without credentials it could never be sent, so fail now instead
         email_service = EmailService()
-        result = email_service.send_contact_form(
+        if not email_service.configured:
+            return jsonify({
+                'success': False,
+                'message': 'Email credentials not configured'
+            }), 500
+        enqueue_email(**email_service.format_contact_form(
             name=name,
             email=email,
             subject=subject,
             message=message,
             phone=phone
-        )
+        ))
         
-        if result['success']:
-            return jsonify({
-                'success': True,
-                'message': 'Your message has been sent successfully!'
-            }), 200
-        else:
-            return jsonify({
-                'success': False,
-                'message': result['message']
-            }), 500
+        return jsonify({
+            'success': True,
+            'message': 'Your message has been sent successfully!'
+        }), 200
             
     except Exception as e:
         print(f"Error processing contact form: {str(e)}")
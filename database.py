@@ -0,0 +1,39 @@
+import logging
+from sqlalchemy import event
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite_engine(engine, pragmas):
+    """
+    Run PRAGMA statements on every new connection of a SQLite engine.
+
+    Most pragmas only last for the connection they are issued on, so they
+    are set from the pool's connect event rather than once at startup.
+
+    Args:
+        engine: SQLAlchemy engine for a SQLite database
+        pragmas (dict): Pragma name -> value, e.g. {'journal_mode': 'WAL'}
+    """
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    statements = [f'PRAGMA {name}={value}' for name, value in pragmas.items()]
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def init_database(app):
+    """Apply the configured connection settings to the app's engine before it is first used"""
+    with app.app_context():
+        engine = db.engine
+        configure_sqlite_engine(engine, app.config.get('SQLITE_PRAGMAS'))
+        logger.info(f"Using {engine.dialect.name} database {engine.url.render_as_string(hide_password=True)}")
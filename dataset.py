@@ -0,0 +1,293 @@
+import os
+import random
+import time
+import logging
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, select
+from werkzeug.security import generate_password_hash
+from extensions import db, catalog_cache
+from models import User, Vendor, Product, Order, OrderItem, Wishlist, Payment
+
+logger = logging.getLogger(__name__)
+
+# Every generated account shares this password
+DATASET_PASSWORD = 'password'
+
+CATEGORIES = ['Shoes', 'Jacket', 'Phone', 'Kit', 'Jeans', 'Watch', 'Headphones', 'Laptop', 'Dress', 'Bag',
+              'Sneakers', 'Hoodie', 'Tablet', 'Speaker', 'Camera', 'Shirt']
+ADJECTIVES = ['Classic', 'Wireless', 'Leather', 'Denim', 'Sport', 'Pro', 'Slim', 'Vintage', 'Black', 'Red',
+              'Compact', 'Premium', 'Kids', 'Outdoor', 'Smart', 'Original']
+BRANDS = ['Nike', 'Adidas', 'Apple', 'Samsung', 'Tecno', 'Infinix', 'Puma', 'Sony', 'JBL', 'Levi\'s',
+          'HP', 'Lenovo', 'Bata', 'Zara', 'Oraimo', 'Xiaomi']
+
+
+class DatasetGenerator:
+    """
+    Fills the database with a synthetic dataset that follows models.py.
+
+    Rows are generated in Python with explicit ids, so foreign keys are
+    known without reading anything back, and written with executemany in
+    batches, committing every commit_every rows. Popularity is skewed with
+    a power law: a few products get most orders and wishlist adds, a few
+    users place most orders and a few vendors own most products. The same
+    seed always produces the same dataset.
+    """
+
+    def __init__(self, seed=42, batch_size=20000, commit_every=500000, skew=3.0):
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.skew = skew
+        self.now = datetime.utcnow()
+
+    def pick(self, choices):
+        # Much cheaper than Random.choice, which matters at millions of rows
+        return choices[int(self.rng.random() * len(choices))]
+
+    def skewed(self, n, ranking=None):
+        """Pick an index in [0, n) with a power-law bias towards the front of ranking"""
+        index = int(n * self.rng.random() ** self.skew)
+        return ranking[index] if ranking is not None else index
+
+    def ranking(self, n):
+        # Hot items are spread over the id range instead of being the oldest rows
+        order = list(range(n))
+        self.rng.shuffle(order)
+        return order
+
+    def next_id(self, model):
+        return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+    def insert(self, model, rows):
+        """
+        Insert rows from an iterable of dicts in executemany batches.
+
+        Returns:
+            int: Number of rows inserted
+        """
+        table = model.__table__
+        started = time.monotonic()
+        total = uncommitted = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                db.session.execute(table.insert(), batch)
+                total += len(batch)
+                uncommitted += len(batch)
+                batch = []
+                if uncommitted >= self.commit_every:
+                    db.session.commit()
+                    uncommitted = 0
+        if batch:
+            db.session.execute(table.insert(), batch)
+            total += len(batch)
+        db.session.commit()
+        self.report(table.name, total, time.monotonic() - started)
+        return total
+
+    def report(self, name, total, elapsed):
+        rate = total / elapsed if elapsed else 0
+        click.echo(f'{name:<12} {total:>10,} rows in {elapsed:7.1f}s ({rate:,.0f} rows/s)')
+
+    def generate(self, vendors, products, users, orders, wishlists):
+        password_hash = generate_password_hash(DATASET_PASSWORD)
+        run = self.rng.randrange(16 ** 6)  # Keeps usernames unique when generating into a non-empty database
+
+        vendor_start = self.next_id(Vendor)
+        self.insert(Vendor, self.vendors(vendor_start, vendors, run, password_hash))
+
+        product_start = self.next_id(Product)
+        prices = []
+        self.insert(Product, self.products(product_start, products, vendor_start, vendors, prices))
+
+        user_start = self.next_id(User)
+        self.insert(User, self.users(user_start, users, run, password_hash))
+
+        product_ranking = self.ranking(products)
+        user_ranking = self.ranking(users)
+        self.insert_orders(orders, user_start, users, product_start, product_ranking, user_ranking, prices)
+        self.insert(Wishlist, self.wishlists(self.next_id(Wishlist), wishlists, user_start, users,
+                                             product_start, product_ranking, user_ranking))
+        catalog_cache.invalidate()
+
+    def insert_orders(self, count, user_start, users, product_start, product_ranking, user_ranking, prices):
+        """Insert orders together with the items and payments they produce, one batch of orders at a time"""
+        rng = self.rng
+        products = len(product_ranking)
+        order_id, item_id, payment_id = self.next_id(Order), self.next_id(OrderItem), self.next_id(Payment)
+        totals = {Order: 0, OrderItem: 0, Payment: 0}
+        started = time.monotonic()
+        uncommitted = 0
+        for chunk in range(0, count, self.batch_size):
+            orders, items, payments = [], [], []
+            for _ in range(min(self.batch_size, count - chunk)):
+                total = 0.0
+                seen = set()
+                for _ in range(1 + int(rng.expovariate(0.7))):
+                    index = self.skewed(products, product_ranking)
+                    if index in seen:
+                        continue
+                    seen.add(index)
+                    quantity = 1 if rng.random() < 0.8 else rng.randint(2, 5)
+                    price = prices[index]
+                    total += price * quantity
+                    items.append({'id': item_id, 'order_id': order_id, 'product_id': product_start + index,
+                                  'quantity': quantity, 'price': price})
+                    item_id += 1
+
+                outcome = rng.random()
+                if outcome < 0.97:
+                    # Most orders reach the payment step; the rest were abandoned at checkout
+                    payments.append(self.payment(payment_id, order_id, total, outcome))
+                    payment_id += 1
+                # Order.payment_id is left empty, as the checkout flow leaves it
+                orders.append({'id': order_id, 'user_id': user_start + self.skewed(users, user_ranking),
+                               'status': 'paid' if outcome < 0.65 else 'pending', 'total': round(total, 2),
+                               'payment_id': None})
+                order_id += 1
+
+            # Orders first, so the items' and payments' foreign keys resolve
+            for model, rows in ((Order, orders), (OrderItem, items), (Payment, payments)):
+                if rows:
+                    db.session.execute(model.__table__.insert(), rows)
+                    totals[model] += len(rows)
+                    uncommitted += len(rows)
+            if uncommitted >= self.commit_every:
+                db.session.commit()
+                uncommitted = 0
+        db.session.commit()
+
+        elapsed = time.monotonic() - started
+        for model, total in totals.items():
+            self.report(model.__table__.name, total, elapsed)
+
+    def vendors(self, start, count, run, password_hash):
+        rng = self.rng
+        for i in range(count):
+            vendor_id = start + i
+            name = f'{self.pick(BRANDS)} {self.pick(CATEGORIES)} Hub {vendor_id}'
+            yield {
+                'id': vendor_id,
+                'username': f'vendor_{run:06x}_{vendor_id}',
+                'email': f'vendor_{run:06x}_{vendor_id}@example.com',
+                'password_hash': password_hash,
+                'business_name': name,
+                'business_description': f'{name} sells {self.pick(ADJECTIVES).lower()} goods across Kenya',
+                'contact_phone': f'2547{rng.randrange(10 ** 8):08d}',
+                'registration_date': self.now - timedelta(days=rng.randrange(1000)),
+            }
+
+    def products(self, start, count, vendor_start, vendors, prices):
+        rng = self.rng
+        images = self.sample_images()
+        for i in range(count):
+            category = self.pick(CATEGORIES)
+            price = float(self.pick((99, 249, 499, 999, 1499, 2499, 4999, 9999, 24999, 89999)) + rng.randrange(500))
+            prices.append(price)
+            created_at = self.now - timedelta(seconds=rng.randrange(2 * 365 * 86400))
+            yield {
+                'id': start + i,
+                'name': f'{self.pick(BRANDS)} {self.pick(ADJECTIVES)} {category}',
+                'description': f'{self.pick(ADJECTIVES)} {category.lower()} by {self.pick(BRANDS)}, '
+                               f'{self.pick(ADJECTIVES).lower()} edition. Ships in {rng.randint(1, 7)} days.',
+                'price': price,
+                'stock': int(rng.expovariate(1 / 40)),
+                # A few big vendors own most of the catalog
+                'vendor_id': vendor_start + self.skewed(vendors),
+                'image_url': self.pick(images) if images else None,
+                'created_at': created_at,
+                'updated_at': created_at,
+            }
+
+    def users(self, start, count, run, password_hash):
+        for i in range(count):
+            user_id = start + i
+            yield {
+                'id': user_id,
+                'username': f'user_{run:06x}_{user_id}',
+                'email': f'user_{run:06x}_{user_id}@example.com',
+                'password_hash': password_hash,
+            }
+
+    def payment(self, payment_id, order_id, amount, outcome):
+        rng = self.rng
+        mpesa = outcome >= 0.65 or rng.random() < 0.85
+        row = {
+            'id': payment_id,
+            'order_id': order_id,
+            'amount': round(amount, 2),
+            'payment_date': self.now - timedelta(seconds=rng.randrange(365 * 86400)),
+            'payment_method': 'mpesa' if mpesa else self.pick(('card', 'paypal')),
+            'payment_details': None,
+            'mpesa_phone': None,
+            'mpesa_receipt': None,
+            'mpesa_checkout_request_id': None,
+            'mpesa_result_code': None,
+            'mpesa_result_desc': None,
+        }
+        if outcome < 0.65:
+            row['status'] = 'completed'
+        elif outcome < 0.85:
+            row['status'] = 'failed'
+        else:
+            row['status'] = 'pending'
+        if mpesa:
+            row['mpesa_phone'] = f'2547{rng.randrange(10 ** 8):08d}'
+            row['mpesa_checkout_request_id'] = f'ws_CO_{payment_id:020d}'
+            if row['status'] == 'completed':
+                row['mpesa_receipt'] = f'S{payment_id:09X}'
+                row['mpesa_result_code'] = '0'
+                row['mpesa_result_desc'] = 'The service request is processed successfully.'
+            elif row['status'] == 'failed':
+                row['mpesa_result_code'] = '1032'
+                row['mpesa_result_desc'] = 'Request cancelled by user'
+        return row
+
+    def wishlists(self, start, count, user_start, users, product_start, product_ranking, user_ranking):
+        rng = self.rng
+        products = len(product_ranking)
+        seen = set()
+        wishlist_id = start
+        attempts = 0
+        while wishlist_id - start < count and attempts < count * 3:
+            attempts += 1
+            pair = (self.skewed(users, user_ranking), self.skewed(products, product_ranking))
+            if pair in seen:
+                continue
+            seen.add(pair)
+            yield {'id': wishlist_id, 'user_id': user_start + pair[0], 'product_id': product_start + pair[1],
+                   'added_date': self.now - timedelta(seconds=rng.randrange(365 * 86400))}
+            wishlist_id += 1
+
+    def sample_images(self):
+        folder = os.path.join(current_app.root_path, 'static', 'uploads')
+        if not os.path.isdir(folder):
+            return []
+        return sorted(f'/static/uploads/{name}' for name in os.listdir(folder)
+                      if name.rsplit('.', 1)[-1].lower() in ('png', 'jpg', 'jpeg', 'gif'))
+
+
+@click.command('generate-dataset')
+@click.option('--scale', type=float, default=1.0, help='Multiplier applied to every row count.')
+@click.option('--vendors', type=int, default=10000, show_default=True)
+@click.option('--products', type=int, default=1000000, show_default=True)
+@click.option('--users', type=int, default=200000, show_default=True)
+@click.option('--orders', type=int, default=5000000, show_default=True)
+@click.option('--wishlists', type=int, default=1000000, show_default=True)
+@click.option('--seed', type=int, default=42, show_default=True, help='Same seed, same dataset.')
+@click.option('--skew', type=float, default=3.0, show_default=True,
+              help='Power-law exponent for hot products, power users and big vendors; 1 is uniform.')
+@click.option('--batch-size', type=int, default=20000, show_default=True)
+@with_appcontext
+def generate_dataset_command(scale, vendors, products, users, orders, wishlists, seed, skew, batch_size):
+    """Fill the database with a synthetic dataset for scale testing."""
+    counts = [max(1, int(count * scale)) for count in (vendors, products, users, orders, wishlists)]
+    click.echo(f"Generating {counts[0]:,} vendors, {counts[1]:,} products, {counts[2]:,} users, "
+               f"{counts[3]:,} orders and {counts[4]:,} wishlist items (seed {seed})")
+    started = time.monotonic()
+    DatasetGenerator(seed=seed, batch_size=batch_size, skew=skew).generate(*counts)
+    click.echo(f'Done in {time.monotonic() - started:.1f}s')
@@ -0,0 +1,218 @@
+import os
+import uuid
+import smtplib
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, select, or_
+from extensions import db
+from models import OutboxEmail
+from email_service import EmailService, timed_smtp
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_email(subject, message, sender_email=None, recipient=None, html_content=None):
+    """
+    Write an email to the outbox; the background sender delivers it.
+
+    Takes the same arguments as EmailService.send_email.
+
+    Returns:
+        OutboxEmail: The queued email
+    """
+    email = OutboxEmail(
+        subject=subject,
+        body=message,
+        html_body=html_content,
+        recipient=recipient,
+        reply_to=sender_email,
+        status='pending',
+        attempts=0,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(email)
+    db.session.commit()
+    outbox_sender.notify()
+    return email
+
+
+class SmtpConnection:
+    """One authenticated SMTP session kept open across messages"""
+
+    def __init__(self, email_service, timeout=30, idle_check=60):
+        self.email_service = email_service
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._server = None
+        self._last_used = 0
+
+    def send(self, msg):
+        server = self._connection()
+        try:
+            with timed_smtp('send'):
+                server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # The server closed an idle session; reconnect once and retry
+            self.close()
+            server = self._connection()
+            with timed_smtp('send'):
+                server.send_message(msg)
+        self._last_used = time.monotonic()
+
+    def close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except Exception:
+                pass
+            self._server = None
+
+    def _connection(self):
+        if self._server is not None and time.monotonic() - self._last_used > self.idle_check:
+            # Probe sessions that sat idle long enough for the server to drop them
+            try:
+                self._server.noop()
+            except Exception:
+                # Release the socket of the dead session before reconnecting
+                try:
+                    self._server.close()
+                except Exception:
+                    pass
+                self._server = None
+        if self._server is None:
+            service = self.email_service
+            logger.info(f"Connecting to SMTP server: {service.email_host}:{service.email_port}")
+            with timed_smtp('connect'):
+                server = smtplib.SMTP(service.email_host, service.email_port, timeout=self.timeout)
+                server.starttls()
+                server.login(service.email_user, service.email_password)
+            self._server = server
+            self._last_used = time.monotonic()
+        return self._server
+
+
+class OutboxSender:
+    """
+    Drains the outbox over persistent SMTP connections.
+
+    Each connection thread claims a batch of due emails, sends them one after
+    another over its open session and records the results in one commit.
+    Failed sends are retried with exponential backoff until max_attempts.
+    Claims carry a token, so several processes can drain the same outbox
+    without sending an email twice.
+    """
+
+    def __init__(self, connections=1, batch_size=20, poll_interval=5.0,
+                 max_attempts=8, base_backoff=30, max_backoff=3600, claim_timeout=600):
+        self.app = None
+        self.connections = connections
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.claim_timeout = claim_timeout
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.connections = app.config.get('EMAIL_SMTP_CONNECTIONS', self.connections)
+        self.max_attempts = app.config.get('EMAIL_MAX_ATTEMPTS', self.max_attempts)
+
+    def notify(self):
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        # Threads do not survive fork, so each process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wakeup = threading.Event()
+            for i in range(self.connections):
+                thread = threading.Thread(target=self._loop, name=f'email-outbox-{i}', daemon=True)
+                thread.start()
+            self._pid = os.getpid()
+
+    def _loop(self):
+        email_service = EmailService()
+        connection = SmtpConnection(email_service)
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    while self.send_batch(email_service, connection) == self.batch_size:
+                        pass
+            except Exception as e:
+                logger.exception(f"Error draining email outbox: {str(e)}")
+                connection.close()
+
+    def send_batch(self, email_service, connection):
+        """
+        Claim and send one batch of due emails.
+
+        Returns:
+            int: Number of emails claimed
+        """
+        emails = self._claim()
+        if not emails:
+            return 0
+
+        now = datetime.utcnow()
+        for email in emails:
+            email.attempts += 1
+            try:
+                if not email_service.email_user or not email_service.email_password:
+                    raise RuntimeError('Email credentials not configured')
+                msg = email_service.build_message(
+                    email.subject, email.body, email.reply_to, email.recipient, email.html_body
+                )
+                connection.send(msg)
+                email.status = 'sent'
+                email.sent_at = datetime.utcnow()
+                email.last_error = None
+            except Exception as e:
+                logger.warning(f"Failed to send outbox email {email.id} (attempt {email.attempts}): {str(e)}")
+                connection.close()
+                email.last_error = str(e)
+                if email.attempts >= self.max_attempts:
+                    email.status = 'failed'
+                else:
+                    email.status = 'pending'
+                    backoff = min(self.base_backoff * 2 ** (email.attempts - 1), self.max_backoff)
+                    email.next_attempt_at = now + timedelta(seconds=backoff)
+            email.claim_token = None
+        db.session.commit()
+        return len(emails)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        stale_claim = now - timedelta(seconds=self.claim_timeout)
+        due = select(OutboxEmail.id).where(
+            or_(
+                (OutboxEmail.status == 'pending') & (OutboxEmail.next_attempt_at <= now),
+                # Claims left behind by a sender that died mid-batch
+                (OutboxEmail.status == 'sending') & (OutboxEmail.claimed_at < stale_claim)
+            )
+        ).order_by(OutboxEmail.next_attempt_at).limit(self.batch_size)
+        db.session.execute(
+            update(OutboxEmail)
+            # Re-checked on the row itself so a concurrent claim cannot be taken over
+            .where(OutboxEmail.id.in_(due.scalar_subquery()))
+            .where(or_(OutboxEmail.status == 'pending', OutboxEmail.claimed_at < stale_claim))
+            .values(status='sending', claim_token=token, claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return OutboxEmail.query.filter_by(claim_token=token).all()
+
+
+outbox_sender = OutboxSender()
@@ -1,12 +1,30 @@
 import os
 import smtplib
+import time
+from contextlib import contextmanager
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
+from metrics import histogram
 
 # Load environment variables
 load_dotenv()
 
+smtp_latency = histogram('smtp_operation_seconds', 'Latency of SMTP connects and sends', ['operation', 'outcome'])
+
+
+@contextmanager
+def timed_smtp(operation):
+    """Record how long an SMTP connect (including TLS and login) or send takes"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        smtp_latency.observe(time.perf_counter() - started, operation=operation, outcome=outcome)
+
+
 class EmailService:
     def __init__(self):
         self.email_host = os.getenv('EMAIL_HOST', 'smtp.gmail.com')
@@ -15,6 +33,10 @@ class EmailService:
         self.email_password = os.getenv('EMAIL_PASSWORD')
         self.email_from = os.getenv('EMAIL_FROM', self.email_user)
         self.email_to = os.getenv('EMAIL_TO', self.email_user)  # Default recipient for contact forms
+
+    @property
+    def configured(self):
+        return bool(self.email_user and self.email_password)
         
     def send_email(self, subject, message, sender_email=None, recipient=None, html_content=None):
         """
@@ -30,7 +52,7 @@ class EmailService:
         Returns:
             dict: Result of the email sending operation
         """
-        if not self.email_user or not self.email_password:
+        if not self.configured:
             print("Email credentials not configured")
             return {
                 'success': False,
@@ -40,33 +62,25 @@ class EmailService:
         try:
             print(f"Attempting to send email to {recipient or self.email_to}")
             
-            # Create message container
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = self.email_from
-            msg['To'] = recipient or self.email_to
-            
-            # Add Reply-To header if sender_email is provided
-            if sender_email:
-                msg['Reply-To'] = sender_email
-                
-            # Attach plain text version
-            msg.attach(MIMEText(message, 'plain'))
-            
-            # Attach HTML version if provided
-            if html_content:
-                msg.attach(MIMEText(html_content, 'html'))
+            msg = self.build_message(subject, message, sender_email, recipient, html_content)
             
             # Connect to server and send email
             print(f"Connecting to SMTP server: {self.email_host}:{self.email_port}")
-            with smtplib.SMTP(self.email_host, self.email_port) as server:
-                server.set_debuglevel(1)  # Add debug output
-                print("Starting TLS")
-                server.starttls()  # Secure the connection
-                print(f"Logging in with user: {self.email_user}")
-                server.login(self.email_user, self.email_password)
+            with timed_smtp('connect'):
+                server = smtplib.SMTP(self.email_host, self.email_port)
+                try:
+                    server.set_debuglevel(1)  # Add debug output
+                    print("Starting TLS")
+                    server.starttls()  # Secure the connection
+                    print(f"Logging in with user: {self.email_user}")
+                    server.login(self.email_user, self.email_password)
+                except Exception:
+                    server.close()
+                    raise
+            with server:
                 print("Sending email")
-                server.send_message(msg)
+                with timed_smtp('send'):
+                    server.send_message(msg)
                 print("Email sent successfully")
             
             return {
@@ -83,6 +97,39 @@ class EmailService:
                 'message': f'Failed to send email: {str(e)}'
             }
             
+    def build_message(self, subject, message, sender_email=None, recipient=None, html_content=None):
+        """
+        Build the MIME message for an email.
+        
+        Args:
+            subject (str): Email subject
+            message (str): Email body text
+            sender_email (str, optional): Sender's email address for reply-to
+            recipient (str, optional): Override default recipient
+            html_content (str, optional): HTML version of the email
+            
+        Returns:
+            MIMEMultipart: Message ready to be sent
+        """
+        # Create message container
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = self.email_from
+        msg['To'] = recipient or self.email_to
+        
+        # Add Reply-To header if sender_email is provided
+        if sender_email:
+            msg['Reply-To'] = sender_email
+            
+        # Attach plain text version
+        msg.attach(MIMEText(message, 'plain'))
+        
+        # Attach HTML version if provided
+        if html_content:
+            msg.attach(MIMEText(html_content, 'html'))
+        
+        return msg
+            
     def send_contact_form(self, name, email, subject, message, phone=None):
         """
         Send a contact form submission as an email.
@@ -97,6 +144,23 @@ class EmailService:
         Returns:
             dict: Result of the email sending operation
         """
+        # Send the email
+        return self.send_email(**self.format_contact_form(name, email, subject, message, phone))
+
+    def format_contact_form(self, name, email, subject, message, phone=None):
+        """
+        Format a contact form submission as email content.
+        
+        Args:
+            name (str): Sender's name
+            email (str): Sender's email
+            subject (str): Email subject
+            message (str): Message content
+            phone (str, optional): Sender's phone number
+            
+        Returns:
+            dict: subject, message, sender_email and html_content for send_email
+        """
         # Create email subject
         email_subject = f"Contact Form: {subject}"
         
@@ -130,11 +194,10 @@ class EmailService:
 </html>
 """
         
-        # Send the email
-        return self.send_email(
-            subject=email_subject,
-            message=email_body,
-            sender_email=email,
-            html_content=html_body
-        )
+        return {
+            'subject': email_subject,
+            'message': email_body,
+            'sender_email': email,
+            'html_content': html_body
+        }
 
@@ -1,6 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
+from catalog_cache import CatalogCache
+from compression import Compressor
 
 db = SQLAlchemy()
 jwt = JWTManager()
+catalog_cache = CatalogCache()
 
+compressor = Compressor()
@@ -0,0 +1,212 @@
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import logging
+from flask import Request, current_app, request
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects import sqlite, postgresql
+from extensions import db
+from models import StoredImage
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_URL_PREFIX = '/static/uploads/'
+
+# Content-addressed upload names: sha256 hex digest plus the original extension
+HASHED_NAME = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def upload_folder():
+    return os.path.join(current_app.root_path, 'static', 'uploads')
+
+
+def upload_tmp_folder():
+    # Kept outside static/ so partial uploads are never served
+    folder = current_app.config.get('UPLOAD_TMP_FOLDER') or os.path.join(current_app.instance_path, 'upload_tmp')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+class HashingTemporaryFile:
+    """
+    Temporary file that hashes everything written to it.
+
+    Werkzeug writes each uploaded file part into one of these as the request
+    body streams in, so the content hash is known without a second pass and
+    the upload never has to fit in memory.
+    """
+
+    def __init__(self, directory):
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='upload-')
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Request class that streams uploaded files into HashingTemporaryFile"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingTemporaryFile(upload_tmp_folder())
+
+
+def _increment_refcount(filename, size):
+    values = {'filename': filename, 'refcount': 1, 'size': size}
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(StoredImage).values(**values)
+        statement = statement.on_conflict_do_update(
+            index_elements=['filename'],
+            set_={'refcount': StoredImage.refcount + 1}
+        )
+        db.session.execute(statement)
+    else:
+        image = db.session.get(StoredImage, filename)
+        if image is None:
+            db.session.add(StoredImage(**values))
+        else:
+            image.refcount += 1
+
+
+def store_upload(file):
+    """
+    Store an uploaded image under its content hash and take a reference to it.
+
+    Identical images share one file, and different images can never overwrite
+    each other. The caller commits the reference together with the product.
+
+    Args:
+        file (FileStorage): Uploaded image with an allowed extension
+
+    Returns:
+        str: Public URL of the stored image
+    """
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    stream = file.stream
+    if isinstance(stream, HashingTemporaryFile):
+        digest, size = stream.hexdigest(), stream.size
+    else:
+        # Small files Werkzeug kept in memory; copy them to disk in chunks
+        stream.seek(0)
+        tmp = HashingTemporaryFile(upload_tmp_folder())
+        shutil.copyfileobj(stream, tmp, 64 * 1024)
+        stream = tmp
+        digest, size = tmp.hexdigest(), tmp.size
+    stream.flush()
+
+    folder = upload_folder()
+    os.makedirs(folder, exist_ok=True)
+    filename = f'{digest}.{extension}'
+    path = os.path.join(folder, filename)
+    # Take the reference before looking for the file: collect_garbage moves
+    # the file aside before deleting its row, so if it is missing now it is
+    # published again, and if it is moved after this the reference keeps the
+    # row and the file is put back
+    _increment_refcount(filename, size)
+    if not os.path.exists(path):
+        # Publish the finished file atomically under its final name
+        staged = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.link(stream.name, staged)
+        except OSError:
+            shutil.copyfile(stream.name, staged)
+        os.replace(staged, path)
+    stream.close()
+    return f'{UPLOAD_URL_PREFIX}{filename}'
+
+
+def release_image(image_url):
+    """
+    Drop one reference to a stored image, e.g. when its product is deleted or
+    gets a new image. The caller commits, then calls collect_garbage().
+
+    Returns:
+        str: Stored file name if the URL was content-addressed, else None
+    """
+    if not image_url or not image_url.startswith(UPLOAD_URL_PREFIX):
+        return None
+    filename = image_url[len(UPLOAD_URL_PREFIX):]
+    if not HASHED_NAME.match(filename):
+        # Uploads from before content addressing are left alone
+        return None
+    db.session.execute(
+        update(StoredImage)
+        .where(StoredImage.filename == filename, StoredImage.refcount > 0)
+        .values(refcount=StoredImage.refcount - 1)
+        .execution_options(synchronize_session=False)
+    )
+    return filename
+
+
+def collect_garbage(filenames):
+    """
+    Delete stored images in filenames that no product references any more.
+
+    The file is moved aside before its row is deleted, and put back if the
+    delete finds a new reference. An upload of the same image racing with
+    this either takes that reference first or, once the row is gone, finds
+    the file missing and publishes it again.
+    """
+    for filename in filenames:
+        if not filename:
+            continue
+        try:
+            refcount = db.session.execute(
+                select(StoredImage.refcount).where(StoredImage.filename == filename)
+            ).scalar()
+            db.session.rollback()
+            if refcount is None or refcount > 0:
+                continue
+
+            path = os.path.join(upload_folder(), filename)
+            doomed = f'{path}.{os.getpid()}.{threading.get_ident()}.gc'
+            try:
+                os.rename(path, doomed)
+            except FileNotFoundError:
+                doomed = None
+
+            deleted = False
+            try:
+                result = db.session.execute(
+                    delete(StoredImage)
+                    .where(StoredImage.filename == filename, StoredImage.refcount <= 0)
+                    .execution_options(synchronize_session=False)
+                )
+                db.session.commit()
+                deleted = result.rowcount == 1
+            finally:
+                if doomed is not None:
+                    if deleted:
+                        os.remove(doomed)
+                    else:
+                        # Referenced again; an upload may have published it already
+                        os.replace(doomed, path)
+            if deleted:
+                logger.info(f"Removed unreferenced image {filename}")
+        except Exception as e:
+            db.session.rollback()
+            logger.exception(f"Error collecting image {filename}: {str(e)}")
+
+
+def add_cache_headers(response):
+    """Let clients cache content-addressed images forever"""
+    if response.status_code == 200 and request.path.startswith(UPLOAD_URL_PREFIX):
+        if HASHED_NAME.match(request.path[len(UPLOAD_URL_PREFIX):]):
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -0,0 +1,247 @@
+import os
+import time
+import threading
+import multiprocessing
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import Blueprint, send_file, jsonify
+from image_store import UPLOAD_URL_PREFIX, IMMUTABLE_CACHE_CONTROL, upload_folder
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+images_bp = Blueprint('images', __name__)
+
+DEFAULT_WIDTHS = (200, 400, 800)
+SOURCE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+variant_requests = counter('image_variant_requests_total', 'Resized image requests', ['result'])
+variant_render_seconds = histogram('image_variant_render_seconds', 'Time to render a resized image variant')
+variant_evictions = counter('image_variant_evictions_total', 'Resized image variants evicted from the disk cache')
+
+
+def render_variant(source_path, target_path, width, jpeg_quality):
+    """
+    Resize an image to width pixels wide and recompress it to target_path.
+
+    Runs in the resize process pool, so it only depends on Pillow and the
+    file system. The variant is written under a temporary name and renamed
+    into place, so readers never see a partial file.
+
+    Returns:
+        int: Size of the written variant in bytes
+    """
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        image_format = image.format
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image.draft('RGB', (width, height))  # Lets JPEG decode at a reduced scale
+            if image.mode in ('1', 'P'):
+                # Palette images would otherwise be resized with nearest-neighbour sampling
+                image = image.convert('RGBA')
+            image = image.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        else:
+            image = image.copy()
+
+        tmp_path = f'{target_path}.{os.getpid()}.tmp'
+        if image_format == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            image.save(tmp_path, 'JPEG', quality=jpeg_quality, optimize=True, progressive=True)
+        elif image_format == 'GIF':
+            # Variants of animated GIFs are a still of the first frame
+            image.save(tmp_path, 'GIF', optimize=True)
+        else:
+            image.save(tmp_path, 'PNG', optimize=True)
+    os.replace(tmp_path, target_path)
+    return os.path.getsize(target_path)
+
+
+class VariantCache:
+    """
+    Disk cache of resized images with a size cap and LRU eviction.
+
+    Hits bump the variant's mtime, so recency is shared by every process
+    using the same cache directory. When the cache grows past max_bytes the
+    least recently used variants are removed until it is back under
+    low_watermark of the cap. Misses are rendered in a process pool, and
+    concurrent requests for the same variant wait on a single render.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, workers=2, jpeg_quality=82,
+                 render_timeout=30, touch_interval=60, low_watermark=0.9):
+        self.directory = None
+        self.widths = DEFAULT_WIDTHS
+        # Serializers call variant_urls for every product row, so the URL prefixes are built once
+        self._prefixes = [(str(width), f'/img/{width}/') for width in self.widths]
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.jpeg_quality = jpeg_quality
+        self.render_timeout = render_timeout
+        self.touch_interval = touch_interval
+        self.low_watermark = low_watermark
+        self._executor = None
+        self._pid = None
+        self._pending = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.directory = app.config.get('IMAGE_CACHE_FOLDER') or os.path.join(app.instance_path, 'image_cache')
+        self.widths = tuple(sorted(app.config.get('IMAGE_VARIANT_WIDTHS', self.widths)))
+        self._prefixes = [(str(width), f'/img/{width}/') for width in self.widths]
+        self.max_bytes = app.config.get('IMAGE_CACHE_MAX_BYTES', self.max_bytes)
+        self.workers = app.config.get('IMAGE_RESIZE_WORKERS', self.workers)
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = self._disk_usage()
+        app.register_blueprint(images_bp)
+
+    def variant_urls(self, image_url):
+        """Map each variant width to its URL for an uploaded image, or None"""
+        if not image_url or not image_url.startswith(UPLOAD_URL_PREFIX):
+            return None
+        filename = image_url[len(UPLOAD_URL_PREFIX):]
+        if filename.rsplit('.', 1)[-1].lower() not in SOURCE_EXTENSIONS:
+            return None
+        return {width: prefix + filename for width, prefix in self._prefixes}
+
+    def get(self, width, filename):
+        """
+        Return the path of a cached variant, rendering it on a miss.
+
+        Returns:
+            str: Path of the variant, or None if the source image does not exist
+        """
+        source_path = os.path.join(upload_folder(), filename)
+        target_path = os.path.join(self.directory, str(width), filename)
+
+        try:
+            stat = os.stat(target_path)
+        except FileNotFoundError:
+            stat = None
+        if stat is not None:
+            variant_requests.inc(result='hit')
+            self._touch(target_path, stat)
+            return target_path
+
+        if not os.path.isfile(source_path):
+            return None
+
+        variant_requests.inc(result='miss')
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with self._lock:
+            future = self._pending.get(target_path)
+            submitted = future is None
+            if submitted:
+                future = self._pool().submit(render_variant, source_path, target_path, width, self.jpeg_quality)
+                future.started = time.monotonic()
+                self._pending[target_path] = future
+        if submitted:
+            future.add_done_callback(lambda f: self._rendered(target_path, f))
+        try:
+            future.result(timeout=self.render_timeout)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool next time
+            with self._lock:
+                self._pid = None
+            raise
+        return target_path
+
+    def _rendered(self, target_path, future):
+        with self._lock:
+            self._pending.pop(target_path, None)
+        variant_render_seconds.observe(time.monotonic() - future.started)
+        if future.exception() is None:
+            self._grow(future.result())
+
+    def _pool(self):
+        # Worker processes do not survive fork, so each process starts its own pool.
+        # They are spawned rather than forked to stay clear of this process's threads.
+        if self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+            )
+            self._pending = {}
+            self._pid = os.getpid()
+        return self._executor
+
+    def _touch(self, path, stat):
+        # Recency only needs minute precision, so most hits skip the write
+        now = time.time()
+        if now - stat.st_mtime > self.touch_interval:
+            try:
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+
+    def _grow(self, size):
+        with self._lock:
+            self._size += size
+            if self._size <= self.max_bytes:
+                return
+        self.evict()
+
+    def _entries(self):
+        for width in os.listdir(self.directory):
+            folder = os.path.join(self.directory, width)
+            if not os.path.isdir(folder):
+                continue
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_file() and not entry.name.endswith('.tmp'):
+                        stat = entry.stat()
+                        yield entry.path, stat.st_mtime, stat.st_size
+
+    def _disk_usage(self):
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self):
+        """Remove least recently used variants until the cache is under its low watermark"""
+        # The directory is scanned rather than trusting this process's count,
+        # since other processes add variants to the same cache
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_bytes * self.low_watermark
+        removed = 0
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._size = total
+        if removed:
+            variant_evictions.inc(removed)
+            logger.info(f"Evicted {removed} image variants from the cache")
+
+
+variant_cache = VariantCache()
+
+
+@images_bp.route('/img/<int:width>/<filename>', methods=['GET'])
+def resized_image(width, filename):
+    if width not in variant_cache.widths:
+        return jsonify({'message': f'Unsupported width; use one of {list(variant_cache.widths)}'}), 400
+    if os.path.basename(filename) != filename or filename.rsplit('.', 1)[-1].lower() not in SOURCE_EXTENSIONS:
+        return jsonify({'message': 'Image not found'}), 404
+
+    try:
+        path = variant_cache.get(width, filename)
+    except Exception as e:
+        logger.exception(f"Error resizing {filename} to {width}px: {str(e)}")
+        variant_requests.inc(result='error')
+        return jsonify({'message': 'Could not resize image'}), 500
+    if path is None:
+        return jsonify({'message': 'Image not found'}), 404
+
+    response = send_file(path, conditional=True, max_age=31536000)
+    # Uploads are content-addressed, so a variant URL always names the same bytes
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
@@ -0,0 +1,104 @@
+import re
+import time
+import logging
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from extensions import db
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+request_duration = histogram('http_request_duration_seconds', 'Wall time spent handling requests',
+                             ['route', 'method', 'status'])
+request_sql_statements = histogram('http_request_sql_statements', 'SQL statements executed per request', ['route'],
+                                   buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144))
+request_sql_seconds = histogram('http_request_sql_seconds', 'Time spent in SQL per request', ['route'])
+slow_queries = counter('db_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS', ['route'])
+
+WHITESPACE = re.compile(r'\s+')
+
+
+def _route():
+    if not has_request_context():
+        return 'none'
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def redact_parameters(parameters, executemany):
+    """
+    Describe statement parameters without their values.
+
+    Values can be passwords, phone numbers or tokens, so only their types
+    reach the log; executemany batches are summarised by their size.
+    """
+    if executemany:
+        return f'<{len(parameters)} parameter sets>'
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+class RequestInstrumentation:
+    """
+    Per-request timings for the /metrics endpoint.
+
+    Records each request's wall time and, per endpoint, how many SQL
+    statements it ran and how long they took. Statements slower than
+    SLOW_QUERY_MS are logged with their parameters redacted, whether or not
+    they ran inside a request.
+
+    With METRICS_ENABLED off no hooks or engine listeners are installed, so
+    requests and queries pay nothing.
+    """
+
+    def __init__(self, slow_query_ms=200):
+        self.slow_query_seconds = slow_query_ms / 1000
+
+    def init_app(self, app):
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        self.slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        with app.app_context():
+            engine = db.engine
+        if not event.contains(engine, 'before_cursor_execute', self.before_cursor_execute):
+            event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def start_request(self):
+        g.request_started = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    def finish_request(self, response):
+        started = g.get('request_started')
+        if started is None:
+            return response
+        route = _route()
+        request_duration.observe(time.perf_counter() - started, route=route, method=request.method,
+                                 status=str(response.status_code))
+        request_sql_statements.observe(g.sql_statements, route=route)
+        request_sql_seconds.observe(g.sql_seconds, route=route)
+        return response
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info['query_started'] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started']
+        in_request = has_request_context() and 'sql_statements' in g
+        if in_request:
+            g.sql_statements += 1
+            g.sql_seconds += elapsed
+        if elapsed >= self.slow_query_seconds:
+            route = _route() if in_request else 'none'
+            slow_queries.inc(route=route)
+            logger.warning(f"Slow query ({elapsed * 1000:.1f} ms) on {route}: "
+                           f"{WHITESPACE.sub(' ', statement).strip()} "
+                           f"params={redact_parameters(parameters, executemany)}")
+
+
+request_instrumentation = RequestInstrumentation()
@@ -0,0 +1,62 @@
+import os
+import socket
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, delete, or_
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import ServiceLease
+
+logger = logging.getLogger(__name__)
+
+
+def process_holder():
+    """Identifies this process as a lease holder across hosts"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def acquire_lease(name, holder, ttl):
+    """
+    Take or renew the named lease for ttl seconds.
+
+    A lease lets one process among many run a job that must not run
+    concurrently, such as a background loop started in every worker. The
+    holder renews it each time it runs; another process takes it over once
+    it has expired, e.g. after the holder died.
+
+    Returns:
+        bool: True if holder now holds the lease
+    """
+    now = datetime.utcnow()
+    try:
+        if db.session.get(ServiceLease, name) is None:
+            db.session.add(ServiceLease(name=name, holder=holder, expires_at=now + timedelta(seconds=ttl)))
+            db.session.commit()
+            return True
+        result = db.session.execute(
+            update(ServiceLease)
+            .where(ServiceLease.name == name,
+                   or_(ServiceLease.holder == holder, ServiceLease.expires_at < now))
+            .values(holder=holder, expires_at=now + timedelta(seconds=ttl))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+    except IntegrityError:
+        # Another process created the lease first
+        db.session.rollback()
+        return False
+
+
+def release_lease(name, holder):
+    """Give up the named lease if holder still holds it"""
+    try:
+        db.session.execute(
+            delete(ServiceLease)
+            .where(ServiceLease.name == name, ServiceLease.holder == holder)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.warning(f"Could not release lease {name}: {str(e)}")
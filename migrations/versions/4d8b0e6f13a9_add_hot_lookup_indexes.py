@@ -0,0 +1,44 @@
+"""Add indexes for hot lookup columns
+
+Revision ID: 4d8b0e6f13a9
+Revises: e91d2f4c7a58
+Create Date: 2026-10-18 12:40:08.915327
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d8b0e6f13a9'
+down_revision = 'e91d2f4c7a58'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_payment_mpesa_checkout_request_id', 'payment', ['mpesa_checkout_request_id'], False),
+    ('ix_payment_order_id', 'payment', ['order_id'], False),
+    ('ix_order_user_id', 'order', ['user_id'], False),
+    ('uq_wishlist_user_id_product_id', 'wishlist', ['user_id', 'product_id'], True),
+]
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    # The unique index cannot be built while duplicates exist; keep the oldest entry
+    op.execute(
+        'DELETE FROM wishlist WHERE id NOT IN '
+        '(SELECT MIN(id) FROM wishlist GROUP BY user_id, product_id)'
+    )
+
+    for name, table, columns, unique in INDEXES:
+        # db.create_all() at startup creates these on fresh databases
+        existing = {index['name'] for index in inspector.get_indexes(table)}
+        if name not in existing:
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name, table, columns, unique in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,39 @@
+"""Add mpesa_callback table for deduplicated callback ingestion
+
+Revision ID: 5a2c9e71b4d6
+Revises: 4d8b0e6f13a9
+Create Date: 2026-10-18 14:18:33.270516
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a2c9e71b4d6'
+down_revision = '4d8b0e6f13a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    if sa.inspect(op.get_bind()).has_table('mpesa_callback'):
+        return
+    op.create_table('mpesa_callback',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('dedupe_key', sa.String(length=120), nullable=False),
+    sa.Column('checkout_request_id', sa.String(length=100), nullable=True),
+    sa.Column('result_code', sa.String(length=10), nullable=True),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('received_at', sa.DateTime(), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('dedupe_key')
+    )
+    op.create_index('ix_mpesa_callback_processed_at', 'mpesa_callback', ['processed_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_mpesa_callback_processed_at', table_name='mpesa_callback')
+    op.drop_table('mpesa_callback')
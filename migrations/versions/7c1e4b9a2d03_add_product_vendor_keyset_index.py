@@ -0,0 +1,28 @@
+"""Add product (vendor_id, id) index for keyset pagination
+
+Revision ID: 7c1e4b9a2d03
+Revises: 491e523ac8a4
+Create Date: 2026-10-18 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e4b9a2d03'
+down_revision = '491e523ac8a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() at startup creates it on fresh databases
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('product')}
+    if 'ix_product_vendor_id_id' in existing:
+        return
+    op.create_index('ix_product_vendor_id_id', 'product', ['vendor_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_product_vendor_id_id', table_name='product')
@@ -0,0 +1,33 @@
+"""Add stored_image table for content-addressed uploads
+
+Revision ID: 8f4a1c2b9e60
+Revises: c6f03a8d2e15
+Create Date: 2026-10-18 15:40:12.318604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f4a1c2b9e60'
+down_revision = 'c6f03a8d2e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    if sa.inspect(op.get_bind()).has_table('stored_image'):
+        return
+    op.create_table('stored_image',
+    sa.Column('filename', sa.String(length=80), nullable=False),
+    sa.Column('refcount', sa.Integer(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('filename')
+    )
+
+
+def downgrade():
+    op.drop_table('stored_image')
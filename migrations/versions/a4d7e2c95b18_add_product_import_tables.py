@@ -0,0 +1,60 @@
+"""Add product_import and product_import_error tables for bulk imports
+
+Revision ID: a4d7e2c95b18
+Revises: 8f4a1c2b9e60
+Create Date: 2026-10-18 17:05:41.902217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d7e2c95b18'
+down_revision = '8f4a1c2b9e60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created them
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table('product_import'):
+        op.create_table('product_import',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('vendor_id', sa.Integer(), nullable=False),
+        sa.Column('format', sa.String(length=10), nullable=False),
+        sa.Column('path', sa.String(length=255), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('rows_processed', sa.Integer(), nullable=False),
+        sa.Column('rows_imported', sa.Integer(), nullable=False),
+        sa.Column('rows_failed', sa.Integer(), nullable=False),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['vendor_id'], ['vendor.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_product_import_vendor_id'), 'product_import', ['vendor_id'], unique=False)
+        op.create_index('ix_product_import_status_updated_at', 'product_import', ['status', 'updated_at'], unique=False)
+
+    if not inspector.has_table('product_import_error'):
+        op.create_table('product_import_error',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('import_id', sa.Integer(), nullable=False),
+        sa.Column('line', sa.Integer(), nullable=False),
+        sa.Column('message', sa.String(length=255), nullable=False),
+        sa.ForeignKeyConstraint(['import_id'], ['product_import.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_product_import_error_import_id_id', 'product_import_error', ['import_id', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_product_import_error_import_id_id', table_name='product_import_error')
+    op.drop_table('product_import_error')
+    op.drop_index('ix_product_import_status_updated_at', table_name='product_import')
+    op.drop_index(op.f('ix_product_import_vendor_id'), table_name='product_import')
+    op.drop_table('product_import')
@@ -0,0 +1,31 @@
+"""Add catalog_version table for the shared catalog cache
+
+Revision ID: b3f5a8c61e27
+Revises: 7c1e4b9a2d03
+Create Date: 2026-10-18 10:03:17.402961
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f5a8c61e27'
+down_revision = '7c1e4b9a2d03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    if sa.inspect(op.get_bind()).has_table('catalog_version'):
+        return
+    op.create_table('catalog_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('catalog_version')
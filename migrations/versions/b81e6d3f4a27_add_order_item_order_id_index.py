@@ -0,0 +1,27 @@
+"""Add order_item.order_id index for batch-loading order items
+
+Revision ID: b81e6d3f4a27
+Revises: a4d7e2c95b18
+Create Date: 2026-10-18 17:48:26.530914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81e6d3f4a27'
+down_revision = 'a4d7e2c95b18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() at startup creates it on fresh databases
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('order_item')}
+    if 'ix_order_item_order_id' not in existing:
+        op.create_index('ix_order_item_order_id', 'order_item', ['order_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_order_item_order_id', table_name='order_item')
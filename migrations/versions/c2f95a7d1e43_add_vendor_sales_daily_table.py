@@ -0,0 +1,36 @@
+"""Add vendor_sales_daily rollup table
+
+Revision ID: c2f95a7d1e43
+Revises: b81e6d3f4a27
+Create Date: 2026-10-18 18:22:57.164380
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f95a7d1e43'
+down_revision = 'b81e6d3f4a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    if sa.inspect(op.get_bind()).has_table('vendor_sales_daily'):
+        return
+    op.create_table('vendor_sales_daily',
+    sa.Column('vendor_id', sa.Integer(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('units', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ),
+    sa.ForeignKeyConstraint(['vendor_id'], ['vendor.id'], ),
+    sa.PrimaryKeyConstraint('vendor_id', 'day', 'product_id')
+    )
+
+
+def downgrade():
+    op.drop_table('vendor_sales_daily')
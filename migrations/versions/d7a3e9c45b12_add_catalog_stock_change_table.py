@@ -0,0 +1,34 @@
+"""Add catalog_stock_change table for the shared catalog cache
+
+Revision ID: d7a3e9c45b12
+Revises: c2f95a7d1e43
+Create Date: 2026-10-18 20:41:08.513274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3e9c45b12'
+down_revision = 'c2f95a7d1e43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    if sa.inspect(op.get_bind()).has_table('catalog_stock_change'):
+        return
+    op.create_table('catalog_stock_change',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_catalog_stock_change_created_at', 'catalog_stock_change', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_catalog_stock_change_created_at', table_name='catalog_stock_change')
+    op.drop_table('catalog_stock_change')
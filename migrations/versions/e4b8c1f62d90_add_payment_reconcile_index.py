@@ -0,0 +1,28 @@
+"""Add payment (status, payment_method, payment_date) index for the reconciler
+
+Revision ID: e4b8c1f62d90
+Revises: d7a3e9c45b12
+Create Date: 2026-10-18 21:06:44.275018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b8c1f62d90'
+down_revision = 'd7a3e9c45b12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() at startup creates it on fresh databases
+    existing = {index['name'] for index in sa.inspect(op.get_bind()).get_indexes('payment')}
+    if 'ix_payment_status_method_date' not in existing:
+        op.create_index('ix_payment_status_method_date', 'payment', ['status', 'payment_method', 'payment_date'],
+                        unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_payment_status_method_date', table_name='payment')
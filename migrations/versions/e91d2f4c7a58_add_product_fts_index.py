@@ -0,0 +1,40 @@
+"""Add product_fts full-text index and sync triggers
+
+Revision ID: e91d2f4c7a58
+Revises: b3f5a8c61e27
+Create Date: 2026-10-18 11:26:51.730442
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91d2f4c7a58'
+down_revision = 'b3f5a8c61e27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    from search import FTS_SCHEMA
+
+    bind = op.get_bind()
+    if bind.dialect.name != 'sqlite':
+        return
+
+    # init_search() may already have created and built the index at startup
+    exists = sa.inspect(bind).has_table('product_fts')
+    for statement in FTS_SCHEMA:
+        op.execute(statement)
+    if not exists:
+        op.execute("INSERT INTO product_fts(product_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute('DROP TRIGGER IF EXISTS product_fts_au')
+    op.execute('DROP TRIGGER IF EXISTS product_fts_ad')
+    op.execute('DROP TRIGGER IF EXISTS product_fts_ai')
+    op.execute('DROP TABLE IF EXISTS product_fts')
@@ -0,0 +1,32 @@
+"""Add service_lease table for singleton background jobs
+
+Revision ID: f15c7a9e3b48
+Revises: e4b8c1f62d90
+Create Date: 2026-10-18 21:38:12.904517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f15c7a9e3b48'
+down_revision = 'e4b8c1f62d90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # create_app() runs db.create_all(), which may already have created it
+    if sa.inspect(op.get_bind()).has_table('service_lease'):
+        return
+    op.create_table('service_lease',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=120), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('service_lease')
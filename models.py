@@ -1,5 +1,6 @@
 from extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
+from passwords import hash_password
 from datetime import datetime
 
 class User(db.Model):
@@ -9,7 +10,7 @@ class User(db.Model):
   password_hash = db.Column(db.String(128))
 
   def set_password(self, password):
-      self.password_hash = generate_password_hash(password)
+      self.password_hash = hash_password(password)
 
   def check_password(self, password):
       return check_password_hash(self.password_hash, password)
@@ -25,7 +26,7 @@ class Vendor(db.Model):
   registration_date = db.Column(db.DateTime, default=datetime.utcnow)
 
   def set_password(self, password):
-      self.password_hash = generate_password_hash(password)
+      self.password_hash = hash_password(password)
 
   def check_password(self, password):
       return check_password_hash(self.password_hash, password)
@@ -41,29 +42,47 @@ class Product(db.Model):
   created_at = db.Column(db.DateTime, default=datetime.utcnow)
   updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+  __table_args__ = (
+      # Keyset pagination of a vendor's products seeks on (vendor_id, id)
+      db.Index('ix_product_vendor_id_id', 'vendor_id', 'id'),
+  )
+
 class Order(db.Model):
   id = db.Column(db.Integer, primary_key=True)
-  user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+  user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
   status = db.Column(db.String(20), nullable=False)
   total = db.Column(db.Float, nullable=False)
   payment_id = db.Column(db.Integer, db.ForeignKey('payment.id'))
+
+  items = db.relationship('OrderItem', back_populates='order', order_by='OrderItem.id')
+  # Every payment attempt for the order; payment_id is not kept up to date by checkout
+  payments = db.relationship('Payment', back_populates='order', foreign_keys='Payment.order_id',
+                             order_by='Payment.id')
   
 class OrderItem(db.Model):
   id = db.Column(db.Integer, primary_key=True)
-  order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+  order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
   product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
   quantity = db.Column(db.Integer, nullable=False)
   price = db.Column(db.Float, nullable=False)
 
+  order = db.relationship('Order', back_populates='items')
+  product = db.relationship('Product')
+
 class Wishlist(db.Model):
   id = db.Column(db.Integer, primary_key=True)
   user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
   product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
   added_date = db.Column(db.DateTime, default=datetime.utcnow)
 
+  __table_args__ = (
+      # Serves the duplicate check and rejects duplicates under concurrent adds
+      db.Index('uq_wishlist_user_id_product_id', 'user_id', 'product_id', unique=True),
+  )
+
 class Payment(db.Model):
   id = db.Column(db.Integer, primary_key=True)
-  order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
+  order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
   amount = db.Column(db.Float, nullable=False)
   status = db.Column(db.String(20), nullable=False)  # 'pending', 'completed', 'failed'
   payment_date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -73,7 +92,107 @@ class Payment(db.Model):
   # M-Pesa specific fields
   mpesa_phone = db.Column(db.String(20))  # Phone number used for payment
   mpesa_receipt = db.Column(db.String(50))  # M-Pesa receipt number
-  mpesa_checkout_request_id = db.Column(db.String(100))  # Checkout request ID for tracking
+  mpesa_checkout_request_id = db.Column(db.String(100), index=True)  # Checkout request ID for tracking
   mpesa_result_code = db.Column(db.String(10))  # Result code from M-Pesa
   mpesa_result_desc = db.Column(db.String(255))  # Result description from M-Pesa
 
+  order = db.relationship('Order', back_populates='payments', foreign_keys=[order_id])
+
+  __table_args__ = (
+      # Stale pending payments for the reconciler, oldest first
+      db.Index('ix_payment_status_method_date', 'status', 'payment_method', 'payment_date'),
+  )
+
+class CatalogVersion(db.Model):
+  # Single row shared by all processes when CATALOG_CACHE_SHARED is enabled
+  id = db.Column(db.Integer, primary_key=True)
+  version = db.Column(db.Integer, nullable=False, default=0)
+
+class CatalogStockChange(db.Model):
+  # Products whose stock changed, for other processes' catalog caches to evict
+  id = db.Column(db.Integer, primary_key=True)
+  product_id = db.Column(db.Integer, nullable=False)
+  created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ServiceLease(db.Model):
+  # Which process may run a singleton background job until expires_at
+  name = db.Column(db.String(50), primary_key=True)
+  holder = db.Column(db.String(120), nullable=False)
+  expires_at = db.Column(db.DateTime, nullable=False)
+
+class MpesaCallback(db.Model):
+  # Raw STK callbacks, recorded before they are applied to payments
+  id = db.Column(db.Integer, primary_key=True)
+  dedupe_key = db.Column(db.String(120), unique=True, nullable=False)  # CheckoutRequestID:ResultCode
+  checkout_request_id = db.Column(db.String(100))
+  result_code = db.Column(db.String(10))
+  body = db.Column(db.Text, nullable=False)
+  received_at = db.Column(db.DateTime, default=datetime.utcnow)
+  processed_at = db.Column(db.DateTime, index=True)
+
+class OutboxEmail(db.Model):
+  # Emails waiting to be sent by the background outbox sender
+  id = db.Column(db.Integer, primary_key=True)
+  subject = db.Column(db.String(255), nullable=False)
+  body = db.Column(db.Text, nullable=False)
+  html_body = db.Column(db.Text)
+  recipient = db.Column(db.String(255))
+  reply_to = db.Column(db.String(255))
+  status = db.Column(db.String(20), nullable=False, default='pending')  # 'pending', 'sending', 'sent', 'failed'
+  attempts = db.Column(db.Integer, nullable=False, default=0)
+  next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+  claim_token = db.Column(db.String(32))
+  claimed_at = db.Column(db.DateTime)
+  last_error = db.Column(db.Text)
+  created_at = db.Column(db.DateTime, default=datetime.utcnow)
+  sent_at = db.Column(db.DateTime)
+
+  __table_args__ = (
+      db.Index('ix_outbox_email_status_next_attempt_at', 'status', 'next_attempt_at'),
+  )
+
+class StoredImage(db.Model):
+  # Content-addressed upload (sha256.ext) and how many products use it
+  filename = db.Column(db.String(80), primary_key=True)
+  refcount = db.Column(db.Integer, nullable=False, default=0)
+  size = db.Column(db.Integer)
+  created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ProductImport(db.Model):
+  # Bulk product upload processed in the background by product_import.ProductImporter
+  id = db.Column(db.Integer, primary_key=True)
+  vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=False, index=True)
+  format = db.Column(db.String(10), nullable=False)  # 'csv' or 'ndjson'
+  path = db.Column(db.String(255), nullable=False)
+  status = db.Column(db.String(20), nullable=False, default='queued')  # 'queued', 'running', 'completed', 'failed'
+  rows_processed = db.Column(db.Integer, nullable=False, default=0)
+  rows_imported = db.Column(db.Integer, nullable=False, default=0)
+  rows_failed = db.Column(db.Integer, nullable=False, default=0)
+  error = db.Column(db.Text)
+  created_at = db.Column(db.DateTime, default=datetime.utcnow)
+  started_at = db.Column(db.DateTime)
+  updated_at = db.Column(db.DateTime)
+  finished_at = db.Column(db.DateTime)
+
+  __table_args__ = (
+      db.Index('ix_product_import_status_updated_at', 'status', 'updated_at'),
+  )
+
+class ProductImportError(db.Model):
+  # A rejected row of a product import; line is the line number in the uploaded file
+  id = db.Column(db.Integer, primary_key=True)
+  import_id = db.Column(db.Integer, db.ForeignKey('product_import.id'), nullable=False)
+  line = db.Column(db.Integer, nullable=False)
+  message = db.Column(db.String(255), nullable=False)
+
+  __table_args__ = (
+      db.Index('ix_product_import_error_import_id_id', 'import_id', 'id'),
+  )
+
+class VendorSalesDaily(db.Model):
+  # Units and revenue per vendor, product and day, kept current by sales_rollups.mark_order_paid
+  vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), primary_key=True)
+  day = db.Column(db.Date, primary_key=True)
+  product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+  units = db.Column(db.Integer, nullable=False, default=0)
+  revenue = db.Column(db.Float, nullable=False, default=0)
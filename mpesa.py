@@ -1,10 +1,14 @@
 import requests
+from requests.adapters import HTTPAdapter
 import base64
 import json
+import threading
+import time
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 import logging
+from metrics import histogram
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +17,11 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Refresh the access token this long before Safaricom says it expires
+TOKEN_REFRESH_MARGIN = 60
+
+daraja_latency = histogram('daraja_request_seconds', 'Latency of Daraja API calls', ['operation', 'outcome'])
+
 class MpesaAPI:
     def __init__(self):
         # Get credentials from environment variables with fallbacks
@@ -21,6 +30,7 @@ class MpesaAPI:
         self.business_shortcode = os.getenv('MPESA_BUSINESS_SHORTCODE', '174379')  # Default sandbox shortcode
         self.passkey = os.getenv('MPESA_PASSKEY', 'bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919')  # Default sandbox passkey
         self.callback_url = os.getenv('MPESA_CALLBACK_URL', 'https://e5bd-102-213-48-10.ngrok-free.app')
+        self.timeout = float(os.getenv('MPESA_TIMEOUT', 30))
         
         # Log configuration
         logger.info(f"M-Pesa API initialized with: shortcode={self.business_shortcode}, callback={self.callback_url}")
@@ -31,26 +41,57 @@ class MpesaAPI:
         self.access_token_url = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"
         self.stk_push_url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
         self.query_url = "https://sandbox.safaricom.co.ke/mpesa/stkpushquery/v1/query"
+
+        # Static values computed once instead of on every call
+        self.simulated = not self.consumer_key or not self.consumer_secret
+        auth = base64.b64encode(f"{self.consumer_key}:{self.consumer_secret}".encode()).decode("utf-8")
+        self.basic_auth_header = {"Authorization": f"Basic {auth}"}
+
+        # Keep-alive connections to Daraja are reused across payments
+        pool_size = int(os.getenv('MPESA_POOL_SIZE', 10))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+
+        # Cached OAuth token; the lock makes concurrent refreshes single-flight
+        self._access_token = None
+        self._token_expires_at = 0
+        self._token_lock = threading.Lock()
         
     def get_access_token(self):
-        """Get OAuth access token from Safaricom"""
+        """Get OAuth access token from Safaricom, reusing the cached one until it is about to expire"""
+        # For testing without actual credentials
+        if self.simulated:
+            return "simulated-access-token-for-testing"
+
+        token = self._access_token
+        if token and time.monotonic() < self._token_expires_at:
+            return token
+
+        with self._token_lock:
+            # Another thread may have refreshed the token while we waited
+            if self._access_token and time.monotonic() < self._token_expires_at:
+                return self._access_token
+            return self._refresh_access_token()
+
+    def invalidate_access_token(self):
+        """Drop the cached token, e.g. after Safaricom rejected it"""
+        with self._token_lock:
+            self._access_token = None
+            self._token_expires_at = 0
+
+    def _refresh_access_token(self):
         try:
-            # For testing without actual credentials
-            if not self.consumer_key or not self.consumer_secret:
-                logger.warning("Using simulated access token due to missing credentials")
-                return "simulated-access-token-for-testing"
-                
-            auth = base64.b64encode(f"{self.consumer_key}:{self.consumer_secret}".encode()).decode("utf-8")
-            headers = {
-                "Authorization": f"Basic {auth}"
-            }
             logger.info(f"Requesting access token from: {self.access_token_url}")
-            response = requests.get(self.access_token_url, headers=headers)
+            response = self._request('token', 'GET', self.access_token_url, headers=self.basic_auth_header)
             response_data = response.json()
             
             if 'access_token' in response_data:
                 logger.info("Access token obtained successfully")
-                return response_data['access_token']
+                expires_in = int(response_data.get('expires_in', 3599))
+                self._access_token = response_data['access_token']
+                self._token_expires_at = time.monotonic() + max(expires_in - TOKEN_REFRESH_MARGIN, 0)
+                return self._access_token
             else:
                 logger.error(f"Error getting access token: {response_data}")
                 return None
@@ -58,6 +99,17 @@ class MpesaAPI:
             logger.exception(f"Exception getting access token: {str(e)}")
             return None
     
+    def _request(self, operation, method, url, **kwargs):
+        """Send a request to Daraja over the pooled session and record its latency"""
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            outcome = str(response.status_code)
+            return response
+        finally:
+            daraja_latency.observe(time.perf_counter() - started, operation=operation, outcome=outcome)
+
     def generate_password(self):
         """Generate the password for the STK push"""
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
@@ -77,7 +129,7 @@ class MpesaAPI:
             logger.info(f"Initiating STK push for phone: {phone_number}, amount: {amount}")
             
             # For testing without actual API calls
-            if not self.consumer_key or not self.consumer_secret:
+            if self.simulated:
                 logger.warning("Using simulated STK push due to missing credentials")
                 return {
                     "success": True,
@@ -121,7 +173,9 @@ class MpesaAPI:
             logger.info(f"STK push payload: {json.dumps(payload)}")
             
             # Make the request
-            response = requests.post(self.stk_push_url, json=payload, headers=headers)
+            response = self._request('stk_push', 'POST', self.stk_push_url, json=payload, headers=headers)
+            if response.status_code == 401:
+                self.invalidate_access_token()
             response_data = response.json()
             logger.info(f"STK push response: {json.dumps(response_data)}")
             
@@ -149,7 +203,7 @@ class MpesaAPI:
         """Query the status of an STK push transaction"""
         try:
             # For testing without actual API calls
-            if not self.consumer_key or not self.consumer_secret:
+            if self.simulated:
                 logger.warning("Using simulated query response due to missing credentials")
                 return {
                     "success": True,
@@ -183,7 +237,9 @@ class MpesaAPI:
             }
             
             # Make the request
-            response = requests.post(self.query_url, json=payload, headers=headers)
+            response = self._request('stk_query', 'POST', self.query_url, json=payload, headers=headers)
+            if response.status_code == 401:
+                self.invalidate_access_token()
             response_data = response.json()
             
             if response.status_code == 200:
@@ -205,3 +261,17 @@ class MpesaAPI:
                 "message": f"Exception: {str(e)}"
             }
 
+_mpesa_api = None
+_mpesa_api_pid = None
+_mpesa_api_lock = threading.Lock()
+
+def get_mpesa_api():
+    """Return the process-wide M-Pesa client, creating it on first use"""
+    global _mpesa_api, _mpesa_api_pid
+    # A forked process must not write to the parent's pooled TLS connections
+    if _mpesa_api_pid != os.getpid():
+        with _mpesa_api_lock:
+            if _mpesa_api_pid != os.getpid():
+                _mpesa_api = MpesaAPI()
+                _mpesa_api_pid = os.getpid()
+    return _mpesa_api
@@ -0,0 +1,192 @@
+import os
+import json
+import threading
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import update, exists, or_
+from sqlalchemy.dialects import sqlite, postgresql
+from extensions import db
+from models import MpesaCallback, Payment, Order
+from payment_status import apply_mpesa_result
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+callbacks_received = counter('mpesa_callbacks_received_total', 'M-Pesa callbacks received', ['duplicate'])
+callbacks_applied = counter('mpesa_callbacks_applied_total', 'Recorded M-Pesa callbacks applied to payments', ['outcome'])
+callback_apply_lag = histogram('mpesa_callback_apply_lag_seconds', 'Time from receiving a callback to applying it')
+
+
+def record_callback(callback_data):
+    """
+    Store a raw STK callback unless the same result was already recorded.
+
+    Safaricom retries callbacks, so the dedupe key is the CheckoutRequestID
+    together with the ResultCode; the insert is a no-op for a repeat.
+
+    Args:
+        callback_data (dict): Parsed callback body
+
+    Returns:
+        bool: True if this is the first time the callback was seen
+    """
+    stk_callback = callback_data.get('Body', {}).get('stkCallback', {})
+    checkout_request_id = stk_callback.get('CheckoutRequestID')
+    result_code = stk_callback.get('ResultCode')
+    values = {
+        'dedupe_key': f"{checkout_request_id}:{result_code}",
+        'checkout_request_id': checkout_request_id,
+        'result_code': None if result_code is None else str(result_code),
+        'body': json.dumps(callback_data),
+        'received_at': datetime.utcnow(),
+    }
+
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        statement = sqlite.insert(MpesaCallback).values(**values).on_conflict_do_nothing()
+    elif dialect == 'postgresql':
+        statement = postgresql.insert(MpesaCallback).values(**values).on_conflict_do_nothing()
+    else:
+        if MpesaCallback.query.filter_by(dedupe_key=values['dedupe_key']).first():
+            return False
+        statement = MpesaCallback.__table__.insert().values(**values)
+
+    result = db.session.execute(statement)
+    db.session.commit()
+    inserted = result.rowcount == 1
+    callbacks_received.inc(duplicate='false' if inserted else 'true')
+    return inserted
+
+
+def extract_receipt(stk_callback):
+    for item in stk_callback.get('CallbackMetadata', {}).get('Item', []):
+        if item.get('Name') == 'MpesaReceiptNumber':
+            return item.get('Value')
+    return None
+
+
+class CallbackProcessor:
+    """
+    Applies recorded callbacks to payments and orders in batches.
+
+    The callback endpoint only inserts and wakes this processor, so Safaricom
+    is acknowledged right away. The processor also polls, which picks up
+    callbacks recorded by other processes.
+    """
+
+    def __init__(self, batch_size=100, poll_interval=1.0, payment_wait=60):
+        self.app = None
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        # How long a callback may wait for the dispatcher to store its checkout request id
+        self.payment_wait = payment_wait
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('MPESA_CALLBACK_BATCH_SIZE', self.batch_size)
+
+    def notify(self):
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        # Threads do not survive fork, so each process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wakeup = threading.Event()
+            thread = threading.Thread(target=self._loop, name='mpesa-callbacks', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    # Keep going while full batches come back
+                    while self.process_batch() == self.batch_size:
+                        pass
+            except Exception as e:
+                logger.exception(f"Error applying M-Pesa callbacks: {str(e)}")
+
+    def process_batch(self):
+        """
+        Apply one batch of unprocessed callbacks in a single transaction.
+
+        Returns:
+            int: Number of callbacks marked processed
+        """
+        now = datetime.utcnow()
+        # Young callbacks without a payment yet are left out of the batch,
+        # so a run of them cannot hold up the callbacks queued behind
+        has_payment = exists().where(Payment.mpesa_checkout_request_id == MpesaCallback.checkout_request_id)
+        try:
+            callbacks = MpesaCallback.query.filter(
+                MpesaCallback.processed_at.is_(None),
+                or_(has_payment,
+                    MpesaCallback.received_at.is_(None),
+                    MpesaCallback.received_at < now - timedelta(seconds=self.payment_wait))
+            ).order_by(MpesaCallback.id).limit(self.batch_size).all()
+            if not callbacks:
+                return 0
+
+            checkout_ids = {c.checkout_request_id for c in callbacks if c.checkout_request_id}
+            payments = {
+                p.mpesa_checkout_request_id: p
+                for p in Payment.query.filter(Payment.mpesa_checkout_request_id.in_(checkout_ids)).all()
+            }
+            orders = {
+                o.id: o
+                for o in Order.query.filter(Order.id.in_({p.order_id for p in payments.values()})).all()
+            }
+
+            processed = []
+            for callback in callbacks:
+                payment = payments.get(callback.checkout_request_id)
+                if payment is None:
+                    if callback.received_at and now - callback.received_at < timedelta(seconds=self.payment_wait):
+                        # The STK dispatcher may not have stored the checkout request id yet
+                        continue
+                    logger.error(f"Payment not found for checkout request ID: {callback.checkout_request_id}")
+                    outcome = 'unknown_payment'
+                elif payment.status != 'pending':
+                    # A different result for a payment that is already settled
+                    outcome = 'skipped'
+                else:
+                    stk_callback = json.loads(callback.body).get('Body', {}).get('stkCallback', {})
+                    apply_mpesa_result(
+                        payment,
+                        orders.get(payment.order_id),
+                        callback.result_code,
+                        stk_callback.get('ResultDesc'),
+                        receipt=extract_receipt(stk_callback),
+                        details=callback.body
+                    )
+                    outcome = 'applied'
+                processed.append(callback.id)
+                callbacks_applied.inc(outcome=outcome)
+                if callback.received_at:
+                    callback_apply_lag.observe((now - callback.received_at).total_seconds())
+
+            if processed:
+                db.session.execute(
+                    update(MpesaCallback)
+                    .where(MpesaCallback.id.in_(processed))
+                    .values(processed_at=now)
+                    .execution_options(synchronize_session=False)
+                )
+            db.session.commit()
+            return len(processed)
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+callback_processor = CallbackProcessor()
@@ -0,0 +1,123 @@
+import os
+import queue
+import threading
+import time
+import logging
+from extensions import db
+from models import Payment
+from mpesa import get_mpesa_api
+from metrics import counter, gauge, histogram
+
+logger = logging.getLogger(__name__)
+
+stk_dispatched = counter('mpesa_stk_dispatched_total', 'STK pushes sent by the dispatcher', ['result'])
+stk_rejected = counter('mpesa_stk_rejected_total', 'STK pushes rejected because the dispatch queue was full')
+stk_queue_wait = histogram('mpesa_stk_queue_wait_seconds', 'Time STK pushes spent waiting in the dispatch queue')
+stk_dispatch_latency = histogram('mpesa_stk_dispatch_seconds', 'Time from enqueueing an STK push to recording its result')
+
+
+class StkPushDispatcher:
+    """
+    Sends STK pushes from a bounded pool of background threads.
+
+    PaymentResource.post writes the pending Payment and enqueues it here, so
+    the HTTP worker is free as soon as the row is committed. The queue is
+    bounded; when it is full, submit() refuses the job instead of letting a
+    Daraja slowdown pile up unbounded work.
+    """
+
+    def __init__(self, max_workers=4, max_queue=200):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.app = None
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+        gauge('mpesa_stk_queue_depth', 'STK pushes waiting to be dispatched',
+              function=lambda: self._queue.qsize() if self._queue is not None else 0)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.get('MPESA_DISPATCH_WORKERS', self.max_workers)
+        self.max_queue = app.config.get('MPESA_DISPATCH_QUEUE_SIZE', self.max_queue)
+
+    def submit(self, payment_id, phone_number, amount, account_reference, transaction_desc):
+        """
+        Queue an STK push for a pending payment.
+
+        Returns:
+            bool: False if the queue is full and the push was not accepted
+        """
+        self._ensure_started()
+        job = (payment_id, phone_number, amount, account_reference, transaction_desc, time.monotonic())
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            stk_rejected.inc()
+            logger.warning(f"STK dispatch queue full, rejecting payment {payment_id}")
+            return False
+        return True
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so each process starts its own workers
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self.max_queue)
+            for i in range(self.max_workers):
+                thread = threading.Thread(target=self._worker, name=f'stk-dispatch-{i}', daemon=True)
+                thread.start()
+            self._pid = os.getpid()
+            logger.info(f"Started {self.max_workers} STK dispatch workers")
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._dispatch(*job)
+            except Exception as e:
+                logger.exception(f"Error dispatching STK push: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def _dispatch(self, payment_id, phone_number, amount, account_reference, transaction_desc, enqueued_at):
+        stk_queue_wait.observe(time.monotonic() - enqueued_at)
+
+        logger.info(f"Initiating M-Pesa STK push: payment_id={payment_id}, phone={phone_number}, amount={amount}")
+        try:
+            result = get_mpesa_api().initiate_stk_push(
+                phone_number=phone_number,
+                amount=amount,
+                account_reference=account_reference,
+                transaction_desc=transaction_desc
+            )
+        except Exception as e:
+            logger.exception(f"M-Pesa API error: {str(e)}")
+            result = {'success': False, 'message': str(e)}
+        logger.info(f"M-Pesa STK push result for payment {payment_id}: {result}")
+
+        with self.app.app_context():
+            try:
+                payment = db.session.get(Payment, payment_id)
+                if payment is None:
+                    logger.error(f"Payment {payment_id} disappeared before its STK push completed")
+                    return
+                if result['success']:
+                    payment.mpesa_checkout_request_id = result['checkout_request_id']
+                else:
+                    payment.status = 'failed'
+                    payment.mpesa_result_desc = result['message']
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+        stk_dispatched.inc(result='success' if result['success'] else 'failed')
+        stk_dispatch_latency.observe(time.monotonic() - enqueued_at)
+
+
+stk_dispatcher = StkPushDispatcher()
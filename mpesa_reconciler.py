@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask.cli import with_appcontext
+from extensions import db
+from models import Payment, Order
+from mpesa import get_mpesa_api
+from payment_status import apply_mpesa_result
+from leases import acquire_lease, release_lease, process_holder
+from metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+reconcile_queries = counter('mpesa_reconcile_queries_total', 'STK status queries made by the reconciler', ['result'])
+reconcile_updates = counter('mpesa_reconcile_updates_total', 'Payments settled by the reconciler', ['status'])
+reconcile_duration = histogram('mpesa_reconcile_run_seconds', 'Duration of one reconciler pass')
+
+LEASE_NAME = 'mpesa-reconciler'
+
+
+class RateLimiter:
+    """Spaces calls evenly so they never exceed a fixed rate across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(self._next, now) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class PaymentReconciler:
+    """
+    Settles M-Pesa payments whose callback never arrived.
+
+    Each pass selects pending payments older than a threshold, queries their
+    status through the shared MpesaAPI with bounded concurrency and a rate
+    budget, and applies the results in batched commits.
+
+    Passes do not claim payments, so only one may run at a time: the loop,
+    which starts in every worker process, and the CLI command both take the
+    'mpesa-reconciler' lease first.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.interval = 0
+        self.min_age = 120
+        self.dispatch_timeout = 900
+        self.max_payments = 500
+        self.concurrency = 4
+        self.rate = 5.0
+        self.batch_size = 50
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('MPESA_RECONCILE_INTERVAL', self.interval)
+        self.min_age = app.config.get('MPESA_RECONCILE_MIN_AGE', self.min_age)
+        self.dispatch_timeout = app.config.get('MPESA_RECONCILE_DISPATCH_TIMEOUT', self.dispatch_timeout)
+        self.max_payments = app.config.get('MPESA_RECONCILE_MAX_PAYMENTS', self.max_payments)
+        self.concurrency = app.config.get('MPESA_RECONCILE_CONCURRENCY', self.concurrency)
+        self.rate = app.config.get('MPESA_RECONCILE_RATE', self.rate)
+
+    def start(self):
+        """Run reconciler passes every MPESA_RECONCILE_INTERVAL seconds in a background thread"""
+        if not self.interval:
+            return
+        with self._lock:
+            # Threads do not survive fork, so each process starts its own
+            if self._pid == os.getpid():
+                return
+            thread = threading.Thread(target=self._loop, name='mpesa-reconciler', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+        logger.info(f"M-Pesa reconciler running every {self.interval}s")
+
+    def lease_ttl(self):
+        # Outlasts the sleep plus the longest pass, so a live holder never loses it
+        longest_pass = self.max_payments / self.rate if self.rate else 0
+        return self.interval + longest_pass + 60
+
+    def _loop(self):
+        holder = process_holder()
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self.app.app_context():
+                    if acquire_lease(LEASE_NAME, holder, self.lease_ttl()):
+                        self.run_once()
+            except Exception as e:
+                logger.exception(f"Error reconciling M-Pesa payments: {str(e)}")
+
+    def run_once(self):
+        """
+        Run one reconciliation pass. Must be called inside an app context.
+
+        Returns:
+            int: Number of payments whose status changed
+        """
+        started = time.monotonic()
+        now = datetime.utcnow()
+        try:
+            abandoned = self._fail_undispatched(now)
+
+            stale = self.stale_query(now).all()
+            db.session.rollback()  # Do not hold a read transaction while Daraja answers
+            if not stale:
+                return abandoned
+
+            logger.info(f"Reconciling {len(stale)} pending M-Pesa payments")
+            results = self._query_all(stale)
+            return abandoned + self._apply(results)
+        finally:
+            reconcile_duration.observe(time.monotonic() - started)
+
+    def stale_query(self, now):
+        """Pending payments old enough to query, oldest first; uses ix_payment_status_method_date"""
+        return db.session.query(Payment.id, Payment.mpesa_checkout_request_id).filter(
+            Payment.status == 'pending',
+            Payment.payment_method == 'mpesa',
+            Payment.mpesa_checkout_request_id.isnot(None),
+            Payment.payment_date < now - timedelta(seconds=self.min_age)
+        ).order_by(Payment.payment_date).limit(self.max_payments)
+
+    def undispatched_query(self, now):
+        # A pending payment with no checkout request id after this long lost its
+        # STK push (e.g. the process died with it queued) and can never complete
+        return Payment.query.filter(
+            Payment.status == 'pending',
+            Payment.payment_method == 'mpesa',
+            Payment.mpesa_checkout_request_id.is_(None),
+            Payment.payment_date < now - timedelta(seconds=self.dispatch_timeout)
+        ).limit(self.max_payments)
+
+    def _fail_undispatched(self, now):
+        payments = self.undispatched_query(now).all()
+        for payment in payments:
+            payment.status = 'failed'
+            payment.mpesa_result_desc = 'STK push was never dispatched'
+        if payments:
+            db.session.commit()
+            reconcile_updates.inc(len(payments), status='failed')
+            logger.warning(f"Marked {len(payments)} undispatched M-Pesa payments as failed")
+        return len(payments)
+
+    def _query_all(self, stale):
+        mpesa_api = get_mpesa_api()
+        limiter = RateLimiter(self.rate)
+
+        def query(payment_id, checkout_request_id):
+            limiter.acquire()
+            result = mpesa_api.query_stk_status(checkout_request_id)
+            reconcile_queries.inc(result='success' if result['success'] else 'error')
+            return payment_id, result
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = [executor.submit(query, payment_id, checkout_id) for payment_id, checkout_id in stale]
+            return [future.result() for future in futures]
+
+    def _apply(self, results):
+        # Daraja answers with an error while the customer has not responded yet;
+        # those payments stay pending for the next pass
+        settled = [(payment_id, result['response']) for payment_id, result in results if result['success']]
+        changed = 0
+        for start in range(0, len(settled), self.batch_size):
+            batch = dict(settled[start:start + self.batch_size])
+            payments = Payment.query.filter(Payment.id.in_(batch), Payment.status == 'pending').all()
+            orders = {o.id: o for o in Order.query.filter(Order.id.in_({p.order_id for p in payments})).all()}
+            for payment in payments:
+                response_data = batch[payment.id]
+                if apply_mpesa_result(payment, orders.get(payment.order_id),
+                                      response_data.get('ResultCode'), response_data.get('ResultDesc', '')):
+                    reconcile_updates.inc(status=payment.status)
+                    changed += 1
+            db.session.commit()
+        return changed
+
+
+payment_reconciler = PaymentReconciler()
+
+
+@click.command('reconcile-payments')
+@with_appcontext
+def reconcile_payments_command():
+    """Run one pass of the M-Pesa payment reconciler."""
+    holder = process_holder()
+    if not acquire_lease(LEASE_NAME, holder, payment_reconciler.lease_ttl()):
+        click.echo('Another process is reconciling payments; skipping this pass')
+        return
+    try:
+        changed = payment_reconciler.run_once()
+    finally:
+        release_lease(LEASE_NAME, holder)
+    click.echo(f'Updated {changed} payments')
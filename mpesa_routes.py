@@ -2,7 +2,8 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import Payment, Order
 from extensions import db
-import json
+from payment_status import apply_mpesa_result
+from mpesa_callbacks import record_callback, callback_processor
 import logging
 
 # Set up logging
@@ -15,65 +16,23 @@ mpesa_bp = Blueprint('mpesa', __name__)
 def mpesa_callback():
     """Handle M-Pesa callback from Safaricom"""
     try:
-        # Log the callback data
-        callback_data = request.json
-        logger.info(f"M-Pesa callback received: {json.dumps(callback_data)}")
-        
-        # Extract the necessary information from the callback
-        body = callback_data.get('Body', {})
-        stkCallback = body.get('stkCallback', {})
-        checkout_request_id = stkCallback.get('CheckoutRequestID')
-        result_code = stkCallback.get('ResultCode')
-        result_desc = stkCallback.get('ResultDesc')
-        
-        # Find the payment with this checkout request ID
-        payment = Payment.query.filter_by(mpesa_checkout_request_id=checkout_request_id).first()
-        
-        if not payment:
-            logger.error(f"Payment not found for checkout request ID: {checkout_request_id}")
-            return jsonify({"success": False, "message": "Payment not found"}), 404
-        
-        # Update the payment status based on the result code
-        if result_code == 0:  # Success
-            # Extract the transaction details
-            callback_metadata = stkCallback.get('CallbackMetadata', {})
-            items = callback_metadata.get('Item', [])
-            
-            mpesa_receipt = None
-            for item in items:
-                if item.get('Name') == 'MpesaReceiptNumber':
-                    mpesa_receipt = item.get('Value')
-                    break
-            
-            # Update payment
-            payment.status = 'completed'
-            payment.mpesa_receipt = mpesa_receipt
-            payment.mpesa_result_code = str(result_code)
-            payment.mpesa_result_desc = result_desc
-            payment.payment_details = json.dumps(callback_data)
-            
-            # Update order status
-            order = Order.query.get(payment.order_id)
-            if order:
-                order.status = 'paid'
-            
-            db.session.commit()
-            logger.info(f"Payment {payment.id} updated to completed")
-            
-            return jsonify({"success": True, "message": "Payment completed successfully"}), 200
+        callback_data = request.get_json(silent=True)
+        if not isinstance(callback_data, dict):
+            logger.error("M-Pesa callback with invalid JSON body")
+            return jsonify({"success": False, "message": "Invalid callback body"}), 400
+
+        # Record the raw callback in one cheap insert and acknowledge right away;
+        # the callback processor applies it to the payment in the background
+        if record_callback(callback_data):
+            callback_processor.notify()
+            logger.info("M-Pesa callback recorded")
         else:
-            # Payment failed
-            payment.status = 'failed'
-            payment.mpesa_result_code = str(result_code)
-            payment.mpesa_result_desc = result_desc
-            payment.payment_details = json.dumps(callback_data)
-            
-            db.session.commit()
-            logger.info(f"Payment {payment.id} marked as failed: {result_desc}")
-            
-            return jsonify({"success": True, "message": "Payment failure recorded"}), 200
+            logger.info("Duplicate M-Pesa callback ignored")
+
+        return jsonify({"success": True, "message": "Callback received"}), 200
             
     except Exception as e:
+        db.session.rollback()
         logger.exception(f"Error processing M-Pesa callback: {str(e)}")
         return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
 
@@ -81,7 +40,7 @@ def mpesa_callback():
 @jwt_required()
 def query_payment_status(checkout_request_id):
     """Query the status of an M-Pesa payment"""
-    from mpesa import MpesaAPI
+    from mpesa import get_mpesa_api
     
     try:
         # Find the payment
@@ -108,28 +67,13 @@ def query_payment_status(checkout_request_id):
             }), 200
         
         # Query the status from M-Pesa
-        mpesa_api = MpesaAPI()
+        mpesa_api = get_mpesa_api()
         result = mpesa_api.query_stk_status(checkout_request_id)
         
         # Update payment status if needed
         if result['success']:
             response_data = result['response']
-            result_code = response_data.get('ResultCode')
-            
-            if result_code == 0:  # Success
-                payment.status = 'completed'
-                payment.mpesa_result_code = str(result_code)
-                payment.mpesa_result_desc = response_data.get('ResultDesc', '')
-                
-                # Update order status
-                if order:
-                    order.status = 'paid'
-                
-                db.session.commit()
-            elif result_code:  # Failed
-                payment.status = 'failed'
-                payment.mpesa_result_code = str(result_code)
-                payment.mpesa_result_desc = response_data.get('ResultDesc', '')
+            if apply_mpesa_result(payment, order, response_data.get('ResultCode'), response_data.get('ResultDesc', '')):
                 db.session.commit()
         
         return jsonify({
@@ -0,0 +1,63 @@
+from sqlalchemy.orm import selectinload, raiseload
+from models import Order, OrderItem, Payment, Product
+from pagination import paginate_by_id
+
+# Orders page, their items, the items' products and the orders' payments,
+# however many orders are on the page
+ORDER_HISTORY_QUERIES = 4
+
+
+def order_history_query(user_id):
+    """
+    A user's orders with items, products and payments batch-loaded.
+
+    Each relationship is fetched with one SELECT ... WHERE ... IN (...) for
+    the whole page, and any other lazy load raises instead of quietly adding
+    a query per order.
+    """
+    return Order.query.filter(Order.user_id == user_id).options(
+        selectinload(Order.items)
+        .load_only(OrderItem.product_id, OrderItem.quantity, OrderItem.price)
+        .selectinload(OrderItem.product)
+        .load_only(Product.name, Product.image_url),
+        selectinload(Order.payments)
+        .load_only(Payment.status, Payment.payment_method, Payment.mpesa_receipt, Payment.payment_date),
+        raiseload('*')
+    )
+
+
+def serialize_order(order):
+    # The latest attempt decides the payment status shown for the order
+    payment = order.payments[-1] if order.payments else None
+    return {
+        'id': order.id,
+        'status': order.status,
+        'total': order.total,
+        'items': [
+            {
+                'product_id': item.product_id,
+                'name': item.product.name if item.product else None,
+                'image_url': item.product.image_url if item.product else None,
+                'quantity': item.quantity,
+                'price': item.price,
+            }
+            for item in order.items
+        ],
+        'payment': {
+            'status': payment.status,
+            'payment_method': payment.payment_method,
+            'mpesa_receipt': payment.mpesa_receipt,
+            'payment_date': payment.payment_date.isoformat() if payment.payment_date else None,
+        } if payment else None,
+    }
+
+
+def order_history_page(user_id, limit, after):
+    """
+    One keyset page of a user's orders, newest last.
+
+    Returns:
+        tuple: (list of dicts, next_cursor or None)
+    """
+    orders, next_cursor = paginate_by_id(order_history_query(user_id), Order.id, limit, after)
+    return [serialize_order(order) for order in orders], next_cursor
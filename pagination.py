@@ -0,0 +1,92 @@
+import base64
+import json
+from flask import request
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue"""
+
+
+def encode_cursor(values):
+    """
+    Encode the sort key of the last row on a page into an opaque cursor.
+
+    Args:
+        values (dict): Sort key columns of the last row, e.g. {'id': 42}
+
+    Returns:
+        str: URL-safe cursor string
+    """
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor (str): Cursor string from a previous page
+
+    Returns:
+        dict: Sort key columns of the last row of the previous page
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise InvalidCursor('Invalid cursor')
+    if not isinstance(values, dict):
+        raise InvalidCursor('Invalid cursor')
+    return values
+
+
+def get_page_args():
+    """
+    Read the limit and cursor query parameters of the current request.
+
+    Returns:
+        tuple: (limit, cursor values or None)
+    """
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return limit, None
+
+    values = decode_cursor(cursor)
+    if not isinstance(values.get('id'), int):
+        raise InvalidCursor('Invalid cursor')
+    return limit, values
+
+
+def paginate_by_id(query, id_column, limit, after):
+    """
+    Fetch one keyset page ordered by id.
+
+    Each page is a range scan that starts right after the last id of the
+    previous page, so deep pages cost the same as the first one.
+
+    Args:
+        query: SQLAlchemy query to page through
+        id_column: Column to order and seek on
+        limit (int): Page size
+        after (dict, optional): Decoded cursor of the previous page
+
+    Returns:
+        tuple: (rows, next_cursor or None)
+    """
+    if after is not None:
+        query = query.filter(id_column > after['id'])
+
+    # Fetch one extra row to know whether there is a next page
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor({'id': rows[-1].id})
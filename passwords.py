@@ -0,0 +1,127 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import current_app, has_app_context
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+from metrics import counter, gauge, histogram
+
+DEFAULT_HASH_METHOD = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'
+
+verify_seconds = histogram('password_verify_seconds', 'Time from submitting a password check to its result',
+                           ['outcome'])
+verify_rejected = counter('password_verify_rejected_total', 'Password checks refused by admission control',
+                          ['reason'])
+
+
+def hash_method():
+    """The configured werkzeug hash method, e.g. 'pbkdf2:sha256:600000'"""
+    if has_app_context():
+        return current_app.config.get('PASSWORD_HASH_METHOD') or DEFAULT_HASH_METHOD
+    return DEFAULT_HASH_METHOD
+
+
+def _normalize(method):
+    # werkzeug leaves the iteration count out when it uses its default
+    if method.startswith('pbkdf2:') and method.count(':') == 1:
+        return f'{method}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=hash_method())
+
+
+def needs_rehash(password_hash):
+    """True if a stored hash was made with a different method or cost than the configured one"""
+    if not password_hash or '$' not in password_hash:
+        return True
+    return _normalize(password_hash.split('$', 1)[0]) != _normalize(hash_method())
+
+
+class VerifierBusy(Exception):
+    """Raised when a password check is refused because the pool is saturated"""
+
+
+class PasswordVerifier:
+    """
+    Checks passwords on a small dedicated thread pool.
+
+    hashlib's PBKDF2 releases the GIL, so the pool runs hashes in parallel
+    while capping how many cores a login storm can take from other
+    requests. Admission control bounds the work waiting for the pool: checks
+    beyond max_pending are refused at once, and a caller gives up after
+    timeout seconds, so logins fail fast with VerifierBusy instead of
+    piling up behind each other.
+    """
+
+    def __init__(self, workers=2, max_pending=32, timeout=5.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        gauge('password_verify_pending', 'Password checks queued or running', function=lambda: self._pending)
+
+    def init_app(self, app):
+        self.workers = app.config.get('PASSWORD_VERIFY_WORKERS', self.workers)
+        self.max_pending = app.config.get('PASSWORD_VERIFY_MAX_PENDING', self.max_pending)
+        self.timeout = app.config.get('PASSWORD_VERIFY_TIMEOUT', self.timeout)
+        # Recreate the pool and slots with the new sizes on next use
+        self._pid = None
+
+    def _pool(self):
+        # Threads do not survive fork, so each process creates its own pool
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-verify')
+                    self._slots = threading.BoundedSemaphore(self.max_pending)
+                    self._pending = 0
+                    self._pid = os.getpid()
+        return self._executor
+
+    def verify(self, password_hash, password):
+        """
+        Check a password against its stored hash on the pool.
+
+        Raises:
+            VerifierBusy: If too many checks are pending or the result takes
+                longer than the timeout
+        """
+        pool = self._pool()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            verify_rejected.inc(reason='full')
+            raise VerifierBusy('Too many password checks pending')
+        with self._pending_lock:
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            future = pool.submit(check_password_hash, password_hash, password)
+        except Exception:
+            self._release(slots)
+            raise
+        # The slot is held until the hash is done, even if the caller gives up
+        future.add_done_callback(lambda _: self._release(slots))
+        try:
+            valid = future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            verify_rejected.inc(reason='timeout')
+            verify_seconds.observe(time.perf_counter() - started, outcome='timeout')
+            raise VerifierBusy('Password check timed out')
+        verify_seconds.observe(time.perf_counter() - started, outcome='valid' if valid else 'invalid')
+        return valid
+
+    def _release(self, slots):
+        with self._pending_lock:
+            self._pending -= 1
+        slots.release()
+
+
+password_verifier = PasswordVerifier()
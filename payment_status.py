@@ -0,0 +1,45 @@
+import logging
+from sales_rollups import mark_order_paid
+
+logger = logging.getLogger(__name__)
+
+
+def apply_mpesa_result(payment, order, result_code, result_desc, receipt=None, details=None):
+    """
+    Apply an STK push result to a payment and its order.
+
+    Daraja reports ResultCode as an int in callbacks and as a string in
+    status queries, so both forms are accepted. The caller commits.
+
+    Args:
+        payment (Payment): Pending M-Pesa payment
+        order (Order, optional): Order the payment belongs to
+        result_code: ResultCode from Daraja; None means still processing
+        result_desc (str): ResultDesc from Daraja
+        receipt (str, optional): MpesaReceiptNumber of a successful payment
+        details (str, optional): Raw Daraja payload to keep on the payment
+
+    Returns:
+        bool: True if the payment status changed
+    """
+    if result_code is None or str(result_code) == '':
+        return False
+
+    result_code = str(result_code)
+    payment.mpesa_result_code = result_code
+    payment.mpesa_result_desc = result_desc
+    if receipt is not None:
+        payment.mpesa_receipt = receipt
+    if details is not None:
+        payment.payment_details = details
+
+    if result_code == '0':
+        payment.status = 'completed'
+        if order:
+            # Conditional, so a sale is counted once however many paths settle it
+            mark_order_paid(order, payment)
+        logger.info(f"Payment {payment.id} updated to completed")
+    else:
+        payment.status = 'failed'
+        logger.info(f"Payment {payment.id} marked as failed: {result_desc}")
+    return True
@@ -0,0 +1,351 @@
+import os
+import io
+import csv
+import json
+import math
+import uuid
+import shutil
+import threading
+import logging
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert, update, or_, and_
+from extensions import db, catalog_cache
+from models import Product, ProductImport, ProductImportError
+from image_store import HashingTemporaryFile
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+import_rows = counter('product_import_rows_total', 'Rows read by product imports', ['outcome'])
+
+# File extensions and content types accepted for each import format
+FORMAT_EXTENSIONS = {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}
+FORMAT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+REQUIRED_COLUMNS = ('name', 'price', 'stock')
+MAX_NAME_LENGTH = 100
+
+
+class ImportFailed(Exception):
+    """Raised when an import file cannot be read at all, e.g. a CSV without the required columns"""
+
+
+class RowError(ValueError):
+    """Raised for a row that is skipped and reported back to the vendor"""
+
+
+def import_folder():
+    folder = current_app.config.get('PRODUCT_IMPORT_FOLDER') or os.path.join(current_app.instance_path, 'imports')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def detect_format(requested=None, filename=None, content_type=None):
+    """
+    Work out the format of an uploaded import.
+
+    Args:
+        requested (str, optional): Format named by the client ('csv' or 'ndjson')
+        filename (str, optional): Name of the uploaded file
+        content_type (str, optional): Mimetype of the upload
+
+    Returns:
+        str: 'csv', 'ndjson' or None if it cannot be told
+    """
+    if requested:
+        return FORMAT_EXTENSIONS.get(requested.lower())
+    if filename and '.' in filename:
+        extension = filename.rsplit('.', 1)[1].lower()
+        if extension in FORMAT_EXTENSIONS:
+            return FORMAT_EXTENSIONS[extension]
+    return FORMAT_CONTENT_TYPES.get(content_type)
+
+
+def create_import(vendor_id, stream, file_format):
+    """
+    Store an uploaded file and queue it for the background importer.
+
+    Uploads sent as multipart form data were already streamed to disk by
+    UploadRequest and are hard-linked into place; a raw request body is
+    copied in chunks. Either way the file never sits in memory.
+
+    Args:
+        vendor_id (int): Vendor the products will belong to
+        stream: File object holding the upload
+        file_format (str): 'csv' or 'ndjson'
+
+    Returns:
+        ProductImport: The queued job
+    """
+    path = os.path.join(import_folder(), f'{uuid.uuid4().hex}.{file_format}')
+    if isinstance(stream, HashingTemporaryFile):
+        stream.flush()
+        try:
+            os.link(stream.name, path)
+        except OSError:
+            shutil.copyfile(stream.name, path)
+        stream.close()
+    else:
+        with open(path, 'wb') as target:
+            shutil.copyfileobj(stream, target, 64 * 1024)
+
+    job = ProductImport(vendor_id=vendor_id, format=file_format, path=path, status='queued',
+                        rows_processed=0, rows_imported=0, rows_failed=0)
+    db.session.add(job)
+    db.session.commit()
+    product_importer.notify()
+    return job
+
+
+def read_rows(file, file_format):
+    """
+    Yield (line number, raw row) for each record of an import file.
+
+    The file is read one line at a time. A row that cannot be parsed is
+    yielded as a RowError instead of a dict.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='' if file_format == 'csv' else None)
+    if file_format == 'csv':
+        reader = csv.DictReader(text)
+        columns = reader.fieldnames or []
+        missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+        if missing:
+            raise ImportFailed(f"CSV header is missing required column(s): {', '.join(missing)}")
+        for row in reader:
+            if None in row:
+                yield reader.line_num, RowError('Row has more fields than the header')
+            else:
+                yield reader.line_num, row
+        return
+
+    for line, raw in enumerate(text, 1):
+        if not raw.strip():
+            continue
+        try:
+            row = json.loads(raw)
+        except ValueError:
+            yield line, RowError('Invalid JSON')
+            continue
+        if not isinstance(row, dict):
+            yield line, RowError('Each line must be a JSON object')
+        else:
+            yield line, row
+
+
+def validate_row(row):
+    """
+    Check one import row and convert it to Product column values.
+
+    Raises:
+        RowError: If a field is missing or invalid
+    """
+    name = row.get('name')
+    if not isinstance(name, str) or not name.strip():
+        raise RowError('name is required')
+    name = name.strip()
+    if len(name) > MAX_NAME_LENGTH:
+        raise RowError(f'name must be at most {MAX_NAME_LENGTH} characters')
+
+    price = row.get('price')
+    try:
+        if isinstance(price, bool):
+            raise ValueError
+        price = float(price)
+    except (TypeError, ValueError):
+        raise RowError('price must be a number')
+    if not math.isfinite(price) or price < 0:
+        raise RowError('price must be a non-negative number')
+
+    stock = row.get('stock')
+    if isinstance(stock, float) and stock.is_integer():
+        stock = int(stock)
+    try:
+        if isinstance(stock, (bool, float)):
+            raise ValueError
+        stock = int(stock)
+    except (TypeError, ValueError):
+        raise RowError('stock must be a whole number')
+    if stock < 0:
+        raise RowError('stock must not be negative')
+
+    description = row.get('description') or ''
+    if not isinstance(description, str):
+        raise RowError('description must be text')
+
+    return {'name': name, 'description': description, 'price': price, 'stock': stock}
+
+
+class ProductImporter:
+    """
+    Runs queued product imports in a background thread.
+
+    Each file is parsed as a stream and written in batches: every batch of
+    products, its rejected rows and the job's progress counters commit in
+    one transaction, so memory stays flat and a job that dies part way
+    resumes after its last committed batch. Jobs are claimed with a
+    conditional update, so several processes can share the queue; a running
+    job whose progress has not moved for stale_after seconds is taken over.
+    """
+
+    def __init__(self, batch_size=500, poll_interval=5.0, stale_after=300, max_errors=1000):
+        self.app = None
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        # Rejected rows beyond this are counted but not stored
+        self.max_errors = max_errors
+        self._wakeup = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('PRODUCT_IMPORT_BATCH_SIZE', self.batch_size)
+        self.max_errors = app.config.get('PRODUCT_IMPORT_MAX_ERRORS', self.max_errors)
+
+    def notify(self):
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        # Threads do not survive fork, so each process starts its own
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._wakeup = threading.Event()
+            thread = threading.Thread(target=self._loop, name='product-import', daemon=True)
+            thread.start()
+            self._pid = os.getpid()
+
+    def _loop(self):
+        while True:
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+            try:
+                with self.app.app_context():
+                    while self.run_next():
+                        pass
+            except Exception as e:
+                logger.exception(f"Error running product imports: {str(e)}")
+
+    def run_next(self):
+        """
+        Claim and run one import.
+
+        Returns:
+            bool: True if a job was run
+        """
+        job = self._claim()
+        if job is None:
+            return False
+        self.run(job)
+        return True
+
+    def _claim(self):
+        stale = datetime.utcnow() - timedelta(seconds=self.stale_after)
+        candidate = ProductImport.query.filter(or_(
+            ProductImport.status == 'queued',
+            and_(ProductImport.status == 'running', ProductImport.updated_at < stale)
+        )).order_by(ProductImport.id).first()
+        if candidate is None:
+            db.session.rollback()
+            return None
+
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(ProductImport)
+            .where(ProductImport.id == candidate.id,
+                   ProductImport.status == candidate.status,
+                   or_(ProductImport.updated_at.is_(None), ProductImport.updated_at == candidate.updated_at))
+            .values(status='running', started_at=candidate.started_at or now, updated_at=now)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        db.session.commit()
+        if not claimed:
+            # Another process got there first; look again on the next pass
+            return None
+        db.session.refresh(candidate)
+        if candidate.rows_processed:
+            logger.info(f"Resuming product import {candidate.id} after row {candidate.rows_processed}")
+        return candidate
+
+    def run(self, job):
+        """Import every remaining row of a claimed job"""
+        job_id, vendor_id = job.id, job.vendor_id
+        stored_errors = db.session.query(ProductImportError.id).filter_by(import_id=job_id).count()
+        skip = job.rows_processed
+        products, errors = [], []
+        imported = 0
+        try:
+            with open(job.path, 'rb') as file:
+                for position, (line, row) in enumerate(read_rows(file, job.format)):
+                    if position < skip:
+                        continue
+                    try:
+                        if isinstance(row, RowError):
+                            raise row
+                        values = validate_row(row)
+                        values['vendor_id'] = vendor_id
+                        products.append(values)
+                    except RowError as e:
+                        errors.append({'import_id': job_id, 'line': line, 'message': str(e)})
+                    if len(products) + len(errors) >= self.batch_size:
+                        stored_errors = self._write_batch(job_id, products, errors, stored_errors)
+                        imported += len(products)
+                        products, errors = [], []
+            stored_errors = self._write_batch(job_id, products, errors, stored_errors)
+            imported += len(products)
+            self._finish(job_id, 'completed')
+        except Exception as e:
+            db.session.rollback()
+            if not isinstance(e, (ImportFailed, UnicodeDecodeError, csv.Error)):
+                logger.exception(f"Product import {job_id} failed: {str(e)}")
+            self._finish(job_id, 'failed', error=str(e))
+        finally:
+            if imported:
+                catalog_cache.invalidate()
+
+    def _write_batch(self, job_id, products, errors, stored_errors):
+        """Insert one batch and advance the job's counters in a single transaction"""
+        kept = errors[:max(0, self.max_errors - stored_errors)]
+        if products:
+            db.session.execute(insert(Product), products)
+        if kept:
+            db.session.execute(insert(ProductImportError), kept)
+        db.session.execute(
+            update(ProductImport)
+            .where(ProductImport.id == job_id)
+            .values(rows_processed=ProductImport.rows_processed + len(products) + len(errors),
+                    rows_imported=ProductImport.rows_imported + len(products),
+                    rows_failed=ProductImport.rows_failed + len(errors),
+                    updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        import_rows.inc(len(products), outcome='imported')
+        import_rows.inc(len(errors), outcome='failed')
+        return stored_errors + len(kept)
+
+    def _finish(self, job_id, status, error=None):
+        now = datetime.utcnow()
+        job = db.session.get(ProductImport, job_id)
+        job.status = status
+        job.error = error
+        job.updated_at = now
+        job.finished_at = now
+        db.session.commit()
+        try:
+            os.remove(job.path)
+        except FileNotFoundError:
+            pass
+        logger.info(f"Product import {job_id} {status}: {job.rows_imported} imported, {job.rows_failed} rejected")
+
+
+product_importer = ProductImporter()
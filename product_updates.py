@@ -0,0 +1,156 @@
+import math
+from sqlalchemy import select, update, case
+from extensions import db, catalog_cache
+from models import Product
+
+NOT_OWNED = 'Product not found or not owned by this vendor'
+
+
+class InvalidUpdate(ValueError):
+    """Raised for an item of a bulk update that cannot be applied"""
+
+
+def parse_update(item):
+    """
+    Validate one item of a bulk update.
+
+    Args:
+        item (dict): {'product_id', 'price'?, 'stock'?, 'stock_delta'?}
+
+    Returns:
+        dict: The item with only the fields to apply
+
+    Raises:
+        InvalidUpdate: If the item is malformed
+    """
+    if not isinstance(item, dict):
+        raise InvalidUpdate('Each update must be an object')
+    product_id = item.get('product_id')
+    if not isinstance(product_id, int) or isinstance(product_id, bool):
+        raise InvalidUpdate('product_id must be an integer')
+
+    change = {'product_id': product_id}
+    if item.get('price') is not None:
+        price = item['price']
+        if isinstance(price, bool) or not isinstance(price, (int, float)) or not math.isfinite(price) or price < 0:
+            raise InvalidUpdate('price must be a non-negative number')
+        change['price'] = float(price)
+    for field in ('stock', 'stock_delta'):
+        if item.get(field) is not None:
+            value = item[field]
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise InvalidUpdate(f'{field} must be an integer')
+            change[field] = value
+    if change.get('stock', 0) < 0:
+        raise InvalidUpdate('stock must not be negative')
+    if 'stock' in change and 'stock_delta' in change:
+        raise InvalidUpdate('Send either stock or stock_delta, not both')
+    if len(change) == 1:
+        raise InvalidUpdate('Nothing to update; send price, stock or stock_delta')
+    return change
+
+
+def _apply_stock_deltas(deltas):
+    """
+    Add each delta to its product's stock unless that would take it below zero.
+
+    Returns:
+        set: Ids of the products that were updated
+    """
+    new_stock = Product.stock + case(deltas, value=Product.id)
+    if db.engine.dialect.update_returning:
+        return set(db.session.execute(
+            update(Product)
+            .where(Product.id.in_(deltas), new_stock >= 0)
+            .values(stock=new_stock)
+            .returning(Product.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+
+    applied = set()
+    for product_id, delta in deltas.items():
+        result = db.session.execute(
+            update(Product)
+            .where(Product.id == product_id, Product.stock + delta >= 0)
+            .values(stock=Product.stock + delta)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            applied.add(product_id)
+    return applied
+
+
+def apply_updates(vendor_id, items):
+    """
+    Apply a vendor's bulk price and stock update in a single transaction.
+
+    Ownership of every product is checked with one query. Each field is then
+    written with one set-based UPDATE ... CASE statement for all products that
+    change it, so the number of statements does not grow with the batch.
+    Stock deltas are guarded so they never take stock below zero; an item
+    whose delta is rejected is left untouched.
+
+    Args:
+        vendor_id (int): Vendor making the change
+        items (list): Raw update items from the request
+
+    Returns:
+        list: One result per item, in request order
+    """
+    results = [None] * len(items)
+    updates = {}
+    for index, item in enumerate(items):
+        try:
+            change = parse_update(item)
+        except InvalidUpdate as e:
+            product_id = item.get('product_id') if isinstance(item, dict) else None
+            results[index] = {'product_id': product_id, 'status': 'error', 'message': str(e)}
+            continue
+        if change['product_id'] in updates:
+            results[index] = {'product_id': change['product_id'], 'status': 'error',
+                              'message': 'Duplicate product_id in this batch'}
+            continue
+        updates[change['product_id']] = (index, change)
+
+    owned = set(db.session.execute(
+        select(Product.id).where(Product.id.in_(updates), Product.vendor_id == vendor_id)
+    ).scalars()) if updates else set()
+    for product_id in list(updates):
+        if product_id not in owned:
+            index, _ = updates.pop(product_id)
+            results[index] = {'product_id': product_id, 'status': 'error', 'message': NOT_OWNED}
+
+    try:
+        deltas = {pid: change['stock_delta'] for pid, (_, change) in updates.items() if 'stock_delta' in change}
+        if deltas:
+            for product_id in set(deltas) - _apply_stock_deltas(deltas):
+                index, _ = updates.pop(product_id)
+                results[index] = {'product_id': product_id, 'status': 'error',
+                                  'message': 'stock_delta would take stock below zero'}
+
+        for field in ('price', 'stock'):
+            values = {pid: change[field] for pid, (_, change) in updates.items() if field in change}
+            if values:
+                db.session.execute(
+                    update(Product)
+                    .where(Product.id.in_(values))
+                    .values({field: case(values, value=Product.id)})
+                    .execution_options(synchronize_session=False)
+                )
+
+        current = {}
+        if updates:
+            current = {row.id: row for row in db.session.execute(
+                select(Product.id, Product.price, Product.stock).where(Product.id.in_(updates))
+            )}
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for product_id, (index, _) in updates.items():
+        row = current[product_id]
+        results[index] = {'product_id': product_id, 'status': 'updated', 'price': row.price, 'stock': row.stock}
+    if updates:
+        catalog_cache.invalidate(list(updates))
+    return results
@@ -0,0 +1,142 @@
+from datetime import date, datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text, event
+from extensions import db
+from models import User, Product, Order, OrderItem, Wishlist, Payment, VendorSalesDaily
+from orders import ORDER_HISTORY_QUERIES, order_history_page
+from pagination import MAX_PAGE_SIZE
+from wishlist import duplicate_check
+from mpesa_reconciler import payment_reconciler
+
+
+def hot_queries():
+    """
+    The lookups that run on every request of a hot path, built the same way
+    the resources build them.
+
+    Returns:
+        list: (description, statement) pairs
+    """
+    return [
+        ('M-Pesa callback/query payment lookup',
+         Payment.query.filter_by(mpesa_checkout_request_id='ws_CO_0').statement),
+        ('Payment status by order',
+         Payment.query.filter_by(order_id=1).statement),
+        ('Order history of a user',
+         Order.query.filter_by(user_id=1).statement),
+        ('Wishlist duplicate check',
+         Wishlist.query.filter_by(user_id=1, product_id=1).statement),
+        ('Wishlist batch duplicate check',
+         duplicate_check(1, [1, 2, 3])),
+        ('Vendor product page',
+         Product.query.filter_by(vendor_id=1).filter(Product.id > 0).order_by(Product.id).limit(50).statement),
+        ('Items of a page of orders',
+         OrderItem.query.filter(OrderItem.order_id.in_([1, 2, 3])).statement),
+        ('Vendor sales over a date range',
+         VendorSalesDaily.query.filter(VendorSalesDaily.vendor_id == 1,
+                                       VendorSalesDaily.day.between(date(2026, 1, 1), date(2026, 1, 31))).statement),
+        ('Stale pending M-Pesa payments',
+         payment_reconciler.stale_query(datetime.utcnow()).statement),
+        ('Undispatched M-Pesa payments',
+         payment_reconciler.undispatched_query(datetime.utcnow()).statement),
+        ('Catalog product page',
+         Product.query.filter(Product.id > 0).order_by(Product.id).limit(50).statement),
+    ]
+
+
+def explain(statement):
+    """Return the SQLite query plan details of a statement"""
+    sql = str(statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    return [row[-1] for row in rows]
+
+
+def find_table_scans():
+    """
+    Run EXPLAIN QUERY PLAN over the hot queries.
+
+    Returns:
+        list: (description, plan details) for every query that scans a table
+    """
+    failures = []
+    for description, statement in hot_queries():
+        details = explain(statement)
+        if any(detail.startswith('SCAN') for detail in details):
+            failures.append((description, details))
+    return failures
+
+
+def count_queries(function, *args):
+    """Call function and return how many SQL statements it executed"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        function(*args)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return len(statements)
+
+
+def check_order_history_queries(orders=5):
+    """
+    Load a page of order history for a user seeded with orders, items and
+    payments, inside a transaction that is rolled back afterwards.
+
+    Seeding its own rows means the check also runs on an empty database.
+
+    Returns:
+        int: Statements executed
+    """
+    try:
+        user = User(username='query-count-check', email='query-count-check@example.invalid')
+        products = [Product(name=f'Query count check {i}', price=10.0, stock=100) for i in range(2)]
+        db.session.add(user)
+        db.session.add_all(products)
+        db.session.flush()
+        for i in range(orders):
+            order = Order(user_id=user.id, status='paid' if i % 2 else 'pending', total=30.0)
+            db.session.add(order)
+            db.session.flush()
+            db.session.add_all([OrderItem(order_id=order.id, product_id=product.id, quantity=1, price=10.0)
+                                for product in products + products[:1]])
+            db.session.add_all([Payment(order_id=order.id, amount=30.0, status=status, payment_method='mpesa')
+                                for status in ('failed', 'completed' if i % 2 else 'pending')])
+        db.session.flush()
+        # Load from the database, not from the objects just added
+        db.session.expunge_all()
+        return count_queries(order_history_page, user.id, MAX_PAGE_SIZE, None)
+    finally:
+        db.session.rollback()
+
+
+@click.command('check-query-plans')
+@with_appcontext
+def check_query_plans_command():
+    """Fail if a hot lookup scans a table or order history stops batch-loading."""
+    failed = False
+    if db.engine.dialect.name == 'sqlite':
+        failures = find_table_scans()
+        for description, details in failures:
+            click.echo(f'Table scan in {description}: {"; ".join(details)}', err=True)
+        if failures:
+            failed = True
+        else:
+            click.echo(f'All {len(hot_queries())} hot queries use an index')
+    else:
+        click.echo('Query plan checks only run against SQLite')
+
+    # A per-order lazy load would make this grow with the page size
+    count = check_order_history_queries()
+    if count != ORDER_HISTORY_QUERIES:
+        click.echo(f'Order history page ran {count} queries; expected {ORDER_HISTORY_QUERIES}', err=True)
+        failed = True
+    else:
+        click.echo(f'Order history page ran {count} queries for a page of orders with items and payments')
+
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,92 @@
+import time
+import threading
+from collections import OrderedDict
+from metrics import counter
+
+throttled = counter('login_throttled_total', 'Login attempts rejected by rate limiting', ['scope'])
+
+
+class TokenBucketLimiter:
+    """
+    In-process token buckets keyed by an arbitrary string.
+
+    Each key may spend burst tokens at once and earns rate tokens per
+    second after that. Buckets that refilled completely carry no state, so
+    only the max_keys most recently used keys are kept.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """
+        Spend one token for key.
+
+        Returns:
+            float: 0 if allowed, else seconds until a token is available
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / self.rate
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+class LoginThrottle:
+    """
+    Per-IP and per-account limits on login attempts.
+
+    Checked before the account is looked up or its password hashed, so
+    credential stuffing is turned away without spending hash CPU. Limits
+    apply per process; with several workers the effective limit is that
+    many times higher.
+    """
+
+    def __init__(self):
+        self.ip_limiter = TokenBucketLimiter(rate=1.0, burst=20)
+        self.account_limiter = TokenBucketLimiter(rate=0.1, burst=5)
+        self.enabled = True
+
+    def init_app(self, app):
+        self.enabled = app.config.get('LOGIN_THROTTLE_ENABLED', True)
+        self.ip_limiter = TokenBucketLimiter(app.config.get('LOGIN_IP_RATE', 1.0),
+                                             app.config.get('LOGIN_IP_BURST', 20))
+        self.account_limiter = TokenBucketLimiter(app.config.get('LOGIN_ACCOUNT_RATE', 0.1),
+                                                  app.config.get('LOGIN_ACCOUNT_BURST', 5))
+
+    def check(self, ip, account):
+        """
+        Spend a token from the IP's and the account's buckets.
+
+        Args:
+            ip (str): Client address
+            account (str): Account key, e.g. 'user:alice'
+
+        Returns:
+            float: 0 if the attempt may proceed, else seconds to wait
+        """
+        if not self.enabled:
+            return 0.0
+        retry_after = self.ip_limiter.take(ip)
+        if retry_after:
+            throttled.inc(scope='ip')
+            return retry_after
+        retry_after = self.account_limiter.take(account)
+        if retry_after:
+            throttled.inc(scope='account')
+        return retry_after
+
+
+login_throttle = LoginThrottle()
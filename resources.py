@@ -1,16 +1,52 @@
-from flask import request
+from flask import request, current_app
 from flask_restful import Resource
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from models import User, Product, Order, OrderItem, Wishlist, Payment
-from extensions import db
+from extensions import db, catalog_cache, compressor
 import json
 import logging
-from mpesa import MpesaAPI
+from sqlalchemy import select, update, insert
+from sqlalchemy.exc import IntegrityError
+from mpesa_dispatch import stk_dispatcher
+from pagination import get_page_args, InvalidCursor
+from serialization import Projection, json_response, dumps
+from search import search_available, build_match_expression, search_products
+from image_variants import variant_cache
+from wishlist import wishlist_page, add_products, remove_items
+from orders import order_history_page
+from sales_rollups import mark_order_paid
+from auth import authenticate, LoginRejected
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def serialize_product(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'description': product.description,
+        'price': product.price,
+        'stock': product.stock,
+        'image_url': product.image_url,
+        'image_variants': variant_cache.variant_urls(product.image_url),
+        'vendor_id': product.vendor_id
+    }
+
+# Same document as serialize_product, built from selected columns
+PRODUCT_PROJECTION = Projection(
+    [
+        ('id', Product.id),
+        ('name', Product.name),
+        ('description', Product.description),
+        ('price', Product.price),
+        ('stock', Product.stock),
+        ('image_url', Product.image_url),
+        ('vendor_id', Product.vendor_id),
+    ],
+    derived=[('image_variants', 'image_url', variant_cache.variant_urls)]
+)
+
 class UserRegistration(Resource):
     def post(self):
         data = request.get_json()
@@ -23,8 +59,11 @@ class UserRegistration(Resource):
 class UserLogin(Resource):
     def post(self):
         data = request.get_json()
-        user = User.query.filter_by(username=data['username']).first()
-        if user and user.check_password(data['password']):
+        try:
+            user = authenticate(User, data['username'], data['password'])
+        except LoginRejected as e:
+            return e.response()
+        if user:
             access_token = create_access_token(identity=user.id)
             return {'access_token': access_token}, 200
         return {'message': 'Invalid credentials'}, 401
@@ -36,30 +75,54 @@ class ProductResource(Resource):
         return {'message': 'This endpoint is deprecated. Vendors should use /vendor/products'}, 400
 
     def get(self):
-        products = Product.query.all()
-        return {'products': [
-            {
-                'id': p.id, 
-                'name': p.name, 
-                'description': p.description,
-                'price': p.price, 
-                'stock': p.stock,
-                'image_url': p.image_url,
-                'vendor_id': p.vendor_id
-            } for p in products
-        ]}
+        try:
+            limit, after = get_page_args()
+        except InvalidCursor as e:
+            return {'message': str(e)}, 400
+
+        cache_key = (limit, after['id'] if after else None)
+        version = catalog_cache.current_version()
+        body = catalog_cache.get_page(cache_key)
+        if body is None:
+            # Keyset pagination on the primary key; product ids grow with created_at
+            products, next_cursor = PRODUCT_PROJECTION.page(
+                PRODUCT_PROJECTION.select(), Product.id, limit, after
+            )
+            # Stored compressed, so cache hits skip compression
+            body = compressor.precompress(dumps({'products': products, 'next_cursor': next_cursor}))
+            catalog_cache.set_page(cache_key, body, version, [product['id'] for product in products])
+        return json_response(body)
 
 class ProductDetailResource(Resource):
     def get(self, product_id):
-        product = Product.query.get_or_404(product_id)
+        version = catalog_cache.current_version()
+        body = catalog_cache.get_product(product_id)
+        if body is None:
+            product = Product.query.get_or_404(product_id)
+            body = compressor.precompress(json.dumps(serialize_product(product)))
+            catalog_cache.set_product(product_id, body, version)
+        return json_response(body)
+
+class ProductSearchResource(Resource):
+    def get(self):
+        if not search_available():
+            return {'message': 'Search is not available on this database'}, 501
+
+        match = build_match_expression(request.args.get('q', ''))
+        if match is None:
+            return {'message': 'Missing or empty search query: q'}, 400
+
+        try:
+            limit, after = get_page_args()
+            if after is not None and not isinstance(after.get('score'), (int, float)):
+                raise InvalidCursor('Invalid cursor')
+        except InvalidCursor as e:
+            return {'message': str(e)}, 400
+
+        rows, next_cursor = search_products(match, limit, after)
         return {
-            'id': product.id, 
-            'name': product.name, 
-            'description': product.description,
-            'price': product.price, 
-            'stock': product.stock,
-            'image_url': product.image_url,
-            'vendor_id': product.vendor_id
+            'products': [serialize_product(row) for row in rows],
+            'next_cursor': next_cursor
         }
 
 class OrderResource(Resource):
@@ -93,46 +156,69 @@ class OrderResource(Resource):
                 if 'price' not in item:
                     logger.error(f"Missing 'price' in item {i}")
                     return {'message': f'Missing price in item {i}'}, 422
+                # bool is a subclass of int, so true/false would pass the int check
+                if isinstance(item['quantity'], bool) or not isinstance(item['quantity'], int) or item['quantity'] <= 0:
+                    logger.error(f"Invalid 'quantity' in item {i}: {item['quantity']}")
+                    return {'message': f'Invalid quantity in item {i} (must be a positive integer)'}, 422
             
             user_id = get_jwt_identity()
             logger.info(f"User ID: {user_id}")
-            
-            # Create new order
+
+            # Load every product in the order with a single IN query
+            product_ids = {item['product_id'] for item in data['items']}
+            product_names = dict(db.session.execute(
+                select(Product.id, Product.name).where(Product.id.in_(product_ids))
+            ).all())
+
+            missing = sorted((product_id for product_id in product_ids if product_id not in product_names), key=str)
+            if missing:
+                logger.warning(f"Products not found: {missing}")
+                return {'message': f'Products not found: {", ".join(str(product_id) for product_id in missing)}',
+                        'missing_product_ids': missing}, 400
+
+            items = data['items']
+            quantities = {}
+            for item in items:
+                # Repeated lines for the same product are checked against stock together
+                quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+
+            # Everything below runs in one transaction: the order, the stock
+            # decrements and the order items are committed together or not at all
             new_order = Order(user_id=user_id, status='pending', total=data['total'])
             db.session.add(new_order)
-            db.session.commit()
-            logger.info(f"Created new order with ID: {new_order.id}")
-
-            # Process order items and update stock
-            for item in data['items']:
-                # Get the product
-                product = Product.query.get(item['product_id'])
-                if not product:
-                    logger.warning(f"Product not found: {item['product_id']}")
-                    continue
-                    
-                # Check if enough stock is available
-                if product.stock < item['quantity']:
-                    logger.warning(f"Not enough stock for product {product.name}: {product.stock} available, {item['quantity']} requested")
-                    return {'message': f'Not enough stock for {product.name}'}, 400
-                    
-                # Update product stock
-                product.stock -= item['quantity']
-                logger.info(f"Updated stock for product {product.name}: {product.stock + item['quantity']} -> {product.stock}")
-                
-                # Create order item
-                order_item = OrderItem(
-                    order_id=new_order.id, 
-                    product_id=item['product_id'],
-                    quantity=item['quantity'], 
-                    price=item['price']
+            db.session.flush()
+
+            # Check and decrement stock atomically. Updating in product id order
+            # keeps concurrent checkouts from locking rows in opposite orders.
+            for product_id in sorted(quantities):
+                quantity = quantities[product_id]
+                result = db.session.execute(
+                    update(Product)
+                    .where(Product.id == product_id, Product.stock >= quantity)
+                    .values(stock=Product.stock - quantity)
+                    .execution_options(synchronize_session=False)
                 )
-                db.session.add(order_item)
-                logger.info(f"Added order item: product_id={item['product_id']}, quantity={item['quantity']}")
-            
-            # Commit all changes
+                if result.rowcount != 1:
+                    db.session.rollback()
+                    logger.warning(f"Not enough stock for product {product_names[product_id]}: {quantity} requested")
+                    return {'message': f'Not enough stock for {product_names[product_id]}'}, 400
+
+            # Insert all order items in one executemany
+            if items:
+                db.session.execute(insert(OrderItem), [
+                    {
+                        'order_id': new_order.id,
+                        'product_id': item['product_id'],
+                        'quantity': item['quantity'],
+                        'price': item['price']
+                    } for item in items
+                ])
+
             db.session.commit()
-            logger.info(f"Order {new_order.id} created successfully")
+            logger.info(f"Order {new_order.id} created successfully with {len(items)} items")
+
+            # Only stock changed, so only documents listing these products are stale
+            catalog_cache.invalidate_stock(quantities.keys())
             return {'message': 'Order placed successfully', 'order_id': new_order.id}, 201
         except Exception as e:
             db.session.rollback()
@@ -142,16 +228,33 @@ class OrderResource(Resource):
     @jwt_required()
     def get(self):
         user_id = get_jwt_identity()
-        orders = Order.query.filter_by(user_id=user_id).all()
-        return {'orders': [{'id': o.id, 'status': o.status, 'total': o.total} for o in orders]}
+        try:
+            limit, after = get_page_args()
+        except InvalidCursor as e:
+            return {'message': str(e)}, 400
+        # Items and payment status come batch-loaded; see orders.ORDER_HISTORY_QUERIES
+        orders, next_cursor = order_history_page(user_id, limit, after)
+        return json_response(dumps({'orders': orders, 'next_cursor': next_cursor}))
+
+def id_list(data, key):
+    """Read a list of integer ids from a JSON body; None if the key is absent or malformed"""
+    values = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(values, list) or not all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return None
+    return values
 
 class WishlistResource(Resource):
     @jwt_required()
     def get(self):
         user_id = get_jwt_identity()
         try:
-            wishlist_items = Wishlist.query.filter_by(user_id=user_id).all()
-            return {'wishlist': [{'id': item.id, 'product_id': item.product_id} for item in wishlist_items]}
+            limit, after = get_page_args()
+        except InvalidCursor as e:
+            return {'message': str(e)}, 400
+        try:
+            # Product details come from the same join, so clients need no follow-up requests
+            items, next_cursor = wishlist_page(user_id, limit, after)
+            return json_response(dumps({'wishlist': items, 'next_cursor': next_cursor}))
         except Exception as e:
             logger.exception(f"Error fetching wishlist: {str(e)}")
             return {'message': 'Error fetching wishlist', 'error': str(e)}, 500
@@ -160,6 +263,16 @@ class WishlistResource(Resource):
     def post(self):
         data = request.get_json()
         user_id = get_jwt_identity()
+
+        if 'product_ids' in data:
+            product_ids = id_list(data, 'product_ids')
+            if not product_ids:
+                return {'message': 'product_ids must be a non-empty list of product ids'}, 400
+            if len(product_ids) > current_app.config['WISHLIST_MAX_BATCH']:
+                return {'message': f"At most {current_app.config['WISHLIST_MAX_BATCH']} items per request"}, 400
+            result = add_products(user_id, product_ids)
+            return dict(result, message=f"{len(result['added'])} item(s) added to wishlist"), 201
+
         product_id = data['product_id']
         
         existing_item = Wishlist.query.filter_by(user_id=user_id, product_id=product_id).first()
@@ -168,12 +281,29 @@ class WishlistResource(Resource):
         
         new_item = Wishlist(user_id=user_id, product_id=product_id)
         db.session.add(new_item)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request added the same item after our check
+            db.session.rollback()
+            return {'message': 'Item already in wishlist'}, 400
         return {'message': 'Item added to wishlist'}, 201
 
     @jwt_required()
-    def delete(self, wishlist_id):
+    def delete(self, wishlist_id=None):
         user_id = get_jwt_identity()
+        if wishlist_id is None:
+            # Batch removal by wishlist item ids and/or product ids
+            data = request.get_json(silent=True) or {}
+            wishlist_ids = id_list(data, 'ids') if 'ids' in data else []
+            product_ids = id_list(data, 'product_ids') if 'product_ids' in data else []
+            if wishlist_ids is None or product_ids is None or not (wishlist_ids or product_ids):
+                return {'message': 'Send ids and/or product_ids as lists of ids'}, 400
+            if len(wishlist_ids) + len(product_ids) > current_app.config['WISHLIST_MAX_BATCH']:
+                return {'message': f"At most {current_app.config['WISHLIST_MAX_BATCH']} items per request"}, 400
+            removed = remove_items(user_id, wishlist_ids, product_ids)
+            return {'message': f'{len(removed)} item(s) removed from wishlist', 'removed': removed}, 200
+
         item = Wishlist.query.filter_by(id=wishlist_id, user_id=user_id).first()
         if item:
             db.session.delete(item)
@@ -221,55 +351,30 @@ class PaymentResource(Resource):
                 db.session.commit()
                 logger.info(f"Created pending payment record: id={payment.id}")
                 
-                try:
-                    # Initialize M-Pesa API
-                    mpesa_api = MpesaAPI()
-                    
-                    # Initiate STK push
-                    account_reference = f"Order #{order_id}"
-                    transaction_desc = f"Payment for Order #{order_id}"
-                    
-                    logger.info(f"Initiating M-Pesa STK push: phone={phone_number}, amount={amount}")
-                    result = mpesa_api.initiate_stk_push(
-                        phone_number=phone_number,
-                        amount=amount,
-                        account_reference=account_reference,
-                        transaction_desc=transaction_desc
-                    )
-                    logger.info(f"M-Pesa STK push result: {result}")
-                    
-                    if result['success']:
-                        # Update payment with checkout request ID
-                        checkout_request_id = result['checkout_request_id']
-                        payment.mpesa_checkout_request_id = checkout_request_id
-                        db.session.commit()
-                        logger.info(f"Updated payment with checkout_request_id: {checkout_request_id}")
-                        
-                        return {
-                            'message': 'M-Pesa payment initiated. Please check your phone to complete the payment.',
-                            'payment_id': payment.id,
-                            'checkout_request_id': checkout_request_id,
-                            'status': 'pending'
-                        }, 200
-                    else:
-                        # Mark payment as failed
-                        payment.status = 'failed'
-                        payment.mpesa_result_desc = result['message']
-                        db.session.commit()
-                        logger.warning(f"M-Pesa payment initiation failed: {result['message']}")
-                        
-                        return {
-                            'message': 'Failed to initiate M-Pesa payment',
-                            'error': result['message'],
-                            'payment_id': payment.id,
-                            'status': 'failed'
-                        }, 400
-                except Exception as mpesa_error:
-                    logger.exception(f"M-Pesa API error: {str(mpesa_error)}")
+                # The STK push is sent by a background worker, which fills in
+                # mpesa_checkout_request_id (or marks the payment failed) when it completes
+                accepted = stk_dispatcher.submit(
+                    payment_id=payment.id,
+                    phone_number=phone_number,
+                    amount=amount,
+                    account_reference=f"Order #{order_id}",
+                    transaction_desc=f"Payment for Order #{order_id}"
+                )
+                if not accepted:
                     payment.status = 'failed'
-                    payment.mpesa_result_desc = str(mpesa_error)
+                    payment.mpesa_result_desc = 'M-Pesa dispatch queue is full'
                     db.session.commit()
-                    return {'message': f'M-Pesa API error: {str(mpesa_error)}'}, 500
+                    return {
+                        'message': 'M-Pesa payments are busy, please try again shortly',
+                        'payment_id': payment.id,
+                        'status': 'failed'
+                    }, 503
+
+                return {
+                    'message': 'M-Pesa payment initiated. Please check your phone to complete the payment.',
+                    'payment_id': payment.id,
+                    'status': 'pending'
+                }, 202
                 
             else:
                 # Handle other payment methods (credit card, PayPal, etc.)
@@ -282,7 +387,7 @@ class PaymentResource(Resource):
                 )
                 
                 db.session.add(payment)
-                order.status = 'paid'
+                mark_order_paid(order, payment)
                 order.payment_id = payment.id
                 db.session.commit()
                 logger.info(f"Payment completed successfully: id={payment.id}")
@@ -0,0 +1,198 @@
+import time
+import logging
+from datetime import datetime, date, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, update, delete, insert, func
+from sqlalchemy.dialects import sqlite, postgresql
+from extensions import db
+from models import Order, OrderItem, Payment, Product, VendorSalesDaily
+from metrics import counter
+
+logger = logging.getLogger(__name__)
+
+rollup_orders = counter('vendor_sales_rollup_orders_total', 'Paid orders added to the vendor sales rollup')
+
+# Longest range /vendor/analytics will aggregate in one request
+MAX_ANALYTICS_DAYS = 366
+TOP_PRODUCTS = 10
+
+
+def _upsert_sales(rows):
+    """Add units and revenue to existing rollup rows, creating missing ones"""
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert_ = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert_(VendorSalesDaily)
+        statement = statement.on_conflict_do_update(
+            index_elements=['vendor_id', 'day', 'product_id'],
+            set_={
+                'units': VendorSalesDaily.units + statement.excluded.units,
+                'revenue': VendorSalesDaily.revenue + statement.excluded.revenue,
+            }
+        )
+        db.session.execute(statement, rows)
+        return
+
+    for row in rows:
+        result = db.session.execute(
+            update(VendorSalesDaily)
+            .where(VendorSalesDaily.vendor_id == row['vendor_id'],
+                   VendorSalesDaily.day == row['day'],
+                   VendorSalesDaily.product_id == row['product_id'])
+            .values(units=VendorSalesDaily.units + row['units'],
+                    revenue=VendorSalesDaily.revenue + row['revenue'])
+            .execution_options(synchronize_session=False)
+        )
+        if not result.rowcount:
+            db.session.execute(insert(VendorSalesDaily).values(**row))
+
+
+def mark_order_paid(order, payment=None):
+    """
+    Move an order to 'paid' and add its items to the vendor sales rollup.
+
+    The status change is a conditional UPDATE ... WHERE status != 'paid', so
+    when a callback, a status query and the reconciler settle the same order
+    at once, in one process or several, only the one whose update matched
+    counts the sale. The rollup rows are written in the caller's transaction,
+    which commits them together with the status.
+
+    Args:
+        order (Order): Order that has been paid for
+        payment (Payment, optional): Completed payment; its payment_date sets
+            the day the sale is counted on, as in the backfill
+
+    Returns:
+        bool: True if this call moved the order to paid
+    """
+    result = db.session.execute(
+        update(Order).where(Order.id == order.id, Order.status != 'paid').values(status='paid')
+    )
+    if result.rowcount != 1:
+        return False
+
+    paid_at = payment.payment_date if payment is not None and payment.payment_date else datetime.utcnow()
+    rows = db.session.execute(
+        select(Product.vendor_id, OrderItem.product_id,
+               func.sum(OrderItem.quantity).label('units'),
+               func.sum(OrderItem.quantity * OrderItem.price).label('revenue'))
+        .join(Product, Product.id == OrderItem.product_id)
+        .where(OrderItem.order_id == order.id, Product.vendor_id.is_not(None))
+        .group_by(Product.vendor_id, OrderItem.product_id)
+    ).all()
+    if rows:
+        _upsert_sales([
+            {'vendor_id': row.vendor_id, 'day': paid_at.date(), 'product_id': row.product_id,
+             'units': row.units, 'revenue': row.revenue}
+            for row in rows
+        ])
+    rollup_orders.inc()
+    return True
+
+
+def rebuild_sales_rollups():
+    """
+    Recompute the whole rollup from paid orders in one transaction.
+
+    Each paid order counts on the day of its earliest completed payment,
+    the same day mark_order_paid uses. The aggregation runs as a single
+    INSERT ... SELECT, so nothing is loaded into Python.
+
+    Returns:
+        int: Rollup rows written
+    """
+    paid = (
+        select(Payment.order_id, func.min(Payment.payment_date).label('paid_at'))
+        .where(Payment.status == 'completed')
+        .group_by(Payment.order_id)
+        .subquery()
+    )
+    day = func.date(paid.c.paid_at)
+    aggregate = (
+        select(Product.vendor_id, day, OrderItem.product_id,
+               func.sum(OrderItem.quantity), func.sum(OrderItem.quantity * OrderItem.price))
+        .select_from(OrderItem)
+        .join(Order, Order.id == OrderItem.order_id)
+        .join(paid, paid.c.order_id == Order.id)
+        .join(Product, Product.id == OrderItem.product_id)
+        .where(Order.status == 'paid', Product.vendor_id.is_not(None))
+        .group_by(Product.vendor_id, day, OrderItem.product_id)
+    )
+    try:
+        db.session.execute(delete(VendorSalesDaily))
+        db.session.execute(
+            insert(VendorSalesDaily).from_select(['vendor_id', 'day', 'product_id', 'units', 'revenue'], aggregate)
+        )
+        written = db.session.execute(select(func.count()).select_from(VendorSalesDaily)).scalar()
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return written
+
+
+def vendor_analytics(vendor_id, start, end):
+    """
+    Sales of one vendor between two dates, inclusive, read from the rollup.
+
+    The queries range-scan the (vendor_id, day, product_id) primary key, so
+    their cost depends on the length of the range, not on order history.
+
+    Returns:
+        dict: totals, per-day series and top products by revenue
+    """
+    in_range = (VendorSalesDaily.vendor_id == vendor_id, VendorSalesDaily.day >= start, VendorSalesDaily.day <= end)
+    daily = db.session.execute(
+        select(VendorSalesDaily.day, func.sum(VendorSalesDaily.units), func.sum(VendorSalesDaily.revenue))
+        .where(*in_range)
+        .group_by(VendorSalesDaily.day)
+        .order_by(VendorSalesDaily.day)
+    ).all()
+    revenue = func.sum(VendorSalesDaily.revenue).label('revenue')
+    top = db.session.execute(
+        select(VendorSalesDaily.product_id, Product.name, func.sum(VendorSalesDaily.units), revenue)
+        .join(Product, Product.id == VendorSalesDaily.product_id)
+        .where(*in_range)
+        .group_by(VendorSalesDaily.product_id, Product.name)
+        .order_by(revenue.desc())
+        .limit(TOP_PRODUCTS)
+    ).all()
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'totals': {
+            'units': sum(units for _, units, _ in daily),
+            'revenue': round(sum(amount for _, _, amount in daily), 2),
+        },
+        'daily': [{'day': day.isoformat(), 'units': units, 'revenue': round(amount, 2)} for day, units, amount in daily],
+        'top_products': [
+            {'product_id': product_id, 'name': name, 'units': units, 'revenue': round(amount, 2)}
+            for product_id, name, units, amount in top
+        ],
+    }
+
+
+def analytics_range(start=None, end=None, days=30):
+    """
+    Parse the start/end query parameters, defaulting to the last 30 days.
+
+    Raises:
+        ValueError: For malformed dates, a reversed range or one longer than MAX_ANALYTICS_DAYS
+    """
+    end = date.fromisoformat(end) if end else datetime.utcnow().date()
+    start = date.fromisoformat(start) if start else end - timedelta(days=days - 1)
+    if start > end:
+        raise ValueError('start must not be after end')
+    if (end - start).days >= MAX_ANALYTICS_DAYS:
+        raise ValueError(f'Ranges are limited to {MAX_ANALYTICS_DAYS} days')
+    return start, end
+
+
+@click.command('backfill-sales-rollups')
+@with_appcontext
+def backfill_sales_rollups_command():
+    """Rebuild the vendor sales rollup from all paid orders."""
+    started = time.monotonic()
+    written = rebuild_sales_rollups()
+    click.echo(f'Wrote {written:,} rollup rows in {time.monotonic() - started:.1f}s')
@@ -0,0 +1,131 @@
+import re
+import logging
+from sqlalchemy import text
+from extensions import db
+from pagination import encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# External-content FTS5 index over product.name and product.description.
+# The triggers keep it in sync with every write to the product table, so the
+# vendor resources do not need to know it exists.
+FTS_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_fts USING fts5(
+        name, description,
+        content='product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_fts_au AFTER UPDATE OF name, description ON product BEGIN
+        INSERT INTO product_fts(product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+MIN_PREFIX_LENGTH = 3
+
+# Column weights for bm25(): a match in the name counts ten times as much
+BM25_RANK = 'bm25(product_fts, 10.0, 1.0)'
+
+SEARCH_SQL = f"""
+    SELECT p.id, p.name, p.description, p.price, p.stock, p.image_url, p.vendor_id,
+           {BM25_RANK} AS score
+    FROM product_fts
+    JOIN product p ON p.id = product_fts.rowid
+    WHERE product_fts MATCH :match
+    {{after}}
+    ORDER BY score, p.id
+    LIMIT :limit
+"""
+
+AFTER_SQL = f"AND ({BM25_RANK} > :score OR ({BM25_RANK} = :score AND p.id > :id))"
+
+
+def search_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def init_search(app):
+    """Create the FTS5 index and its triggers, building the index if it is new"""
+    with app.app_context():
+        if not search_available():
+            logger.warning("Product search requires SQLite FTS5; /products/search is disabled")
+            return
+
+        with db.engine.begin() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'product_fts'")
+            ).first()
+            for statement in FTS_SCHEMA:
+                connection.execute(text(statement))
+            if not exists:
+                logger.info("Building product search index")
+                connection.execute(text("INSERT INTO product_fts(product_fts) VALUES ('rebuild')"))
+
+
+def build_match_expression(query):
+    """
+    Turn free text into an FTS5 MATCH expression.
+
+    Every term is quoted so user input cannot inject FTS5 syntax, and the last
+    term is a prefix match so results show up while the user is typing. Very
+    short prefixes expand to a large share of the vocabulary and force BM25
+    scoring of most of the catalog, so they are matched as whole terms.
+
+    Args:
+        query (str): Raw search text
+
+    Returns:
+        str: MATCH expression, or None if the query has no searchable terms
+    """
+    terms = re.findall(r'\w+', query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    if len(terms[-1]) >= MIN_PREFIX_LENGTH:
+        quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_products(match, limit, after=None):
+    """
+    Fetch one BM25-ranked page of products matching an FTS5 expression.
+
+    Args:
+        match (str): Expression from build_match_expression
+        limit (int): Page size
+        after (dict, optional): Decoded cursor of the previous page
+
+    Returns:
+        tuple: (rows, next_cursor or None)
+    """
+    params = {'match': match, 'limit': limit + 1}
+    if after is not None:
+        params.update(score=after['score'], id=after['id'])
+        sql = SEARCH_SQL.format(after=AFTER_SQL)
+    else:
+        sql = SEARCH_SQL.format(after='')
+
+    rows = db.session.execute(text(sql), params).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor({'score': rows[-1].score, 'id': rows[-1].id})
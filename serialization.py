@@ -0,0 +1,94 @@
+import json
+from flask import current_app
+from sqlalchemy import select
+from extensions import db, compressor
+from compression import CompressedPayload
+from pagination import encode_cursor
+
+
+def json_response(body, status=200):
+    """Return an already serialized JSON document, or a CompressedPayload of one, as a response"""
+    if isinstance(body, CompressedPayload):
+        return compressor.payload_response(current_app.response_class, body, 'application/json', status)
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+class Projection:
+    """
+    Serializes list endpoints from selected columns instead of ORM instances.
+
+    Only the projected columns are selected and the result rows are plain
+    tuples, so nothing is hydrated into the session's identity map. Rows are
+    turned into dicts with a single zip, and per-field work is limited to
+    the fields that declare a converter.
+
+    Args:
+        fields (list): (key, column) pairs in output order
+        converters (dict, optional): key -> function applied to that value
+        derived (list, optional): (key, source key, function) adding a field
+            computed from another one, e.g. image variants from image_url
+    """
+
+    def __init__(self, fields, converters=None, derived=None):
+        self.keys = tuple(key for key, _ in fields)
+        self.columns = [column.label(key) for key, column in fields]
+        self.converters = [(self.keys.index(key), function) for key, function in (converters or {}).items()]
+        self.derived = derived or []
+
+    def select(self):
+        return select(*self.columns)
+
+    def to_dicts(self, rows):
+        keys, converters, derived = self.keys, self.converters, self.derived
+        if not converters and not derived:
+            return [dict(zip(keys, row)) for row in rows]
+        items = []
+        for row in rows:
+            if converters:
+                row = list(row)
+                for index, function in converters:
+                    row[index] = function(row[index])
+            item = dict(zip(keys, row))
+            for key, source, function in derived:
+                item[key] = function(item[source])
+            items.append(item)
+        return items
+
+    def _execute(self, statement):
+        # Run on the session's connection as a Core statement, which skips
+        # the ORM result machinery entirely
+        return db.session.connection().execute(statement).all()
+
+    def all(self, statement):
+        """Execute a select built from select() and return its rows as dicts"""
+        return self.to_dicts(self._execute(statement))
+
+    def first(self, statement):
+        rows = self._execute(statement.limit(1))
+        return self.to_dicts(rows)[0] if rows else None
+
+    def page(self, statement, id_column, limit, after):
+        """
+        Fetch one keyset page ordered by id; see pagination.paginate_by_id.
+
+        Returns:
+            tuple: (list of dicts, next_cursor or None)
+        """
+        if after is not None:
+            statement = statement.where(id_column > after['id'])
+        # Fetch one extra row to know whether there is a next page
+        rows = self._execute(statement.order_by(id_column).limit(limit + 1))
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor({'id': rows[-1].id})
+        return self.to_dicts(rows), next_cursor
+
+
+def dumps(document):
+    """Encode a document built from projected rows"""
+    return json.dumps(document, separators=(',', ':'))
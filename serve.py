@@ -0,0 +1,336 @@
+"""
+Preforking HTTP server for production.
+
+The master process loads the app once, freezes the garbage collector's view
+of everything imported so far and forks the workers, which then share those
+pages copy-on-write. Each worker serves requests from a fixed pool of
+threads on the shared listening socket and only accepts a connection when a
+thread is free, so busy workers leave new connections to idle ones.
+
+Signals to the master:
+
+    TERM, INT   stop: workers finish in-flight requests, then exit
+    HUP         rolling restart: workers are replaced one at a time
+    USR2        re-exec: start a new master on the same socket, running the
+                code currently on disk; it stops this one once its workers run
+
+Background services (app.extensions['background_services']) never run in
+the master, which stays single-threaded so forking is safe. Every worker
+starts them right after the fork:
+
+    callback processor, email outbox, product importer
+                run in every worker; each claims its rows with conditional
+                updates, so workers share the work without doing it twice
+    payment reconciler
+                its loop runs in every worker when MPESA_RECONCILE_INTERVAL
+                is set, but a pass only runs while holding the
+                'mpesa-reconciler' lease, so one worker across all hosts
+                reconciles at a time
+"""
+import gc
+import os
+import sys
+import time
+import errno
+import random
+import signal
+import socket
+import logging
+import select
+import selectors
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Set by a master that re-execs itself, for the new master to pick up
+LISTEN_FD_ENV = 'SERVE_LISTEN_FD'
+PARENT_MASTER_ENV = 'SERVE_PARENT_MASTER'
+
+
+class WorkerRequestHandler(WSGIRequestHandler):
+    # One request per connection, so an idle keep-alive client never holds a worker thread
+    protocol_version = 'HTTP/1.0'
+
+
+class WorkerServer(BaseWSGIServer):
+    """
+    WSGI server for one worker process.
+
+    Runs requests on a pool of threads and accepts a connection only when
+    one of them is free. It stops accepting on SIGTERM or after
+    max_requests, lets in-flight requests finish, then returns from serve().
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, app, host, fd, threads, max_requests=0):
+        super().__init__(host, 0, app, handler=WorkerRequestHandler, fd=fd)
+        self.threads = threads
+        self.max_requests = max_requests
+        self.accepted = 0
+        self.stopping = False
+        self._slots = threading.Semaphore(threads)
+
+    def serve(self):
+        executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='request')
+        selector = selectors.DefaultSelector()
+        selector.register(self.socket, selectors.EVENT_READ)
+        try:
+            while not self.stopping:
+                if not self._slots.acquire(timeout=0.5):
+                    continue
+                try:
+                    # Every worker polls the same socket; whoever accepts first gets the connection
+                    if self.stopping or not selector.select(timeout=0.5):
+                        self._slots.release()
+                        continue
+                    connection, client_address = self.socket.accept()
+                except (BlockingIOError, InterruptedError):
+                    self._slots.release()
+                    continue
+                connection.setblocking(True)
+                self.accepted += 1
+                if self.max_requests and self.accepted >= self.max_requests:
+                    self.stopping = True
+                executor.submit(self._handle, connection, client_address)
+        finally:
+            selector.close()
+            executor.shutdown(wait=True)
+            self.socket.close()
+
+    def _handle(self, connection, client_address):
+        try:
+            self.finish_request(connection, client_address)
+        except Exception:
+            self.handle_error(connection, client_address)
+        finally:
+            self.shutdown_request(connection)
+            self._slots.release()
+
+    def stop(self, *args):
+        self.stopping = True
+
+
+class Master:
+    """
+    Forks and supervises the worker processes.
+
+    Exited workers are replaced, whether they were recycled after
+    max_requests, crashed or were stopped by a rolling restart. Workers that
+    do not finish within graceful_timeout of being asked to stop are killed.
+    """
+
+    def __init__(self, app, host, port, workers, threads, max_requests=0, max_requests_jitter=0,
+                 graceful_timeout=30):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.socket = None
+        self.children = {}  # pid -> kill deadline once asked to stop, else None
+        self.retiring = []
+        self.signals = []
+        self.stopping = False
+
+    def listen(self):
+        inherited = os.environ.pop(LISTEN_FD_ENV, None)
+        if inherited is not None:
+            sock = socket.socket(fileno=int(inherited))
+        else:
+            family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+            sock = socket.create_server((self.host, self.port), family=family, backlog=2048)
+        sock.setblocking(False)
+        self.socket = sock
+        return sock
+
+    def run(self):
+        sock = self.listen()
+        logger.info(f"Serving on {sock.getsockname()} with {self.workers} workers x {self.threads} threads")
+
+        # Objects loaded so far are never collected in the workers, so the
+        # collector does not touch, and copy, the pages they live on
+        gc.collect()
+        gc.freeze()
+
+        read_fd, write_fd = os.pipe()
+        # The loop reads the pipe after every select, including timeouts
+        os.set_blocking(read_fd, False)
+        os.set_blocking(write_fd, False)
+        signal.set_wakeup_fd(write_fd)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGUSR2, signal.SIGCHLD):
+            signal.signal(signum, lambda signum, frame: self.signals.append(signum))
+
+        for _ in range(self.workers):
+            self.spawn()
+        parent = os.environ.pop(PARENT_MASTER_ENV, None)
+        if parent:
+            # Started by USR2; the old master can stop now that our workers are up
+            os.kill(int(parent), signal.SIGTERM)
+
+        while self.children or not self.stopping:
+            try:
+                select.select([read_fd], [], [], 1.0)
+                os.read(read_fd, 1024)
+            except (BlockingIOError, InterruptedError):
+                pass
+            self.handle_signals()
+            self.reap()
+            self.maintain()
+        logger.info('All workers stopped')
+
+    def handle_signals(self):
+        while self.signals:
+            signum = self.signals.pop(0)
+            if signum in (signal.SIGTERM, signal.SIGINT) and not self.stopping:
+                logger.info('Stopping workers')
+                self.stopping = True
+                for pid in list(self.children):
+                    self.stop_worker(pid)
+            elif signum == signal.SIGHUP and not self.stopping:
+                logger.info('Rolling restart of workers')
+                self.retiring = [pid for pid, deadline in self.children.items() if deadline is None]
+            elif signum == signal.SIGUSR2 and not self.stopping:
+                self.reexec()
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.children:
+                deadline = self.children.pop(pid)
+                if deadline is None and os.waitstatus_to_exitcode(status) != 0:
+                    logger.warning(f"Worker {pid} exited unexpectedly with status {os.waitstatus_to_exitcode(status)}")
+
+    def maintain(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.children.items()):
+            if deadline is not None and now > deadline:
+                logger.warning(f"Worker {pid} did not stop within {self.graceful_timeout}s; killing it")
+                self._signal(pid, signal.SIGKILL)
+                self.children[pid] = float('inf')
+        if self.stopping:
+            return
+
+        # Retire one old worker at a time; its replacement is forked below
+        draining = any(deadline is not None for deadline in self.children.values())
+        while self.retiring and not draining:
+            pid = self.retiring.pop(0)
+            if pid in self.children:
+                self.stop_worker(pid)
+                draining = True
+
+        active = sum(1 for deadline in self.children.values() if deadline is None)
+        for _ in range(self.workers - active):
+            self.spawn()
+
+    def spawn(self):
+        max_requests = self.max_requests
+        if max_requests and self.max_requests_jitter:
+            # Stagger recycling so workers do not all restart at once
+            max_requests += random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid:
+            self.children[pid] = None
+            logger.info(f"Started worker {pid}")
+            return
+        code = 1
+        try:
+            self.run_worker(max_requests)
+            code = 0
+        except BaseException:
+            logger.exception('Worker failed')
+        finally:
+            # Never return into the master's stack
+            os._exit(code)
+
+    def run_worker(self, max_requests):
+        signal.set_wakeup_fd(-1)
+        for signum in (signal.SIGHUP, signal.SIGUSR2, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        # Ctrl-C reaches the whole process group; the master turns it into a graceful stop
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        random.seed()
+
+        app = self.app
+        with app.app_context():
+            # Pooled connections were opened by the master; never share them
+            db.engine.dispose(close=False)
+        # The master never starts the background services; start them here
+        # instead of waiting for this worker's first request
+        for service in app.extensions.get('background_services', ()):
+            service.start()
+
+        server = WorkerServer(app, self.host, self.socket.fileno(), self.threads, max_requests)
+        signal.signal(signal.SIGTERM, server.stop)
+        server.serve()
+        if server.max_requests and server.accepted >= server.max_requests:
+            logger.info(f"Worker {os.getpid()} recycled after {server.accepted} requests")
+
+    def stop_worker(self, pid):
+        if self.children.get(pid) is None:
+            self.children[pid] = time.monotonic() + self.graceful_timeout
+            self._signal(pid, signal.SIGTERM)
+
+    def reexec(self):
+        """Start a new master with the same arguments, handing it the listening socket"""
+        fd = self.socket.fileno()
+        os.set_inheritable(fd, True)
+        pid = os.fork()
+        if pid == 0:
+            os.environ[LISTEN_FD_ENV] = str(fd)
+            os.environ[PARENT_MASTER_ENV] = str(os.getppid())
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+        logger.info(f"Started new master {pid}; waiting for it to take over")
+
+    def _signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+
+def serve(app, host=None, port=None, workers=None, threads=None, max_requests=None, max_requests_jitter=None,
+          graceful_timeout=None):
+    """Run app under the preforking server; unset arguments come from app.config"""
+    config = app.config
+    Master(
+        app,
+        host or config['SERVE_HOST'],
+        port or config['SERVE_PORT'],
+        workers or config['SERVE_WORKERS'],
+        threads or config['SERVE_THREADS'],
+        config['SERVE_MAX_REQUESTS'] if max_requests is None else max_requests,
+        config['SERVE_MAX_REQUESTS_JITTER'] if max_requests_jitter is None else max_requests_jitter,
+        graceful_timeout or config['SERVE_GRACEFUL_TIMEOUT'],
+    ).run()
+
+
+@click.command('serve')
+@click.option('--host', help='Address to listen on.  [default: SERVE_HOST]')
+@click.option('--port', type=int, help='Port to listen on.  [default: SERVE_PORT]')
+@click.option('--workers', type=int, help='Worker processes.  [default: SERVE_WORKERS, one per core]')
+@click.option('--threads', type=int, help='Request threads per worker.  [default: SERVE_THREADS]')
+@click.option('--max-requests', type=int, help='Recycle a worker after this many requests; 0 never does.')
+@click.option('--max-requests-jitter', type=int, help='Up to this many extra requests per worker.')
+@click.option('--graceful-timeout', type=int, help='Seconds a stopping worker may take to finish.')
+@with_appcontext
+def serve_command(host, port, workers, threads, max_requests, max_requests_jitter, graceful_timeout):
+    """Serve the app with preforked worker processes."""
+    serve(current_app._get_current_object(), host, port, workers, threads, max_requests, max_requests_jitter,
+          graceful_timeout)
@@ -1,10 +1,52 @@
-import os
 from flask import request, current_app
 from flask_restful import Resource
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.utils import secure_filename
-from models import Vendor, Product
-from extensions import db
+from models import Vendor, Product, ProductImport, ProductImportError
+from extensions import db, catalog_cache
+from pagination import get_page_args, InvalidCursor
+from serialization import Projection, isoformat, json_response, dumps
+from image_store import store_upload, release_image, collect_garbage
+from image_variants import variant_cache
+from product_import import create_import, detect_format
+from product_updates import apply_updates
+from sales_rollups import vendor_analytics, analytics_range
+from auth import authenticate, LoginRejected
+
+VENDOR_PRODUCT_PROJECTION = Projection(
+    [
+        ('id', Product.id),
+        ('name', Product.name),
+        ('description', Product.description),
+        ('price', Product.price),
+        ('stock', Product.stock),
+        ('image_url', Product.image_url),
+        ('created_at', Product.created_at),
+    ],
+    converters={'created_at': isoformat},
+    derived=[('image_variants', 'image_url', variant_cache.variant_urls)]
+)
+
+PRODUCT_IMPORT_PROJECTION = Projection(
+    [
+        ('id', ProductImport.id),
+        ('format', ProductImport.format),
+        ('status', ProductImport.status),
+        ('rows_processed', ProductImport.rows_processed),
+        ('rows_imported', ProductImport.rows_imported),
+        ('rows_failed', ProductImport.rows_failed),
+        ('error', ProductImport.error),
+        ('created_at', ProductImport.created_at),
+        ('started_at', ProductImport.started_at),
+        ('finished_at', ProductImport.finished_at),
+    ],
+    converters={'created_at': isoformat, 'started_at': isoformat, 'finished_at': isoformat}
+)
+
+IMPORT_ERROR_PROJECTION = Projection([
+    ('id', ProductImportError.id),
+    ('line', ProductImportError.line),
+    ('message', ProductImportError.message),
+])
 
 class VendorRegistration(Resource):
     def post(self):
@@ -24,8 +66,11 @@ class VendorRegistration(Resource):
 class VendorLogin(Resource):
     def post(self):
         data = request.get_json()
-        vendor = Vendor.query.filter_by(username=data['username']).first()
-        if vendor and vendor.check_password(data['password']):
+        try:
+            vendor = authenticate(Vendor, data['username'], data['password'])
+        except LoginRejected as e:
+            return e.response()
+        if vendor:
             access_token = create_access_token(identity={'id': vendor.id, 'type': 'vendor'})
             return {'access_token': access_token}, 200
         return {'message': 'Invalid credentials'}, 401
@@ -72,20 +117,12 @@ class VendorProductResource(Resource):
         if 'image' in request.files:
             file = request.files['image']
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Create uploads directory if it doesn't exist
-                upload_folder = os.path.join(current_app.root_path, 'static', 'uploads')
-                os.makedirs(upload_folder, exist_ok=True)
-                
-                # Save the file
-                file_path = os.path.join(upload_folder, filename)
-                file.save(file_path)
-                
-                # Store the relative URL
-                new_product.image_url = f'/static/uploads/{filename}'
+                # Stored under its content hash; identical images share one file
+                new_product.image_url = store_upload(file)
         
         db.session.add(new_product)
         db.session.commit()
+        catalog_cache.invalidate([new_product.id])
         
         return {
             'message': 'Product added successfully',
@@ -102,20 +139,38 @@ class VendorProductResource(Resource):
         else:
             return {'message': 'Unauthorized. Only vendors can view their products.'}, 403
         
-        products = Product.query.filter_by(vendor_id=vendor_id).all()
-        return {
-            'products': [
-                {
-                    'id': p.id,
-                    'name': p.name,
-                    'description': p.description,
-                    'price': p.price,
-                    'stock': p.stock,
-                    'image_url': p.image_url,
-                    'created_at': p.created_at.isoformat() if p.created_at else None
-                } for p in products
-            ]
-        }
+        try:
+            limit, after = get_page_args()
+        except InvalidCursor as e:
+            return {'message': str(e)}, 400
+
+        # Served by the (vendor_id, id) index, so every page is a single range scan
+        products, next_cursor = VENDOR_PRODUCT_PROJECTION.page(
+            VENDOR_PRODUCT_PROJECTION.select().where(Product.vendor_id == vendor_id), Product.id, limit, after
+        )
+        return json_response(dumps({'products': products, 'next_cursor': next_cursor}))
+
+    @jwt_required()
+    def patch(self):
+        # Check if the user is a vendor
+        identity = get_jwt_identity()
+        if isinstance(identity, dict) and identity.get('type') == 'vendor':
+            vendor_id = identity.get('id')
+        else:
+            return {'message': 'Unauthorized. Only vendors can update their products.'}, 403
+
+        # Either a list of updates or {"updates": [...]}
+        data = request.get_json(silent=True)
+        items = data.get('updates') if isinstance(data, dict) else data
+        if not isinstance(items, list) or not items:
+            return {'message': 'Send a non-empty list of product updates'}, 400
+        max_items = current_app.config['VENDOR_BULK_UPDATE_MAX_ITEMS']
+        if len(items) > max_items:
+            return {'message': f'At most {max_items} updates per request'}, 400
+
+        results = apply_updates(vendor_id, items)
+        updated = sum(1 for result in results if result['status'] == 'updated')
+        return {'updated': updated, 'failed': len(results) - updated, 'results': results}, 200
 
 class VendorProductDetailResource(Resource):
     @jwt_required()
@@ -138,6 +193,7 @@ class VendorProductDetailResource(Resource):
             'price': product.price,
             'stock': product.stock,
             'image_url': product.image_url,
+            'image_variants': variant_cache.variant_urls(product.image_url),
             'created_at': product.created_at.isoformat() if product.created_at else None,
             'updated_at': product.updated_at.isoformat() if product.updated_at else None
         }
@@ -165,23 +221,17 @@ class VendorProductDetailResource(Resource):
         if 'stock' in request.form:
             product.stock = int(request.form['stock'])
         
+        released_image = None
         # Handle image upload
         if 'image' in request.files:
             file = request.files['image']
             if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                # Create uploads directory if it doesn't exist
-                upload_folder = os.path.join(current_app.root_path, 'static', 'uploads')
-                os.makedirs(upload_folder, exist_ok=True)
-                
-                # Save the file
-                file_path = os.path.join(upload_folder, filename)
-                file.save(file_path)
-                
-                # Store the relative URL
-                product.image_url = f'/static/uploads/{filename}'
+                released_image = release_image(product.image_url)
+                product.image_url = store_upload(file)
         
         db.session.commit()
+        catalog_cache.invalidate([product.id])
+        collect_garbage([released_image])
         
         return {
             'message': 'Product updated successfully',
@@ -202,8 +252,96 @@ class VendorProductDetailResource(Resource):
         if not product:
             return {'message': 'Product not found or not owned by this vendor'}, 404
         
+        released_image = release_image(product.image_url)
         db.session.delete(product)
         db.session.commit()
+        catalog_cache.invalidate([product_id])
+        collect_garbage([released_image])
         
         return {'message': 'Product deleted successfully'}
 
+
+class VendorProductImportResource(Resource):
+    @jwt_required()
+    def post(self):
+        # Check if the user is a vendor
+        identity = get_jwt_identity()
+        if isinstance(identity, dict) and identity.get('type') == 'vendor':
+            vendor_id = identity.get('id')
+        else:
+            return {'message': 'Unauthorized. Only vendors can import products.'}, 403
+
+        # Either a multipart upload in the 'file' field or the raw request body
+        requested = request.args.get('format')
+        if 'file' in request.files:
+            file = request.files['file']
+            file_format = detect_format(requested, file.filename, file.mimetype)
+            stream = file.stream
+        else:
+            file_format = detect_format(requested, content_type=request.mimetype)
+            stream = request.stream
+        if file_format is None:
+            return {'message': 'Unsupported import format. Send CSV or NDJSON.'}, 400
+
+        job = create_import(vendor_id, stream, file_format)
+        return {
+            'message': 'Import queued',
+            'import_id': job.id,
+            'status': job.status,
+            'status_url': f'/vendor/products/import/{job.id}'
+        }, 202
+
+    @jwt_required()
+    def get(self, import_id=None):
+        # Check if the user is a vendor
+        identity = get_jwt_identity()
+        if isinstance(identity, dict) and identity.get('type') == 'vendor':
+            vendor_id = identity.get('id')
+        else:
+            return {'message': 'Unauthorized. Only vendors can view their imports.'}, 403
+
+        try:
+            limit, after = get_page_args()
+        except InvalidCursor as e:
+            return {'message': str(e)}, 400
+
+        if import_id is None:
+            imports, next_cursor = PRODUCT_IMPORT_PROJECTION.page(
+                PRODUCT_IMPORT_PROJECTION.select().where(ProductImport.vendor_id == vendor_id),
+                ProductImport.id, limit, after
+            )
+            return json_response(dumps({'imports': imports, 'next_cursor': next_cursor}))
+
+        job = PRODUCT_IMPORT_PROJECTION.first(
+            PRODUCT_IMPORT_PROJECTION.select().where(ProductImport.id == import_id,
+                                                     ProductImport.vendor_id == vendor_id)
+        )
+        if job is None:
+            return {'message': 'Import not found'}, 404
+
+        # Rejected rows page with the same cursor parameters as other lists
+        errors, next_cursor = IMPORT_ERROR_PROJECTION.page(
+            IMPORT_ERROR_PROJECTION.select().where(ProductImportError.import_id == import_id),
+            ProductImportError.id, limit, after
+        )
+        job['errors'] = errors
+        job['next_cursor'] = next_cursor
+        return json_response(dumps(job))
+
+class VendorAnalyticsResource(Resource):
+    @jwt_required()
+    def get(self):
+        # Check if the user is a vendor
+        identity = get_jwt_identity()
+        if isinstance(identity, dict) and identity.get('type') == 'vendor':
+            vendor_id = identity.get('id')
+        else:
+            return {'message': 'Unauthorized. Only vendors can view their sales.'}, 403
+
+        try:
+            start, end = analytics_range(request.args.get('start'), request.args.get('end'))
+        except ValueError as e:
+            return {'message': f'Invalid date range: {str(e)}'}, 400
+
+        # Read from the daily rollup, never from order history
+        return vendor_analytics(vendor_id, start, end), 200
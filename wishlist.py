@@ -0,0 +1,129 @@
+from sqlalchemy import select, delete, and_, or_
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Product, Wishlist
+from serialization import Projection, isoformat
+from image_variants import variant_cache
+
+# Wishlist items with the product details clients used to fetch one by one
+WISHLIST_PROJECTION = Projection(
+    [
+        ('id', Wishlist.id),
+        ('product_id', Wishlist.product_id),
+        ('added_date', Wishlist.added_date),
+        ('name', Product.name),
+        ('price', Product.price),
+        ('stock', Product.stock),
+        ('image_url', Product.image_url),
+    ],
+    converters={'added_date': isoformat},
+    derived=[('image_variants', 'image_url', variant_cache.variant_urls)]
+)
+
+
+def wishlist_page(user_id, limit, after):
+    """
+    One keyset page of a user's wishlist joined to its products.
+
+    Returns:
+        tuple: (list of dicts, next_cursor or None)
+    """
+    statement = (
+        WISHLIST_PROJECTION.select()
+        .select_from(Wishlist)
+        .join(Product, Product.id == Wishlist.product_id)
+        .where(Wishlist.user_id == user_id)
+    )
+    return WISHLIST_PROJECTION.page(statement, Wishlist.id, limit, after)
+
+
+def duplicate_check(user_id, product_ids):
+    """
+    Which of product_ids exist and which of them the user already has, in one
+    query: products outer-joined to the user's wishlist rows.
+    """
+    return (
+        select(Product.id, Wishlist.id)
+        .select_from(Product)
+        .outerjoin(Wishlist, and_(Wishlist.product_id == Product.id, Wishlist.user_id == user_id))
+        .where(Product.id.in_(product_ids))
+    )
+
+
+def add_products(user_id, product_ids):
+    """
+    Add several products to a user's wishlist.
+
+    Existence and duplicates are checked for the whole batch with one query
+    and the new rows are written with one insert. A concurrent add of the
+    same item is absorbed by the unique (user_id, product_id) index.
+
+    Args:
+        user_id (int): Wishlist owner
+        product_ids (list): Product ids to add; repeats are ignored
+
+    Returns:
+        dict: added, already_in_wishlist and not_found product id lists
+    """
+    product_ids = list(dict.fromkeys(product_ids))
+    found = {product_id: wishlist_id for product_id, wishlist_id in db.session.execute(
+        duplicate_check(user_id, product_ids)
+    )}
+    added = [product_id for product_id in product_ids if product_id in found and found[product_id] is None]
+    result = {
+        'added': added,
+        'already_in_wishlist': [product_id for product_id in product_ids if found.get(product_id) is not None],
+        'not_found': [product_id for product_id in product_ids if product_id not in found],
+    }
+    if not added:
+        return result
+
+    rows = [{'user_id': user_id, 'product_id': product_id} for product_id in added]
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        db.session.execute(insert(Wishlist).on_conflict_do_nothing(), rows)
+        db.session.commit()
+        return result
+
+    try:
+        db.session.execute(Wishlist.__table__.insert(), rows)
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request added one of the items after our check; add the rest one by one
+        db.session.rollback()
+        for row in rows:
+            try:
+                db.session.execute(Wishlist.__table__.insert(), row)
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+    return result
+
+
+def remove_items(user_id, wishlist_ids=(), product_ids=()):
+    """
+    Remove several items from a user's wishlist in one statement.
+
+    Items can be named by wishlist id, product id or both.
+
+    Returns:
+        list: Wishlist ids that were removed
+    """
+    conditions = []
+    if wishlist_ids:
+        conditions.append(Wishlist.id.in_(wishlist_ids))
+    if product_ids:
+        conditions.append(Wishlist.product_id.in_(product_ids))
+    if not conditions:
+        return []
+
+    matches = and_(Wishlist.user_id == user_id, or_(*conditions))
+    removed = list(db.session.execute(select(Wishlist.id).where(matches)).scalars())
+    if removed:
+        db.session.execute(
+            delete(Wishlist).where(Wishlist.id.in_(removed)).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+    return removed